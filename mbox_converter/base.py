@@ -1,17 +1,30 @@
+import contextlib
 import datetime
-import mailbox
+import functools
+import json
 import os
 import quopri
 import re
 from email.header import decode_header
 from email.utils import mktime_tz, parsedate_tz
+from typing import NamedTuple, Optional
 
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
-from email_reply_parser import EmailReplyParser
+from mbox_converter.chunking import TokenChunker, get_token_estimator
+from mbox_converter.quarantine import Failure, MessageTimeout, Quarantine, time_budget
+from mbox_converter.reply import get_reply_stripper, strip_reply_compat
+from mbox_converter.rollover import build_policy
+from mbox_converter.sources import MessageRef, parse_timestamp, sample_refs, source_for
+from mbox_converter.writers import CsvWriter, TxtWriter, get_writer
 
 NAME = "mbox_converter"
 
+# Number of records handed to the writer backend at once
+BATCH_SIZE = 64
+# E-mail addresses as extracted from the From and To headers
+ADDRESS_PATTERN = r"[a-zA-Z0-9_\-.]+@[a-zA-Z0-9_\-.]+\.[a-zA-Z]{2,5}"
+
+_env_loaded = False
+
 """
 generate a gui application
 
@@ -21,6 +34,14 @@ pyinstaller --onefile --windowed mbox_converter_gui.py
 """
 
 
+def day_start(value):
+    """Timestamp of the local midnight starting a ``YYYY-MM-DD`` string or :class:`datetime.date`."""
+    # YAML loads unquoted dates as datetime.date
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+    return datetime.datetime(value.year, value.month, value.day).timestamp()
+
+
 def parse_date(date_header, date_format):
     if date_header is None:
         return None
@@ -50,7 +71,19 @@ def decode_mime_header(value):
     return result
 
 
+def load_env():
+    """Load variables from a ``.env`` file, once per process."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv(verbose=True)
+        _env_loaded = True
+
+
 def clean_content(content_bytes):
+    from bs4 import BeautifulSoup
+
     content_bytes = quopri.decodestring(content_bytes)
     try:
         content_str = content_bytes.decode("utf-8")
@@ -63,22 +96,40 @@ def clean_content(content_bytes):
         return ""
 
 
-def extract_content(email):
+def extract_content(email, strip_reply=strip_reply_compat):
     for part in email.walk():
         if part.get_content_maintype() == "multipart":
             continue
         content = part.get_payload(decode=True)
         if content:
-            return EmailReplyParser.parse_reply(clean_content(content))
+            return strip_reply(clean_content(content))
     return ""
 
 
 def extract_emails(field):
-    matches = re.findall(r"\<?([a-zA-Z0-9_\-.]+@[a-zA-Z0-9_\-.]+\.[a-zA-Z]{2,5})\>?", str(field))
+    matches = re.findall(rf"\<?({ADDRESS_PATTERN})\>?", str(field))
     unique_emails = sorted(set(match.lower() for match in matches))
     return unique_emails
 
 
+class EmailRecord(NamedTuple):
+    """A converted message: header fields, cleaned content and its location in the mbox.
+
+    ``sent_from`` and ``to`` hold the sorted, comma separated addresses, ``date``
+    is formatted with the configured date format (``None`` if unknown) and
+    ``start``/``stop`` are the byte offsets of the raw message in the mbox.
+    """
+
+    sent_from: str
+    to: str
+    date: Optional[str]
+    subject: str
+    content: str
+    timestamp: int
+    start: Optional[int]
+    stop: Optional[int]
+
+
 class MboxConverter:
     def __init__(
         self,
@@ -89,115 +140,504 @@ class MboxConverter:
         include_to = getattr(config, "to")
         include_date = getattr(config, "date")
         include_subject = getattr(config, "subject")
+        include_content = getattr(config, "content")
         output_format = getattr(config, "format")
         max_days = getattr(config, "max_days")
+        max_bytes = getattr(config, "max_bytes")
+        max_messages = getattr(config, "max_messages")
+        period = getattr(config, "period")
+        chunk_tokens = getattr(config, "chunk_tokens")
+        token_estimator = getattr(config, "token_estimator")
+        reply_stripper = getattr(config, "reply_stripper")
         date_format = getattr(config, "date_format")
+        queue_size = getattr(config, "queue_size")
+        workers = getattr(config, "workers")
+        read_threads = getattr(config, "read_threads")
+        cache_file = getattr(config, "cache_file")
+        cache_max_mb = getattr(config, "cache_max_mb")
+        sinks = getattr(config, "sinks")
+        boilerplate = getattr(config, "boilerplate")
+        boilerplate_sketch_mb = getattr(config, "boilerplate_sketch_mb")
+        redact = getattr(config, "redact")
+        redact_terms = getattr(config, "redact_terms")
+        redact_patterns = getattr(config, "redact_patterns")
+        export = getattr(config, "export")
+        export_entry = getattr(config, "export_entry")
+        export_compression = getattr(config, "export_compression")
+        quarantine = getattr(config, "quarantine")
+        quarantine_dir = getattr(config, "quarantine_dir")
+        message_timeout = getattr(config, "message_timeout")
+        max_message_mb = getattr(config, "max_message_mb")
+        use_index = getattr(config, "index")
+        since = getattr(config, "since")
+        until = getattr(config, "until")
 
+        self.config = config
         self.mbox_file = mbox_file
+        self.source_class = source_for(mbox_file)
         self.include_options = {
             "from": include_from,
             "to": include_to,
             "date": include_date,
             "subject": include_subject,
+            "content": include_content,
         }
         self.output_format = output_format
+        self.writer_class = get_writer(output_format)
         self.max_days = max_days
-        load_dotenv(verbose=True)
-        self.date_format = date_format or os.getenv("DATE_FORMAT", "%Y-%m-%d")
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.period = period
+        self.chunk_tokens = chunk_tokens
+        self.token_estimator = token_estimator
+        self.reply_stripper = reply_stripper
+        self.strip_reply = get_reply_stripper(reply_stripper)
+        self.queue_size = queue_size
+        self.workers = workers
+        self.read_threads = read_threads
+        self.cache_file = cache_file
+        self.cache_max_mb = cache_max_mb
+        self.sinks = sinks or []
+        self.boilerplate = boilerplate
+        self.boilerplate_sketch_mb = boilerplate_sketch_mb
+        self.redact = redact
+        self.redact_terms = redact_terms
+        self.redact_patterns = redact_patterns
+        self.export = export
+        self.export_entry = export_entry
+        self.export_compression = export_compression
+        self.quarantine = quarantine
+        self.quarantine_dir = quarantine_dir
+        self.message_timeout = message_timeout
+        self.max_message_mb = max_message_mb
+        # Quarantine of the last run, once it is finished
+        self.quarantined = None
+        self.use_index = use_index
+        # Inclusive dates, turned into the timestamp range [since, until)
+        self.since = day_start(since) if since else None
+        self.until = day_start(until) + 86400 if until else None
+        if not date_format:
+            load_env()
+            date_format = os.getenv("DATE_FORMAT", "%Y-%m-%d")
+        self.date_format = date_format
+
+    def build_record(self, email, ref=None):
+        """Extract all header fields and the cleaned content of a parsed message."""
+        date_header = email.get("date")
+        if ref is None:
+            ref = MessageRef(parse_timestamp(date_header or ""), None, None)
+        return EmailRecord(
+            sent_from=", ".join(extract_emails(email.get("from", ""))),
+            to=", ".join(extract_emails(email.get("to", ""))),
+            date=parse_date(date_header, self.date_format),
+            subject=decode_mime_header(email.get("subject", "")),
+            content=extract_content(email, self.strip_reply),
+            timestamp=ref.timestamp,
+            start=ref.start,
+            stop=ref.stop,
+        )
+
+    def record_from_bytes(self, raw, ref=None):
+        """Parse the raw bytes of a message read from the input into an :class:`EmailRecord`."""
+        return self.build_record(self.source_class.parse(raw), ref)
+
+    def record_or_failure(self, raw, ref=None):
+        """Like :meth:`record_from_bytes`, but return a :class:`Failure` instead of raising.
+
+        Messages larger than ``max_message_mb`` are not parsed, and parsing is
+        stopped after ``message_timeout`` seconds. With ``quarantine``
+        disabled, errors are raised as before and no budget applies.
+        """
+        if not self.quarantine:
+            return self.record_from_bytes(raw, ref)
+        failure = self.check_size(raw, ref)
+        if failure is not None:
+            return failure
+        try:
+            with time_budget(self.message_timeout):
+                return self.record_from_bytes(raw, ref)
+        except MessageTimeout as e:
+            return Failure(ref, "timeout", str(e))
+        except Exception as e:
+            return Failure(ref, "error", f"{type(e).__name__}: {e}")
+
+    def check_size(self, raw, ref=None):
+        """:class:`Failure` if ``raw`` exceeds the size budget, else None."""
+        if self.quarantine and self.max_message_mb > 0:
+            if len(raw) > self.max_message_mb * 1024 * 1024:
+                return Failure(ref, "size", f"{len(raw)} bytes")
+        return None
+
+    def record_from_fields(self, fields, ref):
+        """Rebuild a record from the extracted fields stored in the cache."""
+        return EmailRecord(*fields, ref.timestamp, ref.start, ref.stop)
+
+    def open_source(self):
+        """Message source for the input: an mbox file, a Maildir or a directory of .eml files."""
+        return self.source_class(
+            self.mbox_file, read_threads=self.read_threads, use_index=self.use_index
+        )
+
+    def iter_records(self, quarantine_name=None):
+        """Yield an :class:`EmailRecord` for every message, sorted by date.
+
+        Messages are located by a quick scan of the mbox and then read and
+        parsed one at a time, so only a single message is held in memory.
+        With a ``cache_file``, messages are looked up in batches and only
+        those missing from the cache are parsed. Messages that fail to parse
+        are quarantined and left out: they are counted in :attr:`quarantined`
+        and, with a ``quarantine_name``, written to
+        ``<quarantine_name>_quarantine.mbox``. Without one, no files are written.
+        """
+        with (
+            self.open_source() as source,
+            self.open_cache() as cache,
+            self.open_quarantine(quarantine_name) as quarantine,
+        ):
+            refs = source.scan_sorted(self.since, self.until)
+            if cache is None:
+                for ref, raw in source.iter_raw(refs):
+                    record = self.record_or_failure(raw, ref)
+                    if isinstance(record, Failure):
+                        quarantine.add(raw, record)
+                        continue
+                    yield record
+                return
+            items = []
+            for item in source.iter_raw(refs):
+                items.append(item)
+                if len(items) >= BATCH_SIZE:
+                    yield from self.cached_records(items, cache, quarantine)
+                    items = []
+            yield from self.cached_records(items, cache, quarantine)
+
+    def open_cache(self):
+        """:class:`RecordCache` in ``cache_file``, or a context yielding None without one."""
+        if not self.cache_file:
+            return contextlib.nullcontext()
+        from mbox_converter.cache import RecordCache
+
+        variant = f"{self.date_format}\0{self.reply_stripper}"
+        return RecordCache(self.cache_file, self.cache_max_mb * 1024 * 1024, variant)
+
+    def cached_records(self, items, cache, quarantine):
+        """Turn ``(ref, raw)`` pairs into records, parsing only the messages missing in ``cache``.
+
+        Messages failing to parse go to ``quarantine`` and are not cached.
+        """
+        keys = [cache.key(raw) for _, raw in items]
+        found = cache.get_many(keys)
+        records = []
+        missing = []
+        for (ref, raw), key in zip(items, keys):
+            fields = found.get(key)
+            if fields is None:
+                record = self.record_or_failure(raw, ref)
+                if isinstance(record, Failure):
+                    quarantine.add(raw, record)
+                    continue
+                missing.append((key, record[:5]))
+            else:
+                record = self.record_from_fields(fields, ref)
+            records.append(record)
+        cache.put_many(missing)
+        return records
+
+    @property
+    def quarantine_name(self):
+        """Base name of the quarantine files of a conversion, in ``quarantine_dir`` if set."""
+        return os.path.join(self.quarantine_dir, self.output_name)
+
+    @contextlib.contextmanager
+    def open_quarantine(self, base_output_name=None):
+        """:class:`Quarantine` of this run, kept in :attr:`quarantined` once the run is over.
+
+        With ``redact``, raw messages are only kept in a ``quarantine_dir`` the
+        user has chosen, as they would end up unredacted next to the output.
+        """
+        keep_raw = self.redact == "none" or bool(self.quarantine_dir)
+        quarantine = Quarantine(base_output_name, keep_raw)
+        try:
+            yield quarantine
+        finally:
+            quarantine.close()
+            self.quarantined = quarantine
+
+    def report_quarantine(self):
+        summary = self.quarantined.summary() if self.quarantined is not None else None
+        if summary:
+            print(summary)
+
+    def aiter_records(self, queue_size=None, executor=None, quarantine_name=None):
+        """Asynchronous counterpart of :meth:`iter_records`.
+
+        Reading runs in a background task and parsing in ``executor`` (the
+        event loop's default executor if ``None``), connected by queues of at
+        most ``queue_size`` items.
+        """
+        from mbox_converter.pipeline import iter_records_async
+
+        return iter_records_async(self, queue_size or self.queue_size, executor, quarantine_name)
+
+    def create_writer(self):
+        """Instantiate the writer backend of the configured output format."""
+        return self.writer_class(self.include_options)
+
+    def create_rollover_policy(self):
+        """Combine the configured ``max_days``, size, count and period limits."""
+        return build_policy(
+            max_days=self.max_days,
+            max_bytes=self.max_bytes,
+            max_messages=self.max_messages,
+            period=self.period,
+            date_format=self.date_format,
+        )
+
+    def create_chunker(self):
+        """Token chunker for ``chunk_tokens``, or None if chunking is disabled."""
+        if self.chunk_tokens is None or self.chunk_tokens <= 0:
+            return None
+        return TokenChunker(self.chunk_tokens, get_token_estimator(self.token_estimator))
+
+    @property
+    def output_name(self):
+        """Base name of the output files, taken from the input file or directory."""
+        return os.path.splitext(os.path.basename(os.path.normpath(self.mbox_file)))[0]
+
+    def create_output(self):
+        """Output files of a run, fanned out to several sinks if ``sinks`` are configured.
+
+        With ``boilerplate`` set, the records are only written once all of them
+        have been counted, with the repeated paragraphs and lines removed. With
+        ``redact``, personal data is redacted before anything else, except
+        with ``sinks``: their filters need the original addresses and
+        subjects, so the run plan redacts the records once they are routed and
+        before they are set aside for boilerplate removal.
+        """
+        redactor = self.create_redactor()
+        if self.sinks:
+            from mbox_converter.sinks import RunPlan
+
+            return RunPlan.from_converter(self, redactor)
+        output = _OutputFiles(self)
+        if self.boilerplate > 0:
+            from mbox_converter.boilerplate import BoilerplateOutput
+
+            sketch_bytes = self.boilerplate_sketch_mb * 1024 * 1024
+            output = BoilerplateOutput(output, self.boilerplate, sketch_bytes)
+        if redactor is not None:
+            from mbox_converter.redaction import RedactingOutput
+
+            # Outermost, so no unredacted text is written, not even temporarily
+            output = RedactingOutput(output, redactor)
+        return output
+
+    def create_redactor(self):
+        """:class:`Redactor` for the ``redact`` options, or None if redaction is disabled."""
+        if self.redact == "none":
+            return None
+        from mbox_converter.redaction import Redactor
+
+        return Redactor.from_converter(self)
+
+    def preview_records(self, mode="first", count=5, seed=None):
+        """Records of the first, last or ``count`` random messages of the input.
+
+        The messages are found by seeking to their boundaries instead of
+        scanning the whole input; see :func:`sample_refs`. The records are
+        redacted if ``redact`` is set.
+        """
+        with self.open_source() as source:
+            refs = sample_refs(source, mode, count, seed, self.since, self.until)
+            records = [self.record_from_bytes(raw, ref) for ref, raw in source.iter_raw(refs)]
+        redactor = self.create_redactor()
+        if redactor is not None:
+            records = [redactor.redact_record(record) for record in records]
+        return records
+
+    def render_preview(self, records):
+        """Render records as the configured output format would, header included."""
+        writer = _renderer(self.writer_class, **self.include_options)
+        return writer.render_header() + writer.render_batch(records)
 
     def build_txt_output(self, email):
-        lines = []
-        if self.include_options["from"]:
-            lines.append("From: {}".format(", ".join(extract_emails(email.get("from", "")))))
-        if self.include_options["to"]:
-            lines.append("To: {}".format(", ".join(extract_emails(email.get("to", "")))))
-        if self.include_options["date"]:
-            date_str = parse_date(email.get("date"), self.date_format)
-            lines.append("Date: {}".format(date_str or "Unknown"))
-        if self.include_options["subject"]:
-            lines.append("Subject: {}".format(decode_mime_header(email.get("subject", ""))))
-        content = extract_content(email)
-        lines.append("\n" + content + "\n-----\n\n")
-        return "\n".join(lines)
+        return _renderer(TxtWriter, **self.include_options).render(self.build_record(email))
 
     def build_csv_output(self, email, email_date_str):
-        fields = []
-        if self.include_options["from"]:
-            fields.append('"{}"'.format(", ".join(extract_emails(email.get("from", "")))))
-        if self.include_options["to"]:
-            fields.append('"{}"'.format(", ".join(extract_emails(email.get("to", "")))))
-        if self.include_options["date"]:
-            fields.append('"{}"'.format(email_date_str or ""))
-        if self.include_options["subject"]:
-            fields.append(
-                '"{}"'.format(decode_mime_header(email.get("subject", "")).replace('"', '""'))
-            )
-        content = extract_content(email).replace('"', '""').replace("\n", " ").strip()
-        fields.append(f'"{content}"')
-        return fields
+        record = self.build_record(email)._replace(date=email_date_str)
+        return _renderer(CsvWriter, **self.include_options).fields(record)
 
     def convert(self):
-        base_output_name = os.path.splitext(os.path.basename(self.mbox_file))[0]
-        output_template = f"{base_output_name}_{{:03d}}.{self.output_format}"
+        if self.export != "none":
+            self.export_archive()
+            return
+        self.write_records(self.iter_records(self.quarantine_name))
 
-        emails = []
-        for msg in mailbox.mbox(self.mbox_file):
-            try:
-                timestamp = mktime_tz(parsedate_tz(msg.get("date", ""))) or 0
-            except Exception:
-                timestamp = 0
-            emails.append((timestamp, msg))
+    def export_archive(self):
+        """Write every message as an entry of its own into the configured ZIP or tar archive."""
+        from mbox_converter.export import export_messages
 
-        emails.sort(key=lambda tup: tup[0])
+        archive = export_messages(self)
+        print(f"Exported {archive.entries_written} messages into {archive.path}.")
+        self.report_quarantine()
 
-        last_date = None
-        file_index = 1
-        row_written = 0
-        f = None
+    def write_records(self, records):
+        """Write records sorted by date to the output files, rolling over as configured."""
+        output = self.create_output()
+        try:
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) >= BATCH_SIZE:
+                    output.write_batch(batch)
+                    batch = []
+            output.write_batch(batch)
+            output.finish()
+        finally:
+            output.close()
+        output.report()
+        self.report_quarantine()
 
-        for timestamp, email in emails:
-            email_date_str = parse_date(email.get("date"), self.date_format)
-            if email_date_str:
-                email_date = datetime.datetime.strptime(email_date_str, self.date_format)
-            else:
-                email_date = datetime.datetime.min
-
-            if last_date is None or (email_date - last_date).days > self.max_days:
-                if f:
-                    f.close()
-                filename = output_template.format(file_index)
-                f = open(
-                    filename,
-                    "w",
-                    encoding="utf-8",
-                    newline="" if self.output_format == "csv" else None,
-                )
-                print(f"Writing new file: {filename}")
-                file_index += 1
-                last_date = email_date
-
-                if self.output_format == "csv":
-                    header = []
-                    if self.include_options["from"]:
-                        header.append("From")
-                    if self.include_options["to"]:
-                        header.append("To")
-                    if self.include_options["date"]:
-                        header.append("Date")
-                    if self.include_options["subject"]:
-                        header.append("Subject")
-                    header.append("Content")
-                    f.write(",".join(header) + "\n")
-
-            if self.output_format == "txt":
-                output = self.build_txt_output(email)
-                f.write(output)
-            elif self.output_format == "csv":
-                fields = self.build_csv_output(email, email_date_str)
-                f.write(",".join(fields) + "\n")
-
-            row_written += 1
-
-        if f:
-            f.close()
-        print(f"Generated output for {row_written} messages into {file_index - 1} file(s).")
+    async def convert_async(self, queue_size=None, executor=None):
+        """Convert the mbox with overlapping read, parse and write stages.
+
+        Produces the same output as :meth:`convert`. Raw messages are read in
+        a reader task, parsed and rendered in ``executor`` and written in order
+        by a writer task. The stages are connected by queues holding at most
+        ``queue_size`` items, so a slow stage throttles the ones feeding it.
+
+        Without an ``executor``, a process pool with ``workers`` processes is
+        used, or the event loop's default thread pool if ``workers`` is 0.
+        """
+        if self.export != "none":
+            # Entries are small and written in order, so the export runs on its own
+            self.export_archive()
+            return
+        from mbox_converter.pipeline import run_pipeline
+
+        queue_size = queue_size or self.queue_size
+        if executor is not None or self.workers <= 0:
+            await run_pipeline(self, queue_size, executor)
+            return
+        from mbox_converter.pipeline import ConverterPool
+
+        with ConverterPool(self, self.workers) as pool:
+            await run_pipeline(self, queue_size, pool)
+
+
+@functools.lru_cache(maxsize=None)
+def _renderer(writer_class, **include_options):
+    # Writers compile their renderer on creation, so reuse them for single messages
+    return writer_class(include_options)
+
+
+class _OutputFiles:
+    """Feed batches of records to a writer backend, rolling over as the policy demands."""
+
+    def __init__(self, converter, base_output_name=None):
+        self.base_output_name = base_output_name or converter.output_name
+        self.writer = converter.create_writer()
+        self.policy = converter.create_rollover_policy()
+        self.chunker = converter.create_chunker()
+        self.manifest = None
+        self.chunks_written = 0
+        self.label = None
+        self.file_index = 1
+        self.files_written = 0
+        self.records_written = 0
+        self.row_written = 0
+
+    @property
+    def bytes_written(self):
+        return self.writer.bytes_written
+
+    def write_batch(self, records):
+        if self.chunker is not None:
+            for record in records:
+                for chunk in self.chunker.add(record):
+                    self._write_chunk(chunk)
+            return
+
+        # Records are handed to the writer in runs that end up in the same file
+        first = 0
+        for i, record in enumerate(records):
+            if self.policy.needs_bytes and i > first:
+                self.writer.write_batch(records[first:i])
+                first = i
+            if self.files_written == 0 or self.policy.should_rollover(record, self):
+                if i > first:
+                    self.writer.write_batch(records[first:i])
+                    first = i
+                self._open_next_file(record)
+            self.records_written += 1
+
+        if len(records) > first:
+            self.writer.write_batch(records[first:])
+        self.row_written += len(records)
+
+    def finish(self):
+        """Write everything still buffered after the last batch."""
+        if self.chunker is not None:
+            for chunk in self.chunker.flush():
+                self._write_chunk(chunk)
+
+    def _write_chunk(self, chunk):
+        # A chunk is never split across files, so rollover is only checked before it
+        first = chunk.records[0]
+        if self.files_written == 0 or self.policy.should_rollover(first, self):
+            self._open_next_file(first)
+        offset = self.writer.bytes_written
+        self.writer.write_batch(chunk.records)
+        self.records_written += len(chunk.records)
+        self.row_written += len(chunk.records)
+
+        if self.manifest is None:
+            self.manifest = open(f"{self.base_output_name}_chunks.jsonl", "w", encoding="utf-8")
+        entry = {
+            "chunk": self.chunks_written + 1,
+            "file": self.writer.path,
+            "offset": offset,
+            "length": self.writer.bytes_written - offset,
+            "tokens": chunk.tokens,
+            "messages": len(chunk.records),
+            "threads": chunk.threads,
+            # Unix timestamps, 0 for undated messages
+            "first_timestamp": min(record.timestamp for record in chunk.records),
+            "last_timestamp": max(record.timestamp for record in chunk.records),
+            "sources": [[record.start, record.stop] for record in chunk.records],
+        }
+        self.manifest.write(json.dumps(entry) + "\n")
+        self.chunks_written += 1
+
+    def _open_next_file(self, record):
+        label = self.policy.label(record)
+        if label != self.label:
+            self.label = label
+            self.file_index = 1
+        prefix = f"{self.base_output_name}_{label}" if label else self.base_output_name
+        filename = f"{prefix}_{self.file_index:03d}.{self.writer.extension}"
+        if self.files_written == 0:
+            self.writer.open(filename)
+        else:
+            self.writer.rollover(filename)
+        print(f"Writing new file: {filename}")
+        self.policy.start(record)
+        self.file_index += 1
+        self.files_written += 1
+        self.records_written = 0
+
+    def close(self):
+        self.writer.close()
+        if self.manifest is not None:
+            self.manifest.close()
+            self.manifest = None
+
+    def report(self):
+        print(
+            f"Generated output for {self.row_written} messages into {self.files_written} file(s)."
+        )
+        if self.chunker is not None:
+            print(
+                f"Packed messages into {self.chunks_written} chunk(s) "
+                f"of up to {self.chunker.max_tokens} tokens."
+            )
@@ -0,0 +1,224 @@
+"""Suppression of text repeated across many messages, such as disclaimers and list footers.
+
+Boilerplate is found in two passes over the records of a run:
+
+1. Every paragraph and line of a message's content is normalized (case and
+   whitespace) and counted once per message in a
+   :class:`CountMinSketch` of fixed size, however large the archive.
+2. Paragraphs and then lines counted in at least ``min_count`` messages are
+   removed from the content before it is written.
+
+Records are held in a temporary file between the passes, so every message is
+parsed only once and memory use does not grow with the archive.
+"""
+
+import array
+import hashlib
+import json
+import re
+import struct
+import tempfile
+from typing import List, Optional, Set
+
+from mbox_converter.base import BATCH_SIZE, EmailRecord
+
+# Shorter lines and paragraphs ("Thanks,", "Hi Bob,") are never removed
+MIN_CHARS = 20
+# Counters per row of the count-min sketch
+MAX_WIDTH = 1 << 28
+# Buffer size of the temporary file holding the records between the passes
+SPILL_BUFFER_SIZE = 1 << 20
+
+_WORDS = struct.Struct("<4I").unpack
+_PARAGRAPH_BREAK = re.compile(r"(\n\s*\n)")
+
+
+def normalize(text) -> str:
+    """Key of a line or paragraph: lower case with single spaces."""
+    return " ".join(text.lower().split())
+
+
+def _keys(paragraph):
+    # Normalized lines, and the paragraph's key built from them instead of normalizing it again
+    line_keys = [" ".join(line.lower().split()) for line in paragraph.split("\n")]
+    return " ".join(filter(None, line_keys)), line_keys
+
+
+class CountMinSketch:
+    """Approximate counts of byte string keys in ``size`` bytes of counters.
+
+    Counts are never underestimated; the overestimate is bounded by the number
+    of keys added divided by the width of a row. Counters are only raised as
+    far as needed (conservative update), which keeps the overestimate of rare
+    keys small. The four rows take their slots from 32 bit words of a single
+    hash. Keys are added and looked up in batches, as this runs for every line
+    of every message.
+    """
+
+    def __init__(self, size):
+        width = 1
+        while width < MAX_WIDTH and width * 32 <= size:
+            width *= 2
+        self.width = width
+        self.counters = array.array("I", bytes(16 * width))
+
+    def add_all(self, keys) -> List[int]:
+        """Count each of ``keys`` once more and return their new counts."""
+        counters = self.counters
+        width = self.width
+        mask = width - 1
+        blake2b = hashlib.blake2b
+        result = []
+        for key in keys:
+            a, b, c, d = _WORDS(blake2b(key, digest_size=16).digest())
+            a &= mask
+            b = width + (b & mask)
+            c = 2 * width + (c & mask)
+            d = 3 * width + (d & mask)
+            count = min(counters[a], counters[b], counters[c], counters[d]) + 1
+            if counters[a] < count:
+                counters[a] = count
+            if counters[b] < count:
+                counters[b] = count
+            if counters[c] < count:
+                counters[c] = count
+            if counters[d] < count:
+                counters[d] = count
+            result.append(count)
+        return result
+
+    def counts(self, keys) -> List[int]:
+        counters = self.counters
+        width = self.width
+        mask = width - 1
+        blake2b = hashlib.blake2b
+        result = []
+        for key in keys:
+            a, b, c, d = _WORDS(blake2b(key, digest_size=16).digest())
+            result.append(
+                min(
+                    counters[a & mask],
+                    counters[width + (b & mask)],
+                    counters[2 * width + (c & mask)],
+                    counters[3 * width + (d & mask)],
+                )
+            )
+        return result
+
+    def count(self, key) -> int:
+        return self.counts([key])[0]
+
+
+class BoilerplateFilter:
+    """Count the paragraphs and lines of message contents, then remove the frequent ones.
+
+    A paragraph or line becomes :attr:`frequent` as soon as its count reaches
+    ``min_count``, so removing it later only takes a set lookup. This holds
+    every key counted in ``min_count`` messages, as its count only grows.
+    """
+
+    def __init__(self, min_count, sketch_bytes):
+        self.min_count = min_count
+        self.sketch = CountMinSketch(sketch_bytes)
+        self.frequent: Set[str] = set()
+        self.bytes_removed = 0
+        self.paragraphs_removed = 0
+        self.lines_removed = 0
+        self.messages_changed = 0
+
+    def add(self, content):
+        """Count every distinct paragraph and line of a message's content once."""
+        keys = set()
+        for paragraph in _PARAGRAPH_BREAK.split(content)[::2]:
+            key, line_keys = _keys(paragraph)
+            if len(key) >= MIN_CHARS:
+                keys.add(key)
+                keys.update(line_key for line_key in line_keys if len(line_key) >= MIN_CHARS)
+        # Frequent keys stay frequent, so they need no further counting
+        keys = list(keys - self.frequent)
+        counts = self.sketch.add_all([key.encode("utf-8") for key in keys])
+        min_count = self.min_count
+        self.frequent.update(key for key, count in zip(keys, counts) if count >= min_count)
+
+    def strip(self, content) -> str:
+        """``content`` without the paragraphs and lines counted in ``min_count`` messages."""
+        parts = _PARAGRAPH_BREAK.split(content)
+        keys = [_keys(paragraph) for paragraph in parts[::2]]
+        frequent = self.frequent
+        if frequent.isdisjoint(key for key, _ in keys) and frequent.isdisjoint(
+            line_key for _, line_keys in keys for line_key in line_keys
+        ):
+            return content
+        kept = []
+        for i, (key, line_keys) in zip(range(0, len(parts), 2), keys):
+            paragraph = parts[i]
+            if key in frequent:
+                self.paragraphs_removed += 1
+                continue
+            lines = paragraph.split("\n")
+            remaining = [
+                line for line, line_key in zip(lines, line_keys) if line_key not in frequent
+            ]
+            if len(remaining) < len(lines):
+                self.lines_removed += len(lines) - len(remaining)
+                if not remaining:
+                    continue
+                paragraph = "\n".join(remaining)
+            kept.append(paragraph + (parts[i + 1] if i + 1 < len(parts) else ""))
+        stripped = "".join(kept).strip()
+        self.bytes_removed += len(content.encode("utf-8")) - len(stripped.encode("utf-8"))
+        self.messages_changed += 1
+        return stripped
+
+    def summary(self) -> Optional[str]:
+        """One line with the amount of boilerplate removed, None if nothing was removed."""
+        if not self.messages_changed:
+            return None
+        return (
+            f"Removed {self.bytes_removed} bytes of boilerplate from {self.messages_changed} "
+            f"message(s): {self.paragraphs_removed} paragraph(s), {self.lines_removed} line(s)."
+        )
+
+
+class BoilerplateOutput:
+    """Output files of a run that only receive the records once all messages were counted.
+
+    Wraps the output of :meth:`MboxConverter.create_output` with the same
+    interface. Records are counted and set aside in a temporary file in the
+    output directory; :meth:`finish` writes them to the wrapped output with
+    the boilerplate removed.
+    """
+
+    def __init__(self, output, min_count, sketch_bytes):
+        self.output = output
+        self.filter = BoilerplateFilter(min_count, sketch_bytes)
+        self._spill = tempfile.TemporaryFile(
+            "w+", encoding="utf-8", buffering=SPILL_BUFFER_SIZE, dir="."
+        )
+
+    def write_batch(self, records):
+        for record in records:
+            self.filter.add(record.content)
+            self._spill.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def finish(self):
+        self._spill.seek(0)
+        batch = []
+        for line in self._spill:
+            record = EmailRecord(*json.loads(line))
+            batch.append(record._replace(content=self.filter.strip(record.content)))
+            if len(batch) >= BATCH_SIZE:
+                self.output.write_batch(batch)
+                batch = []
+        self.output.write_batch(batch)
+        self.output.finish()
+
+    def close(self):
+        self._spill.close()
+        self.output.close()
+
+    def report(self):
+        self.output.report()
+        summary = self.filter.summary()
+        if summary:
+            print(summary)
@@ -0,0 +1,148 @@
+"""Persistent cache of extracted message fields.
+
+Extracting the content of a message (MIME walking, HTML cleaning and reply
+stripping) is the most expensive part of a conversion. The cache maps a hash
+of the raw message to its extracted header fields and content, so re-running
+the same archive with other fields, formats or rollover limits only has to
+read and hash the messages.
+
+Entries are stored in an SQLite file. The least recently used entries are
+evicted once the file exceeds its size limit, and all entries are dropped when
+:data:`CACHE_VERSION` changes.
+"""
+
+import hashlib
+import sqlite3
+import threading
+
+# Bump whenever a change to the extraction alters the cached fields
+CACHE_VERSION = 1
+
+# Fraction of the size limit the cache is shrunk to when evicting
+_EVICT_TO = 0.9
+# Estimated bytes stored per entry besides its fields
+_ENTRY_OVERHEAD = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value);
+CREATE TABLE IF NOT EXISTS records (
+    key BLOB PRIMARY KEY,
+    sent_from TEXT,
+    recipients TEXT,
+    date TEXT,
+    subject TEXT,
+    content TEXT,
+    size INTEGER,
+    used INTEGER
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS records_used ON records (used);
+"""
+
+
+class RecordCache:
+    """SQLite backed mapping from raw messages to their extracted fields.
+
+    ``variant`` names the options the fields depend on, e.g. the date format
+    and reply stripper; it is part of every key, so runs with different
+    options don't share entries. Lookups and stores may come from different
+    threads, but not at the same time as :meth:`close`.
+    """
+
+    def __init__(self, path, max_bytes, variant=""):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.variant = variant
+        self._salt = hashlib.blake2b(variant.encode("utf-8"), digest_size=32).digest()
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._lock = threading.Lock()
+        self._touched: list = []
+        self._run = 0
+        self._total_bytes = 0
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(_SCHEMA)
+        meta = dict(db.execute("SELECT name, value FROM meta"))
+        if meta.get("version") != CACHE_VERSION:
+            db.execute("DELETE FROM records")
+            meta = {"version": CACHE_VERSION}
+        self._run = meta.get("run", 0) + 1
+        self._total_bytes = meta.get("bytes", 0)
+        self._db = db
+        self._save_meta()
+        db.commit()
+
+    def close(self):
+        if self._db is None:
+            return
+        with self._lock:
+            self._db.executemany(
+                "UPDATE records SET used = ? WHERE key = ?",
+                ((self._run, key) for key in self._touched),
+            )
+            self._touched = []
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._save_meta()
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def key(self, raw) -> bytes:
+        return hashlib.blake2b(raw, digest_size=16, key=self._salt).digest()
+
+    def get_many(self, keys):
+        """Return a dict mapping the cached ``keys`` to their field tuples."""
+        if not keys:
+            return {}
+        query = (
+            "SELECT key, sent_from, recipients, date, subject, content FROM records "
+            f"WHERE key IN ({','.join('?' * len(keys))})"
+        )
+        with self._lock:
+            found = {row[0]: row[1:] for row in self._db.execute(query, keys)}
+            self._touched.extend(found)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Store ``(key, fields)`` pairs, ``fields`` being the extracted field tuple."""
+        rows = []
+        for key, fields in items:
+            size = sum(len(field) for field in fields if field) + _ENTRY_OVERHEAD
+            rows.append((key, *fields, size, self._run))
+        with self._lock:
+            # Estimated, replaced duplicates are counted twice until the next eviction
+            self._total_bytes += sum(row[-2] for row in rows)
+            self._db.executemany(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def _evict(self):
+        target = self.max_bytes * _EVICT_TO
+        self._total_bytes = int(self._db.execute("SELECT TOTAL(size) FROM records").fetchone()[0])
+        evicted = []
+        for key, size in self._db.execute("SELECT key, size FROM records ORDER BY used"):
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._db.executemany("DELETE FROM records WHERE key = ?", evicted)
+
+    def _save_meta(self):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+            [("version", CACHE_VERSION), ("run", self._run), ("bytes", self._total_bytes)],
+        )
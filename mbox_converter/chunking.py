@@ -0,0 +1,163 @@
+"""Pack messages into chunks of a target token budget for LLM ingestion.
+
+Token counts are estimated with cheap string operations instead of a real
+tokenizer; estimators are registered by name with
+:func:`register_token_estimator` or installed through the
+``mbox_converter.token_estimators`` entry point group. Chunking happens in a
+single streaming pass: messages are grouped by thread in a bounded look-ahead
+window, and whole threads are packed into chunks whenever the window is full.
+"""
+
+import re
+from typing import Callable, Dict, List, NamedTuple
+
+ENTRY_POINT_GROUP = "mbox_converter.token_estimators"
+
+# Number of chunk budgets buffered before the oldest threads are packed
+LOOKAHEAD = 4
+
+_TOKEN_ESTIMATORS: Dict[str, Callable[[str], int]] = {}
+_REPLY_PREFIX = re.compile(r"^\s*(?:(?:re|fwd?|aw|wg|sv|antw|tr|rv)(?:\[\d+\])?\s*:\s*)+", re.I)
+
+
+def register_token_estimator(name):
+    """Decorator registering a function that estimates the token count of a string."""
+
+    def decorator(func):
+        _TOKEN_ESTIMATORS[name] = func
+        return func
+
+    return decorator
+
+
+def _entry_points():
+    from importlib.metadata import entry_points
+
+    return entry_points(group=ENTRY_POINT_GROUP)
+
+
+def get_token_estimator(name) -> Callable[[str], int]:
+    if name not in _TOKEN_ESTIMATORS:
+        for entry_point in _entry_points():
+            if entry_point.name == name:
+                register_token_estimator(name)(entry_point.load())
+    try:
+        return _TOKEN_ESTIMATORS[name]
+    except KeyError:
+        raise ValueError(f"Unknown token estimator: {name}") from None
+
+
+def available_token_estimators(discover=True) -> List[str]:
+    names = list(_TOKEN_ESTIMATORS)
+    if discover:
+        names.extend(ep.name for ep in _entry_points() if ep.name not in names)
+    return names
+
+
+@register_token_estimator("chars")
+def estimate_chars(text):
+    """About four characters per token, typical for English text and BPE tokenizers."""
+    return (len(text) + 3) // 4
+
+
+@register_token_estimator("words")
+def estimate_words(text):
+    """About three tokens per four words, counted by whitespace."""
+    return (text.count(" ") + text.count("\n") + 1) * 4 // 3
+
+
+def thread_key(subject):
+    """Group messages by subject, ignoring reply and forward prefixes such as ``Re:`` or ``AW:``."""
+    return _REPLY_PREFIX.sub("", subject).strip().lower()
+
+
+class Chunk(NamedTuple):
+    records: list
+    tokens: int
+    threads: int
+
+
+class TokenChunker:
+    """Streaming packer turning date-sorted records into chunks of at most ``max_tokens``.
+
+    :meth:`add` buffers records per thread and returns the chunks that are
+    complete; :meth:`flush` returns the rest at the end of the input. Threads
+    are only split if a single thread exceeds the budget, or if it continues
+    after its first messages have already been packed.
+    """
+
+    def __init__(self, max_tokens, estimator=estimate_chars, lookahead=LOOKAHEAD):
+        self.max_tokens = max_tokens
+        self.estimator = estimator
+        self.window = max_tokens * lookahead
+        self.threads: Dict[object, list] = {}
+        self.thread_tokens: Dict[object, int] = {}
+        self.pending_tokens = 0
+        self._untitled = 0
+
+    def measure(self, record):
+        estimate = self.estimator
+        return (
+            estimate(record.content)
+            + estimate(record.subject)
+            + estimate(record.sent_from)
+            + estimate(record.to)
+        )
+
+    def add(self, record) -> List[Chunk]:
+        key: object = thread_key(record.subject)
+        if not key:
+            # Messages without a subject can't be matched to a thread
+            self._untitled += 1
+            key = self._untitled
+        tokens = self.measure(record)
+        self.threads.setdefault(key, []).append((record, tokens))
+        self.thread_tokens[key] = self.thread_tokens.get(key, 0) + tokens
+        self.pending_tokens += tokens
+
+        chunks = []
+        while self.pending_tokens > self.window:
+            chunks.append(self._pop_chunk())
+        return chunks
+
+    def flush(self) -> List[Chunk]:
+        chunks = []
+        while self.threads:
+            chunks.append(self._pop_chunk())
+        return chunks
+
+    def _pop_chunk(self):
+        oldest = next(iter(self.threads))
+        if self.thread_tokens[oldest] > self.max_tokens:
+            return self._split_thread(oldest)
+
+        records: list = []
+        tokens = 0
+        threads = 0
+        for key in list(self.threads):
+            size = self.thread_tokens[key]
+            if tokens + size > self.max_tokens:
+                continue
+            records.extend(record for record, _ in self.threads.pop(key))
+            del self.thread_tokens[key]
+            tokens += size
+            threads += 1
+        self.pending_tokens -= tokens
+        return Chunk(records, tokens, threads)
+
+    def _split_thread(self, key):
+        thread = self.threads[key]
+        count = 0
+        tokens = 0
+        while count < len(thread) and (count == 0 or tokens + thread[count][1] <= self.max_tokens):
+            tokens += thread[count][1]
+            count += 1
+        records = [record for record, _ in thread[:count]]
+        del thread[:count]
+        if thread:
+            self.thread_tokens[key] -= tokens
+        else:
+            del self.threads[key]
+            del self.thread_tokens[key]
+        self.pending_tokens -= tokens
+        return Chunk(records, tokens, 1)
@@ -5,25 +5,31 @@ Do not modify manually - regenerate using MboxConverterConfig.generate_cli_modul
 """
 
 import argparse
+import sys
 from pathlib import Path
 
 from mbox_converter.base import MboxConverter
 from mbox_converter.config import ConfigParameterManager
-from mbox_converter.parameters import PARAMETERS
+from mbox_converter.parameters import PARAMETERS, LazyChoices
+from mbox_converter.sources import SAMPLE_MODES
 
 
-def parse_arguments():
-    """Parse command line arguments with config file support."""
+def str_to_bool(value):
+    """Convert a command line value such as ``False`` or ``yes`` into a bool."""
+    if isinstance(value, bool):
+        return value
+    if value.lower() in ("true", "yes", "1"):
+        return True
+    if value.lower() in ("false", "no", "0"):
+        return False
+    raise argparse.ArgumentTypeError(f"Boolean value expected, got: {value}")
+
+
+def build_parser(**kwargs):
+    """Argument parser with the config file option and an option for every CLI parameter."""
     parser = argparse.ArgumentParser(
-        description="Parse mbox file and export to text or CSV.",
         formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
-Examples:
-  %(prog)s mailbox.mbox
-  %(prog)s --config config.yaml mailbox.mbox
-  %(prog)s --format csv --max-days 30 mailbox.mbox
-  %(prog)s --from False --subject False mailbox.mbox
-        """,
+        **kwargs,
     )
 
     # Config file argument
@@ -35,6 +41,8 @@ Examples:
 
     # Generate arguments from config parameters
     for param in PARAMETERS:
+        if not param.is_cli:
+            continue
         if param.name == "mbox_file":
             # Positional argument
             parser.add_argument("mbox_file", help=param.help)
@@ -48,37 +56,290 @@ Examples:
             if param.name.endswith("_"):
                 kwargs["dest"] = param.name
 
-            if param.choices:
+            if param.choices is not None:
                 kwargs["choices"] = param.choices
+                if isinstance(param.choices, LazyChoices):
+                    # argparse would list all choices in the usage, discovering plugins
+                    kwargs["metavar"] = param.choices.metavar
 
             if param.type_ == int:
                 kwargs["type"] = int
 
             if param.type_ == bool:
-                kwargs["type"] = bool
+                kwargs["type"] = str_to_bool
+
+            parser.add_argument(param.cli_arg, **kwargs)
+
+    return parser
+
+
+def parse_arguments(argv=None):
+    """Parse command line arguments with config file support."""
+    parser = build_parser(
+        description="Parse mbox file and export to text or CSV.",
+        epilog="""
+Examples:
+  %(prog)s mailbox.mbox
+  %(prog)s ~/Maildir
+  %(prog)s --config config.yaml mailbox.mbox
+  %(prog)s --format csv --max-days 30 mailbox.mbox
+  %(prog)s --from False --subject False mailbox.mbox
+  %(prog)s stats --max_days 30 mailbox.mbox
+  %(prog)s preview --sample random --count 3 --format csv mailbox.mbox
+  %(prog)s shard plan --shards 8 --shard_dir shards mailbox.mbox
+  %(prog)s shard work shards/manifest.json
+  %(prog)s shard merge shards/manifest.json
+  %(prog)s serve --workers 4 --socket /tmp/mbox_converter.sock
+        """,
+    )
+    return parser.parse_args(argv)
+
+
+def parse_stats_arguments(argv=None):
+    """Parse the arguments of the ``stats`` subcommand."""
+    parser = build_parser(
+        prog="mbox_converter stats",
+        description="Report messages per day and month, top senders, message sizes and "
+        "the number of files the rollover options would produce, without converting.",
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of top senders and busiest days (default: 10)"
+    )
+    return parser.parse_args(argv)
+
+
+def parse_preview_arguments(argv=None):
+    """Parse the arguments of the ``preview`` subcommand."""
+    parser = build_parser(
+        prog="mbox_converter preview",
+        description="Print a few messages as the conversion would render them.",
+    )
+    parser.add_argument(
+        "--sample",
+        default="first",
+        choices=SAMPLE_MODES,
+        help="Which messages to render (default: first)",
+    )
+    parser.add_argument(
+        "--count", type=int, default=5, help="Number of messages to render (default: 5)"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=None, help="Seed of the random sample (default: None)"
+    )
+    return parser.parse_args(argv)
 
-    parser.add_argument(param.cli_arg, **kwargs)
 
-    return parser.parse_args()
+SHARD_COMMANDS = ["plan", "work", "merge"]
 
 
-def main():
+def parse_shard_arguments(argv):
+    """Parse the arguments of the ``shard plan``, ``shard work`` and ``shard merge`` subcommands."""
+    command = argv[0] if argv else None
+    if command == "plan":
+        parser = build_parser(
+            prog="mbox_converter shard plan",
+            description="Split an mbox into shards and write a manifest with the conversion "
+            "options, for workers sharing the shard directory.",
+        )
+        parser.add_argument("--shards", type=int, default=8, help="Number of shards (default: 8)")
+        parser.add_argument(
+            "--shard_dir",
+            default="shards",
+            help="Directory of the manifest and the converted shards (default: shards)",
+        )
+    else:
+        parser = argparse.ArgumentParser(
+            prog="mbox_converter shard",
+            description="Plan shards of an mbox (plan), convert them (work) or merge them into "
+            "the output files (merge).",
+        )
+        parser.add_argument("command", choices=SHARD_COMMANDS)
+        parser.add_argument("manifest", help="Path to the manifest.json written by 'shard plan'")
+        if command == "work":
+            parser.add_argument(
+                "--shard",
+                type=int,
+                default=None,
+                help="Convert only this shard (default: claim pending shards until none is left)",
+            )
+            parser.add_argument(
+                "--claim_timeout",
+                type=float,
+                default=600,
+                help="Take over claims of other workers that made no progress for this many "
+                "seconds; claims of dead workers on this host are taken over at once "
+                "(default: 600)",
+            )
+        return parser.parse_args(argv)
+    args = parser.parse_args(argv[1:])
+    args.command = command
+    return args
+
+
+def parse_serve_arguments(argv=None):
+    """Parse the arguments of the ``serve`` subcommand."""
+    parser = argparse.ArgumentParser(
+        prog="mbox_converter serve",
+        description="Run a local service converting jobs submitted over HTTP with a pool of "
+        "warm worker processes.",
+    )
+    parser.add_argument(
+        "--socket",
+        default="mbox_converter.sock",
+        help="Unix socket to listen on, accessible only by the current user "
+        "(default: mbox_converter.sock)",
+    )
+    parser.add_argument(
+        "--host",
+        default=None,
+        help="Listen on this address instead of the socket; jobs are not authenticated, so only "
+        "loopback addresses are allowed without --allow_remote (default with --port: 127.0.0.1)",
+    )
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=None,
+        help="Listen on this TCP port instead of the socket (default with --host: 8642)",
+    )
+    parser.add_argument(
+        "--allow_remote",
+        action="store_true",
+        help="Allow a --host other than a loopback address, letting anyone who can reach it "
+        "read and write files as the current user",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Worker processes running jobs at the same time (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--max_queue",
+        type=int,
+        default=100,
+        help="Jobs waiting for a worker before new jobs are rejected (default: 100)",
+    )
+    return parser.parse_args(argv)
+
+
+def load_config(args):
+    """Load the config file and override it with the explicitly given CLI arguments."""
+    # Load from config file if provided
+    config = ConfigParameterManager(config_file=args.config if args.config else None)
+
+    # Override with CLI arguments (only if they differ from defaults)
+    for param in PARAMETERS:
+        if hasattr(args, param.name):
+            arg_value = getattr(args, param.name)
+            # Only override if the CLI argument was explicitly provided
+            # (i.e., differs from the parameter's default)
+            if arg_value != param.default:
+                setattr(config, param.name, arg_value)
+    return config
+
+
+def stats_main(argv):
+    """Entry point of ``mbox_converter stats``."""
+    args = parse_stats_arguments(argv)
+    try:
+        config = load_config(args)
+        if not Path(config.mbox_file).exists():
+            print(f"Error: mbox file not found: {config.mbox_file}")
+            return 1
+        from mbox_converter.stats import build_report
+
+        print(build_report(MboxConverter(config), top=args.top))
+        return 0
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+
+
+def preview_main(argv):
+    """Entry point of ``mbox_converter preview``."""
+    args = parse_preview_arguments(argv)
+    try:
+        config = load_config(args)
+        if not Path(config.mbox_file).exists():
+            print(f"Error: mbox file not found: {config.mbox_file}")
+            return 1
+        converter = MboxConverter(config)
+        records = converter.preview_records(args.sample, args.count, args.seed)
+        print(converter.render_preview(records), end="")
+        return 0
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+
+
+def shard_main(argv):
+    """Entry point of ``mbox_converter shard``."""
+    args = parse_shard_arguments(argv)
+    try:
+        from mbox_converter.shards import ShardManifest, merge_runs, run_worker
+
+        if args.command == "plan":
+            config = load_config(args)
+            if not Path(config.mbox_file).exists():
+                print(f"Error: mbox file not found: {config.mbox_file}")
+                return 1
+            manifest = ShardManifest.create(MboxConverter(config), args.shard_dir, args.shards)
+            print(f"Planned {len(manifest.shards)} shard(s) in {manifest.path}")
+        elif args.command == "work":
+            manifest = ShardManifest.load(args.manifest)
+            converted = run_worker(manifest, args.shard, args.claim_timeout)
+            print(f"Converted shard(s): {', '.join(map(str, converted)) or 'none'}")
+        else:
+            merge_runs(ShardManifest.load(args.manifest))
+        return 0
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+
+
+def serve_main(argv):
+    """Entry point of ``mbox_converter serve``."""
+    args = parse_serve_arguments(argv)
+    try:
+        from mbox_converter.service import (
+            DEFAULT_HOST,
+            DEFAULT_PORT,
+            ConversionService,
+            check_host,
+            serve,
+        )
+
+        tcp = args.host is not None or args.port is not None
+        host = args.host or DEFAULT_HOST
+        port = DEFAULT_PORT if args.port is None else args.port
+        if tcp:
+            # Before the workers are started
+            check_host(host, args.allow_remote)
+        with ConversionService(args.workers, args.max_queue) as service:
+            serve(service, host, port, None if tcp else args.socket, args.allow_remote)
+        return 0
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+
+
+def main(argv=None):
     """Main entry point for the CLI application."""
-    args = parse_arguments()
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv[:1] == ["stats"]:
+        return stats_main(argv[1:])
+    if argv[:1] == ["preview"]:
+        return preview_main(argv[1:])
+    if argv[:1] == ["shard"]:
+        return shard_main(argv[1:])
+    if argv[:1] == ["serve"]:
+        return serve_main(argv[1:])
+    args = parse_arguments(argv)
 
     # Create config object
     try:
-        # Load from config file if provided
-        config = ConfigParameterManager(config_file=args.config if args.config else None)
-
-        # Override with CLI arguments (only if they differ from defaults)
-        for param in PARAMETERS:
-            if hasattr(args, param.name):
-                arg_value = getattr(args, param.name)
-                # Only override if the CLI argument was explicitly provided
-                # (i.e., differs from the parameter's default)
-                if arg_value != param.default:
-                    setattr(config, param.name, arg_value)
+        config = load_config(args)
 
         # Validate required parameters
         if False and not config.mbox_file:
@@ -92,7 +353,12 @@ def main():
 
         # Create and run MboxConverter
         converter = MboxConverter(config)
-        converter.convert()
+        if config.pipeline == "async":
+            import asyncio
+
+            asyncio.run(converter.convert_async())
+        else:
+            converter.convert()
 
         return 0
 
@@ -105,6 +371,4 @@ def main():
 
 
 if __name__ == "__main__":
-    import sys
-
     sys.exit(main())
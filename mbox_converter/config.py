@@ -1,11 +1,27 @@
+import copy
 import json
 from pathlib import Path
-from typing import Any, Dict, Optional
-
-import yaml  # type: ignore
+from typing import Any, Dict, Optional, Tuple
 
 from mbox_converter.parameters import PARAMETERS
 
+# Parsed configuration files by (path, mtime, size), so each file is read once per process
+_CONFIG_CACHE: Dict[Tuple[str, int, int], Dict[str, Any]] = {}
+
+
+def _read_config_file(config_path: Path) -> Dict[str, Any]:
+    stat = config_path.stat()
+    key = (str(config_path.resolve()), stat.st_mtime_ns, stat.st_size)
+    if key not in _CONFIG_CACHE:
+        with open(config_path, "r", encoding="utf-8") as f:
+            if config_path.suffix.lower() in [".yml", ".yaml"]:
+                import yaml  # type: ignore
+
+                _CONFIG_CACHE[key] = yaml.safe_load(f) or {}
+            else:
+                _CONFIG_CACHE[key] = json.load(f)
+    return copy.deepcopy(_CONFIG_CACHE[key])
+
 
 class ConfigParameterManager:
     def __init__(self, config_file: Optional[str] = None, **kwargs):
@@ -20,7 +36,6 @@ class ConfigParameterManager:
             setattr(self, param.name, param.default)
 
         # Load from file if provided
-        print(f"### {config_file}")
         if config_file:
             self.load_from_file(config_file)
 
@@ -35,12 +50,7 @@ class ConfigParameterManager:
         if not config_path.exists():
             raise FileNotFoundError(f"Configuration file not found: {config_file}")
 
-        with open(config_path, "r", encoding="utf-8") as f:
-            if config_path.suffix.lower() in [".yml", ".yaml"]:
-                config_data = yaml.safe_load(f)
-            else:
-                config_data = json.load(f)
-            print(config_data)
+        config_data = _read_config_file(config_path)
 
         for key, value in config_data.items():
             if hasattr(self, key):
@@ -65,6 +75,8 @@ class ConfigParameterManager:
 
         with open(config_path, "w", encoding="utf-8") as f:
             if format_ == "yaml":
+                import yaml  # type: ignore
+
                 yaml.dump(config_data, f, default_flow_style=False, indent=2)
             else:
                 json.dump(config_data, f, indent=2)
@@ -106,26 +118,25 @@ class ConfigParameterManager:
         from textwrap import dedent
 
         rows = []
-        required_params = []
         optional_params = []
 
         for param in PARAMETERS:
             if not param.is_cli:
                 continue
-            cli_arg = f"`--{param.name}`" if param.name != "mbox_file" else "`path/to/file.mbox`"
+            cli_arg = f"`{param.cli_arg}`" if param.name != "mbox_file" else "`path/to/file.mbox`"
             typ = param.type_.__name__
             desc = param.help
-            default = (
-                "*required*"
-                if getattr(param, "required", False) or param.default in (None, "")
-                else repr(param.default)
-            )
+            if getattr(param, "required", False):
+                default = "*required*"
+            elif param.default in (None, ""):
+                # An empty string leaves the option unset, e.g. no date range or cache file
+                default = "*not set*"
+            else:
+                default = repr(param.default)
             choices = str(param.choices) if param.choices else "-"
 
             rows.append((cli_arg, typ, desc, default, choices))
-            if default == "*required*":
-                required_params.append(param)
-            else:
+            if default not in ("*required*", "*not set*"):
                 optional_params.append(param)
 
         # Dynamisch Spaltenbreite bestimmen
@@ -149,7 +160,8 @@ class ConfigParameterManager:
 
         # Beispielbefehle erzeugen
         examples = []
-        required_arg = required_params[0].name if required_params else "example.mbox"
+        # The mbox file is the positional argument, named as in the examples' assumption
+        required_arg = "example.mbox"
         examples.append(
             dedent(
                 f"""
@@ -165,7 +177,7 @@ class ConfigParameterManager:
         for i in range(1, min(5, len(optional_params) + 1)):
             selected = optional_params[:i]
             cli_part = " ".join(
-                f"--{p.name} {p.choices[0] if p.choices else p.default}" for p in selected
+                f"{p.cli_arg} {p.choices[0] if p.choices else p.default}" for p in selected
             )
             examples.append(
                 dedent(
@@ -0,0 +1,265 @@
+"""Export of every message as a document of its own into a ZIP or tar archive.
+
+Instead of concatenated ``_NNN`` output files, ``--export zip`` writes one
+entry per message, either the rendered text (``txt``) or the raw message
+(``eml``), into ``<output>.zip``. Entries are named after the date and sender
+of the message, e.g. ``2024-01/20240104T120000Z_alice@example.com.txt``, so
+the same input always gives the same names.
+
+Entries are streamed into a single archive file written through a buffer of
+:data:`~mbox_converter.writers.WRITE_BUFFER_SIZE` bytes, so an entry costs
+neither a file of its own nor a directory update, and small entries are
+written to disk in large blocks.
+"""
+
+import re
+import struct
+import time
+
+from mbox_converter.writers import WRITE_BUFFER_SIZE, TxtWriter
+
+EXPORT_FORMATS = ["none", "zip", "tar"]
+ENTRY_FORMATS = ["txt", "eml"]
+COMPRESSIONS = ["deflated", "stored", "bzip2", "lzma"]
+
+# Names and dates of undated messages
+UNDATED = "undated"
+_ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+_UNSAFE = re.compile(r"[^A-Za-z0-9@._+-]+")
+_MAX_SENDER = 64
+_TXT_SEPARATOR = "-----\n\n"
+
+TAR_BLOCK_SIZE = 512
+TAR_RECORD_SIZE = 20 * TAR_BLOCK_SIZE
+_USTAR_HEADER = struct.Struct("100s8s8s8s12s12s8sc100s6s2s32s32s8s8s155s12x")
+
+
+def entry_stem(timestamp, sender) -> str:
+    """Entry name without suffix and extension for a message sent by ``sender`` at ``timestamp``.
+
+    Dates are in UTC, so names don't depend on the time zone of the export.
+    """
+    sender = _UNSAFE.sub("_", sender)[:_MAX_SENDER].strip("._") or "unknown"
+    if not timestamp:
+        return f"{UNDATED}/{UNDATED}_{sender}"
+    return time.strftime("%Y-%m/%Y%m%dT%H%M%SZ_", time.gmtime(timestamp)) + sender
+
+
+class EntryNamer:
+    """Unique entry names for messages arriving sorted by timestamp.
+
+    Messages with the same name get a counter, ``_2``, ``_3`` ..., in the
+    order they arrive. Names can only repeat within the same second, so only
+    the names of the current timestamp are remembered.
+    """
+
+    def __init__(self):
+        self._timestamp = None
+        self._seen = {}
+
+    def name(self, timestamp, sender, extension) -> str:
+        if timestamp != self._timestamp:
+            self._timestamp = timestamp
+            self._seen = {}
+        stem = entry_stem(timestamp, sender)
+        count = self._seen.get(stem, 0) + 1
+        self._seen[stem] = count
+        suffix = f"_{count}" if count > 1 else ""
+        return f"{stem}{suffix}.{extension}"
+
+
+class _StreamFile:
+    """Buffered output file that hides ``tell`` and ``seek``.
+
+    :class:`zipfile.ZipFile` then writes each entry in one go, followed by a
+    data descriptor, instead of seeking back to patch its header, which would
+    flush the buffer for every entry.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, "wb", buffering=WRITE_BUFFER_SIZE)
+
+    def write(self, data):
+        return self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ZipExport:
+    """ZIP archive compressing every entry on its own with ``compression``."""
+
+    def __init__(self, base_output_name, compression="deflated"):
+        # zipfile is slow to import, so only load it for an export
+        import zipfile
+
+        self.path = f"{base_output_name}.zip"
+        self.compression = {
+            "stored": zipfile.ZIP_STORED,
+            "deflated": zipfile.ZIP_DEFLATED,
+            "bzip2": zipfile.ZIP_BZIP2,
+            "lzma": zipfile.ZIP_LZMA,
+        }[compression]
+        self.entries_written = 0
+        self._file = _StreamFile(self.path)
+        self._zip = zipfile.ZipFile(self._file, "w", self.compression, allowZip64=True)
+        self._zipfile = zipfile
+
+    def add(self, name, data, timestamp):
+        if timestamp:
+            date_time = time.gmtime(max(timestamp, 315532800))[:6]
+        else:
+            date_time = _ZIP_EPOCH
+        info = self._zipfile.ZipInfo(name, date_time)
+        info.compress_type = self.compression
+        info.external_attr = 0o644 << 16
+        self._zip.writestr(info, data)
+        self.entries_written += 1
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._file.close()
+            self._zip = None
+
+
+class TarExport:
+    """Tar archive in ustar format.
+
+    Tar has no per-entry compression, so ``compression`` applies to the whole
+    stream (``.tar.gz``, ``.tar.bz2`` or ``.tar.xz``). Entry headers are
+    packed here; :mod:`tarfile` spends several times longer on each header
+    than on writing a small message.
+    """
+
+    _COMPRESSION = {"stored": "", "deflated": "gz", "bzip2": "bz2", "lzma": "xz"}
+
+    def __init__(self, base_output_name, compression="deflated"):
+        suffix = self._COMPRESSION[compression]
+        self.path = f"{base_output_name}.tar" + (f".{suffix}" if suffix else "")
+        self.entries_written = 0
+        self._bytes_written = 0
+        self._file = open(self.path, "wb", buffering=WRITE_BUFFER_SIZE)
+        self._stream = _compressed(self._file, suffix)
+
+    def add(self, name, data, timestamp):
+        padding = -len(data) % TAR_BLOCK_SIZE
+        self._stream.write(_ustar_header(name, len(data), timestamp))
+        self._stream.write(data)
+        self._stream.write(bytes(padding))
+        self._bytes_written += TAR_BLOCK_SIZE + len(data) + padding
+        self.entries_written += 1
+
+    def close(self):
+        if self._stream is None:
+            return
+        # Two empty blocks end the archive, which is padded to whole records
+        end = self._bytes_written + 2 * TAR_BLOCK_SIZE
+        self._stream.write(bytes(2 * TAR_BLOCK_SIZE - end % -TAR_RECORD_SIZE))
+        if self._stream is not self._file:
+            self._stream.close()
+        self._file.close()
+        self._stream = None
+
+
+EXPORTS = {"zip": ZipExport, "tar": TarExport}
+
+
+def open_export(export_format, base_output_name, compression="deflated"):
+    """Archive of the format ``export_format`` named after ``base_output_name``."""
+    try:
+        export_class = EXPORTS[export_format]
+    except KeyError:
+        raise ValueError(f"Unknown export format: {export_format}") from None
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    return export_class(base_output_name, compression)
+
+
+def _ustar_header(name, size, mtime):
+    prefix, _, name = name.encode("utf-8").rpartition(b"/")
+    header = _USTAR_HEADER.pack(
+        name,
+        b"0000644\0",
+        b"0000000\0",
+        b"0000000\0",
+        b"%011o\0" % size,
+        b"%011o\0" % max(mtime or 0, 0),
+        b" " * 8,
+        b"0",
+        b"",
+        b"ustar\0",
+        b"00",
+        b"",
+        b"",
+        b"",
+        b"",
+        prefix,
+    )
+    return header[:148] + b"%06o\0 " % sum(header) + header[156:]
+
+
+def _compressed(file, suffix):
+    # Compressors are slow to import, so only load the one needed
+    if suffix == "gz":
+        import gzip
+
+        # Without a date in the gzip header, so the same messages give the same archive
+        return gzip.GzipFile(filename="", mode="wb", fileobj=file, mtime=0)
+    if suffix == "bz2":
+        import bz2
+
+        return bz2.BZ2File(file, "wb")
+    if suffix == "xz":
+        import lzma
+
+        return lzma.LZMAFile(file, "wb")
+    return file
+
+
+def eml_bytes(raw) -> bytes:
+    """Raw message without the ``From`` line separating it from others in an mbox."""
+    if raw.startswith(b"From "):
+        return raw.partition(b"\n")[2]
+    return raw
+
+
+def export_messages(converter):
+    """Write every message of the converter's input as an entry of its own; return the archive.
+
+    ``txt`` entries hold the fields and content the txt format renders for
+    the message, redacted if configured. ``eml`` entries hold the raw message;
+    they are neither parsed, quarantined nor redacted, so the export is
+    limited by reading speed.
+    """
+    from mbox_converter.base import _renderer
+    from mbox_converter.index import from_header, sender_address
+
+    redactor = converter.create_redactor()
+    if redactor is not None and converter.export_entry == "eml":
+        raise ValueError("Raw eml entries can't be redacted, use txt entries")
+    namer = EntryNamer()
+    archive = open_export(converter.export, converter.output_name, converter.export_compression)
+    try:
+        if converter.export_entry == "eml":
+            with converter.open_source() as source:
+                refs = source.scan_sorted(converter.since, converter.until)
+                for ref, raw in source.iter_raw(refs):
+                    sender = sender_address(from_header(raw))
+                    name = namer.name(ref.timestamp, sender, "eml")
+                    archive.add(name, eml_bytes(raw), ref.timestamp)
+        else:
+            render = _renderer(TxtWriter, **converter.include_options).render
+            for record in converter.iter_records(converter.quarantine_name):
+                if redactor is not None:
+                    # Before naming the entry, so names don't reveal the sender either
+                    record = redactor.redact_record(record)
+                name = namer.name(record.timestamp, record.sent_from.partition(",")[0], "txt")
+                text = render(record).removesuffix(_TXT_SEPARATOR)
+                archive.add(name, text.encode("utf-8"), record.timestamp)
+    finally:
+        archive.close()
+    return archive
@@ -1,8 +1,16 @@
 import os
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import filedialog, messagebox
 
 from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.sources import SAMPLE_MODES
+from mbox_converter.writers import available_formats
+
+# Wait for further option changes before refreshing the preview
+PREVIEW_DELAY_MS = 150
+PREVIEW_POLL_MS = 50
 
 
 class MboxConverterGui:
@@ -16,9 +24,31 @@ class MboxConverterGui:
         self.include_to = tk.BooleanVar(value=True)
         self.include_date = tk.BooleanVar(value=True)
         self.include_subject = tk.BooleanVar(value=True)
+        self.include_content = tk.BooleanVar(value=True)
         self.max_days = tk.StringVar(value="")
+        self.preview_sample = tk.StringVar(value="first")
+        self.preview_count = tk.StringVar(value="5")
+
+        # Sampled messages are parsed once and re-rendered when output options change
+        self._preview_key = None
+        self._preview_records = None
+        self._preview_loading = None
+        self._preview_job = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
 
         self._build_widgets()
+        for var in (
+            self.mbox_path,
+            self.format,
+            self.include_from,
+            self.include_to,
+            self.include_date,
+            self.include_subject,
+            self.include_content,
+            self.preview_sample,
+            self.preview_count,
+        ):
+            var.trace_add("write", lambda *_: self.schedule_preview())
 
     def _build_widgets(self):
         frame = tk.Frame(self.root, padx=10, pady=10)
@@ -31,7 +61,7 @@ class MboxConverterGui:
 
         # Format dropdown
         tk.Label(frame, text="Output Format:").grid(row=1, column=0, sticky="w")
-        tk.OptionMenu(frame, self.format, "txt", "csv").grid(row=1, column=1, sticky="w")
+        tk.OptionMenu(frame, self.format, *available_formats()).grid(row=1, column=1, sticky="w")
 
         # Checkboxes
         tk.Checkbutton(frame, text="Include From", variable=self.include_from).grid(
@@ -46,6 +76,9 @@ class MboxConverterGui:
         tk.Checkbutton(frame, text="Include Subject", variable=self.include_subject).grid(
             row=5, column=0, sticky="w"
         )
+        tk.Checkbutton(frame, text="Include Content", variable=self.include_content).grid(
+            row=5, column=1, sticky="w"
+        )
 
         # Max Days
         tk.Label(frame, text="Max Days per File:").grid(row=6, column=0, sticky="w")
@@ -61,14 +94,97 @@ class MboxConverterGui:
             fg="white",
         ).grid(row=9, column=1, columnspan=1, pady=10)
 
+        # Preview of a few messages, rendered with the current options
+        tk.Label(frame, text="Preview:").grid(row=10, column=0, sticky="w")
+        options = tk.Frame(frame)
+        options.grid(row=10, column=1, sticky="w")
+        tk.OptionMenu(options, self.preview_sample, *SAMPLE_MODES).pack(side="left")
+        tk.Spinbox(options, from_=1, to=100, textvariable=self.preview_count, width=5).pack(
+            side="left"
+        )
+        tk.Label(options, text="messages").pack(side="left")
+
+        self.preview = tk.Text(frame, width=80, height=20, wrap="none", state="disabled")
+        self.preview.grid(row=11, column=0, columnspan=3, sticky="nsew")
+        scrollbar = tk.Scrollbar(frame, command=self.preview.yview)
+        scrollbar.grid(row=11, column=3, sticky="ns")
+        self.preview.configure(yscrollcommand=scrollbar.set)
+
     def select_file(self):
         file_path = filedialog.askopenfilename(filetypes=[("MBOX files", "*.mbox")])
         if file_path:
             self.mbox_path.set(file_path)
 
+    def build_config(self, max_days=-1):
+        return ConfigParameterManager(
+            mbox_file=self.mbox_path.get(),
+            format=self.format.get(),
+            sent_from=self.include_from.get(),
+            to=self.include_to.get(),
+            date=self.include_date.get(),
+            subject=self.include_subject.get(),
+            content=self.include_content.get(),
+            max_days=max_days,
+        )
+
+    def schedule_preview(self):
+        """Refresh the preview once the options have not changed for a moment."""
+        if self._preview_job is not None:
+            self.root.after_cancel(self._preview_job)
+        self._preview_job = self.root.after(PREVIEW_DELAY_MS, self.update_preview)
+
+    def update_preview(self):
+        self._preview_job = None
+        path = self.mbox_path.get()
+        if not os.path.exists(path):
+            self._show_preview("")
+            return
+        try:
+            count = int(self.preview_count.get())
+        except ValueError:
+            return
+        key = (path, self.preview_sample.get(), count)
+        if key == self._preview_key and self._preview_records is not None:
+            self._render_preview()
+            return
+        # Reading and parsing the sample runs in the background, rendering in the UI thread
+        self._preview_key = key
+        self._preview_records = None
+        converter = MboxConverter(self.build_config())
+        self._preview_loading = (key, self._executor.submit(converter.preview_records, *key[1:]))
+        self._show_preview("Loading preview...")
+        self.root.after(PREVIEW_POLL_MS, self._poll_preview)
+
+    def _poll_preview(self):
+        key, future = self._preview_loading
+        if key != self._preview_key:
+            return
+        if not future.done():
+            self.root.after(PREVIEW_POLL_MS, self._poll_preview)
+            return
+        try:
+            self._preview_records = future.result()
+        except Exception as e:
+            self._show_preview(f"Error: {e}")
+            return
+        self._render_preview()
+
+    def _render_preview(self):
+        try:
+            converter = MboxConverter(self.build_config())
+            self._show_preview(converter.render_preview(self._preview_records))
+        except Exception as e:
+            self._show_preview(f"Error: {e}")
+
+    def _show_preview(self, text):
+        self.preview.configure(state="normal")
+        self.preview.delete("1.0", "end")
+        self.preview.insert("1.0", text)
+        self.preview.configure(state="disabled")
+
     def run_parser(self):
         path = self.mbox_path.get()
-        if not os.path.isfile(path):
+        if not os.path.exists(path):
             messagebox.showerror("Error", "Please select a valid .mbox file.")
             return
 
@@ -78,15 +194,7 @@ class MboxConverterGui:
             messagebox.showerror("Error", "Max Days must be a number.")
             return
 
-        parser = MboxConverter(
-            mbox_file=path,
-            output_format=self.format.get(),
-            include_from=self.include_from.get(),
-            include_to=self.include_to.get(),
-            include_date=self.include_date.get(),
-            include_subject=self.include_subject.get(),
-            max_days=max_days,
-        )
+        parser = MboxConverter(self.build_config(max_days))
 
         try:
             parser.convert()
@@ -95,7 +203,11 @@ class MboxConverterGui:
             messagebox.showerror("Error", str(e))
 
 
-if __name__ == "__main__":
+def run_gui():
     root = tk.Tk()
-    gui = MboxConverterGui(root)
+    MboxConverterGui(root)
     root.mainloop()
+
+
+if __name__ == "__main__":
+    run_gui()
@@ -0,0 +1,223 @@
+"""Binary sidecar index of an mbox file, stored as ``<mbox>.mbxidx``.
+
+The index holds one entry per message, sorted by date: its byte offset and
+length in the mbox, its timestamp and hashes of its sender address and
+Message-ID. Entries are stored column by column as little-endian 64-bit
+integers after a fixed header::
+
+    magic "MBXIDX", version, mbox size, mbox mtime (ns),
+    CRC32 of the first and last 64 KiB of the mbox, number of entries
+    offsets[n], lengths[n], timestamps[n], sender hashes[n], Message-ID hashes[n]
+
+An index is only used if size, mtime and both checksums still match the mbox;
+otherwise the mbox is scanned again and the index rewritten. As the entries
+are sorted by timestamp, date ranges are found by binary search.
+"""
+
+import array
+import hashlib
+import os
+import re
+import struct
+import sys
+import zlib
+from bisect import bisect_left, bisect_right
+from typing import List, Optional
+
+from mbox_converter.base import ADDRESS_PATTERN
+from mbox_converter.sources import (
+    _DATE_HEADER,
+    _FROM_LINE,
+    _HEADER_END,
+    MessageRef,
+    _message_stop,
+    parse_timestamp,
+)
+
+INDEX_SUFFIX = ".mbxidx"
+MAGIC = b"MBXIDX"
+VERSION = 1
+# Bytes at the start and end of the mbox covered by the checksums
+CHECK_SIZE = 65536
+
+_HEADER = struct.Struct("<6sHQqIIQ")
+_COLUMNS = [
+    ("starts", "q"),
+    ("lengths", "q"),
+    ("timestamps", "q"),
+    ("senders", "Q"),
+    ("message_ids", "Q"),
+]
+_FROM_HEADER = re.compile(
+    rb"^From:[ \t]*([^\r\n]*(?:\r?\n[ \t][^\r\n]*)*)", re.MULTILINE | re.IGNORECASE
+)
+_MESSAGE_ID_HEADER = re.compile(rb"^Message-ID:[ \t]*([^\r\n]*)", re.MULTILINE | re.IGNORECASE)
+_ADDRESS = re.compile(ADDRESS_PATTERN)
+
+
+def index_path(mbox_file):
+    return mbox_file + INDEX_SUFFIX
+
+
+def sender_address(from_header) -> str:
+    """First address in a From header in lower case, or the whole header without one."""
+    match = _ADDRESS.search(from_header)
+    return (match.group() if match else from_header.strip()).lower()
+
+
+def sender_hash(from_header) -> int:
+    """Hash of the first address in a From header, ignoring case; 0 if the header is empty."""
+    return _hash(sender_address(from_header))
+
+
+def from_header(raw) -> str:
+    """Value of the From header of a raw message, empty if it has none."""
+    header_end = _HEADER_END.search(raw)
+    match = _FROM_HEADER.search(raw, 0, header_end.start() + 1 if header_end else len(raw))
+    return match.group(1).decode("ascii", errors="replace") if match else ""
+
+
+def message_id_hash(message_id) -> int:
+    """Hash of a Message-ID header value; 0 if it is empty."""
+    return _hash(message_id.strip())
+
+
+def _hash(text):
+    if not text:
+        return 0
+    digest = hashlib.blake2b(text.encode("utf-8", errors="replace"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def fingerprint(data, stat):
+    """Size, mtime and head/tail checksums identifying the state of an mbox."""
+    head = zlib.crc32(data[:CHECK_SIZE])
+    tail = zlib.crc32(data[max(0, len(data) - CHECK_SIZE) :])
+    return stat.st_size, stat.st_mtime_ns, head, tail
+
+
+class MessageIndex:
+    """Columns of message offsets, lengths, timestamps and hashes, sorted by timestamp."""
+
+    def __init__(self, starts, lengths, timestamps, senders, message_ids):
+        self.starts = starts
+        self.lengths = lengths
+        self.timestamps = timestamps
+        self.senders = senders
+        self.message_ids = message_ids
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def build(cls, data):
+        """Scan the mbox contents ``data`` for message boundaries and headers."""
+        starts = [match.start() for match in _FROM_LINE.finditer(data)]
+        ends = starts[1:] + [len(data)]
+        entries = []
+        for start, end in zip(starts, ends):
+            stop = _message_stop(data, start, end)
+            header_end = _HEADER_END.search(data, start, stop)
+            header_stop = header_end.start() + 1 if header_end else stop
+            entries.append(
+                (
+                    _header_value(_DATE_HEADER, data, start, header_stop, parse_timestamp, 0),
+                    start,
+                    stop - start,
+                    _header_value(_FROM_HEADER, data, start, header_stop, sender_hash, 0),
+                    _header_value(_MESSAGE_ID_HEADER, data, start, header_stop, message_id_hash, 0),
+                )
+            )
+        # Stable, so messages with the same date keep their mbox order
+        entries.sort(key=lambda entry: entry[0])
+        timestamps, starts, lengths, senders, message_ids = zip(*entries) if entries else [()] * 5
+        return cls(
+            array.array("q", starts),
+            array.array("q", lengths),
+            array.array("q", timestamps),
+            array.array("Q", senders),
+            array.array("Q", message_ids),
+        )
+
+    def refs(self, since=None, until=None) -> List[MessageRef]:
+        """References to the messages with ``since <= timestamp < until``, sorted by date.
+
+        Undated messages are left out if ``until`` is given.
+        """
+        timestamps = self.timestamps
+        lo = 0 if since is None else bisect_left(timestamps, since)
+        hi = len(timestamps)
+        if until is not None:
+            hi = bisect_left(timestamps, until)
+            lo = max(lo, bisect_right(timestamps, 0))
+        starts = self.starts
+        lengths = self.lengths
+        return [MessageRef(timestamps[i], starts[i], starts[i] + lengths[i]) for i in range(lo, hi)]
+
+    def save(self, path, mbox_fingerprint):
+        """Write the index atomically, so readers never see a partially written file."""
+        size, mtime_ns, head, tail = mbox_fingerprint
+        header = _HEADER.pack(MAGIC, VERSION, size, mtime_ns, head, tail, len(self))
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(header)
+                for name, _ in _COLUMNS:
+                    column = getattr(self, name)
+                    if sys.byteorder == "big":
+                        column = array.array(column.typecode, column)
+                        column.byteswap()
+                    column.tofile(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path, mbox_fingerprint) -> Optional["MessageIndex"]:
+        """Read the index at ``path``, or None if it is missing, damaged or stale."""
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            magic, version, size, mtime_ns, head, tail, count = _HEADER.unpack_from(data)
+        except (OSError, struct.error):
+            return None
+        if magic != MAGIC or version != VERSION or len(data) != _HEADER.size + count * 8 * 5:
+            return None
+        if (size, mtime_ns, head, tail) != tuple(mbox_fingerprint):
+            return None
+        columns = []
+        offset = _HEADER.size
+        for _, typecode in _COLUMNS:
+            column = array.array(typecode)
+            column.frombytes(data[offset : offset + count * 8])
+            if sys.byteorder == "big":
+                column.byteswap()
+            columns.append(column)
+            offset += count * 8
+        return cls(*columns)
+
+
+def load_or_build(mbox_file, data, stat) -> MessageIndex:
+    """Index of the mbox ``mbox_file`` with contents ``data``, rebuilt and saved if stale.
+
+    A sidecar that can't be written, e.g. in a read-only directory, is skipped.
+    """
+    path = index_path(mbox_file)
+    current = fingerprint(data, stat)
+    index = MessageIndex.load(path, current)
+    if index is None:
+        index = MessageIndex.build(data)
+        try:
+            index.save(path, current)
+        except OSError:
+            pass
+    return index
+
+
+def _header_value(pattern, data, start, stop, convert, default):
+    match = pattern.search(data, start, stop)
+    if match is None:
+        return default
+    return convert(match.group(1).decode("ascii", errors="replace"))
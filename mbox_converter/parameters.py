@@ -4,8 +4,54 @@ This module provides a single source of truth for all configuration parameters.
 It can generate config files, CLI modules, and documentation from the parameter definitions.
 """
 
+from collections.abc import Sequence
 from dataclasses import dataclass
-from typing import Any, List, Optional
+from typing import Any, Callable, List, Optional
+
+from mbox_converter.chunking import available_token_estimators
+from mbox_converter.export import COMPRESSIONS, ENTRY_FORMATS, EXPORT_FORMATS
+from mbox_converter.redaction import REDACT_MODES
+from mbox_converter.reply import available_reply_strippers
+from mbox_converter.rollover import PERIODS
+from mbox_converter.writers import available_formats
+
+
+class LazyChoices(Sequence):
+    """Choices that include installed plugins, discovered only when first needed.
+
+    Membership of the ``known`` names is answered without discovery, so the
+    CLI only scans installed packages for plugins if a different value is given
+    or the full list is shown.
+    """
+
+    def __init__(self, known: List[str], discover: Callable[[], List[str]]):
+        self._known = known
+        self._discover = discover
+        self._choices: Optional[List[str]] = None
+
+    def _resolve(self) -> List[str]:
+        if self._choices is None:
+            self._choices = self._discover()
+        return self._choices
+
+    @property
+    def metavar(self):
+        return "{" + ",".join(self._known) + ",...}"
+
+    def __contains__(self, value):
+        return value in self._known or value in self._resolve()
+
+    def __getitem__(self, index):
+        return self._resolve()[index]
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(self._resolve())
 
 
 @dataclass
@@ -15,7 +61,7 @@ class ConfigParameter:
     name: str
     default: Any
     type_: type
-    choices: Optional[List[str | bool]] = None
+    choices: Optional[Sequence] = None
     help: str = ""
     cli_arg: Optional[str] = None
     required: bool = False
@@ -60,12 +106,19 @@ PARAMETERS = [
         choices=[True, False],
         help="Include 'Subject' field",
     ),
+    ConfigParameter(
+        name="content",
+        default=True,
+        type_=bool,
+        choices=[True, False],
+        help="Include message content",
+    ),
     ConfigParameter(
         name="format",
         default="txt",
         type_=str,
-        choices=["txt", "csv"],
-        help="Output format: txt or csv",
+        choices=LazyChoices(available_formats(discover=False), available_formats),
+        help="Output format: txt, csv or an installed writer plugin",
     ),
     ConfigParameter(
         name="max_days",
@@ -73,11 +126,73 @@ PARAMETERS = [
         type_=int,
         help="Max number of days per output file (-1 for unlimited)",
     ),
+    ConfigParameter(
+        name="max_bytes",
+        default=-1,
+        type_=int,
+        help="Max size of an output file in bytes (-1 for unlimited)",
+    ),
+    ConfigParameter(
+        name="max_messages",
+        default=-1,
+        type_=int,
+        help="Max number of messages per output file (-1 for unlimited)",
+    ),
+    ConfigParameter(
+        name="period",
+        default="none",
+        type_=str,
+        choices=PERIODS,
+        help="Start a new output file for every calendar day, week, month or year",
+    ),
+    ConfigParameter(
+        name="chunk_tokens",
+        default=-1,
+        type_=int,
+        help="Pack messages into chunks of at most this many tokens, keeping threads together "
+        "and writing a chunk manifest (-1 to disable)",
+    ),
+    ConfigParameter(
+        name="token_estimator",
+        default="chars",
+        type_=str,
+        choices=LazyChoices(available_token_estimators(discover=False), available_token_estimators),
+        help="Token count estimator used for chunking",
+    ),
+    ConfigParameter(
+        name="since",
+        default="",
+        type_=str,
+        help="Only convert messages from this date on (YYYY-MM-DD)",
+    ),
+    ConfigParameter(
+        name="until",
+        default="",
+        type_=str,
+        help="Only convert messages up to and including this date (YYYY-MM-DD)",
+    ),
+    ConfigParameter(
+        name="index",
+        default=True,
+        type_=bool,
+        choices=[True, False],
+        help="Keep a sidecar index <mbox>.mbxidx of message offsets and dates to skip rescanning",
+    ),
+    ConfigParameter(
+        name="reply_stripper",
+        default="compat",
+        type_=str,
+        choices=available_reply_strippers(),
+        help="Removal of quoted replies and signatures: email_reply_parser (compat), "
+        "a faster equivalent that also knows German, French and Spanish replies (fast), "
+        "or none",
+        cli_arg="--reply-stripper",
+    ),
     ConfigParameter(
         name="mbox_file",
         default="",
         type_=str,
-        help="Path to mbox file",
+        help="Path to mbox file, Maildir or directory of .eml files",
         required=True,
         cli_arg=None,  # Positional argument
     ),
@@ -88,4 +203,132 @@ PARAMETERS = [
         help="Date format to use",
         is_cli=False,
     ),
+    ConfigParameter(
+        name="pipeline",
+        default="sync",
+        type_=str,
+        choices=["sync", "async"],
+        help="Run read, parse and write one after another (sync) or overlapped (async)",
+    ),
+    ConfigParameter(
+        name="queue_size",
+        default=64,
+        type_=int,
+        help="Max number of messages buffered between the stages of the async pipeline",
+    ),
+    ConfigParameter(
+        name="workers",
+        default=0,
+        type_=int,
+        help="Worker processes parsing messages in the async pipeline (0 for a thread pool)",
+    ),
+    ConfigParameter(
+        name="read_threads",
+        default=16,
+        type_=int,
+        help="Threads reading message files of Maildir and .eml directory inputs",
+    ),
+    ConfigParameter(
+        name="cache_file",
+        default="",
+        type_=str,
+        help="SQLite file caching the extracted fields of messages between runs (empty to disable)",
+    ),
+    ConfigParameter(
+        name="cache_max_mb",
+        default=1024,
+        type_=int,
+        help="Size of the cache file above which the least recently used entries are evicted",
+    ),
+    ConfigParameter(
+        name="quarantine",
+        default=True,
+        type_=bool,
+        choices=[True, False],
+        help="Write messages that fail to parse or exceed the time or size budget to "
+        "<output>_quarantine.mbox and continue (False aborts the run on the first failure)",
+    ),
+    ConfigParameter(
+        name="quarantine_dir",
+        default="",
+        type_=str,
+        help="Directory for the quarantine files instead of the output directory; with --redact, "
+        "raw quarantined messages are only written here",
+    ),
+    ConfigParameter(
+        name="message_timeout",
+        default=60,
+        type_=int,
+        help="Seconds a single message may take to parse before it is quarantined (0 = no limit)",
+    ),
+    ConfigParameter(
+        name="max_message_mb",
+        default=64,
+        type_=int,
+        help="Messages larger than this are quarantined without parsing (0 = no limit)",
+    ),
+    ConfigParameter(
+        name="boilerplate",
+        default=0,
+        type_=int,
+        help="Remove paragraphs and lines of the content repeated in at least this many messages, "
+        "such as disclaimers and list footers (0 keeps them)",
+    ),
+    ConfigParameter(
+        name="boilerplate_sketch_mb",
+        default=32,
+        type_=int,
+        help="Memory for counting repeated paragraphs and lines; more counts large archives "
+        "more exactly",
+    ),
+    ConfigParameter(
+        name="redact",
+        default="none",
+        type_=str,
+        choices=REDACT_MODES,
+        help="Replace e-mail addresses, phone numbers, terms and patterns in headers and content "
+        "with [EMAIL] ... (mask) or a stable keyed hash (pseudonym)",
+    ),
+    ConfigParameter(
+        name="redact_terms",
+        default="",
+        type_=str,
+        help="File with names or other terms to redact, one per line",
+    ),
+    ConfigParameter(
+        name="redact_patterns",
+        default="",
+        type_=str,
+        help="File with regular expressions to redact, such as customer IDs, one per line",
+    ),
+    ConfigParameter(
+        name="export",
+        default="none",
+        type_=str,
+        choices=EXPORT_FORMATS,
+        help="Write every message as a document of its own into <output>.zip or <output>.tar "
+        "instead of the numbered output files",
+    ),
+    ConfigParameter(
+        name="export_entry",
+        default="txt",
+        type_=str,
+        choices=ENTRY_FORMATS,
+        help="Documents in the export: the rendered text (txt) or the raw message (eml)",
+    ),
+    ConfigParameter(
+        name="export_compression",
+        default="deflated",
+        type_=str,
+        choices=COMPRESSIONS,
+        help="Compression of each ZIP entry, or of the whole tar stream "
+        "(.tar.gz, .tar.bz2, .tar.xz)",
+    ),
+    ConfigParameter(
+        name="sinks",
+        default=[],
+        type_=list,
+        help="Outputs written in a single pass, each a mapping of output options and filters",
+        is_cli=False,
+    ),
 ]
@@ -0,0 +1,186 @@
+"""Asynchronous read -> parse -> write pipeline for :class:`MboxConverter`.
+
+Each stage runs as its own task. Blocking file access is moved to threads and
+parsing runs in an executor, so reading, parsing and writing overlap instead
+of running one after another. Bounded queues between the stages provide
+backpressure and keep memory usage flat regardless of the archive size.
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+from mbox_converter.quarantine import Failure
+
+# Messages read, parsed or written per thread or process hop, to amortize the cost of switching
+BATCH_SIZE = 32
+_DONE = object()
+# Converter of a ConverterPool worker process
+_converter = None
+
+
+class ConverterPool(ProcessPoolExecutor):
+    """Process pool whose workers receive ``converter`` once, when they start.
+
+    The pipeline then only sends the raw messages to the workers, not the
+    converter along with every batch.
+    """
+
+    def __init__(self, converter, workers):
+        super().__init__(workers, initializer=_install_converter, initargs=(converter,))
+        self.converter = converter
+
+
+def _install_converter(converter):
+    global _converter
+    _converter = converter
+
+
+def parse_batch(converter, items):
+    """Records, or :class:`Failure` s, of ``(ref, raw)`` pairs."""
+    return [converter.record_or_failure(raw, ref) for ref, raw in items]
+
+
+def _parse_in_worker(items):
+    return parse_batch(_converter, items)
+
+
+async def iter_records_async(converter, queue_size, executor=None, quarantine_name=None):
+    """Yield the records of the converter's input in date order.
+
+    A reader task feeds batches of raw messages to a parse stage, which
+    submits them to ``executor``. The parse stage queues the resulting futures
+    in message order, so parsing may run in parallel while records are still
+    yielded in order. Messages found in the converter's cache skip the parse stage;
+    messages failing to parse are quarantined, into files named after
+    ``quarantine_name`` if given.
+    """
+    loop = asyncio.get_running_loop()
+    raw_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    record_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+
+    async def read_stage(source, cache):
+        try:
+            refs = await asyncio.to_thread(source.scan_sorted, converter.since, converter.until)
+            for i in range(0, len(refs), BATCH_SIZE):
+                batch = refs[i : i + BATCH_SIZE]
+                raws = await asyncio.to_thread(source.read_many, batch)
+                if cache is None:
+                    keys, found = [None] * len(raws), {}
+                else:
+                    keys, found = await asyncio.to_thread(_look_up, cache, raws)
+                entries = []
+                for ref, raw, key in zip(batch, raws, keys):
+                    if key in found:
+                        entries.append(
+                            (ref, raw, None, converter.record_from_fields(found[key], ref))
+                        )
+                    else:
+                        entries.append((ref, raw, key, None))
+                await raw_queue.put(entries)
+        except Exception as e:
+            # Hand the error downstream so the consumer raises it in order
+            failed = loop.create_future()
+            failed.set_exception(e)
+            await raw_queue.put(failed)
+        await raw_queue.put(_DONE)
+
+    async def parse_stage():
+        # Workers of a ConverterPool hold the converter already
+        installed = isinstance(executor, ConverterPool) and executor.converter is converter
+        while (item := await raw_queue.get()) is not _DONE:
+            if isinstance(item, asyncio.Future):
+                await record_queue.put(([], item))
+                continue
+            # Records that need no parsing are known now, the others are None until parsed
+            entries = []
+            todo = []
+            for ref, raw, key, record in item:
+                if record is None:
+                    # Messages above the size budget are not worth sending to a worker
+                    record = converter.check_size(raw, ref)
+                if record is None:
+                    todo.append((ref, raw))
+                entries.append((key, record))
+            future = None
+            if todo:
+                if installed:
+                    future = loop.run_in_executor(executor, _parse_in_worker, todo)
+                else:
+                    future = loop.run_in_executor(executor, parse_batch, converter, todo)
+                future.add_done_callback(_silence)
+            await record_queue.put((entries, future))
+        await record_queue.put(_DONE)
+
+    with (
+        converter.open_source() as source,
+        converter.open_cache() as cache,
+        converter.open_quarantine(quarantine_name) as quarantine,
+    ):
+        tasks = [
+            asyncio.ensure_future(read_stage(source, cache)),
+            asyncio.ensure_future(parse_stage()),
+        ]
+        missing = []
+        try:
+            while (item := await record_queue.get()) is not _DONE:
+                entries, future = item
+                parsed = iter(await future if future is not None else [])
+                for key, record in entries:
+                    if record is None:
+                        record = next(parsed)
+                    if isinstance(record, Failure):
+                        raw = await asyncio.to_thread(source.read, record.ref)
+                        quarantine.add(raw, record)
+                        continue
+                    if key is not None:
+                        missing.append((key, record[:5]))
+                        if len(missing) >= BATCH_SIZE:
+                            await asyncio.to_thread(cache.put_many, missing)
+                            missing = []
+                    yield record
+            if missing:
+                await asyncio.to_thread(cache.put_many, missing)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            _discard_pending(record_queue)
+
+
+async def run_pipeline(converter, queue_size, executor=None):
+    """Convert the converter's input, writing records while later ones are read and parsed."""
+    output = converter.create_output()
+    records = iter_records_async(converter, queue_size, executor, converter.quarantine_name)
+    try:
+        batch = []
+        async for record in records:
+            batch.append(record)
+            if len(batch) >= BATCH_SIZE:
+                await asyncio.to_thread(output.write_batch, batch)
+                batch = []
+        if batch:
+            await asyncio.to_thread(output.write_batch, batch)
+        await asyncio.to_thread(output.finish)
+    finally:
+        await records.aclose()
+        output.close()
+    output.report()
+    converter.report_quarantine()
+
+
+def _look_up(cache, raws):
+    keys = [cache.key(raw) for raw in raws]
+    return keys, cache.get_many(keys)
+
+
+def _discard_pending(queue):
+    while not queue.empty():
+        item = queue.get_nowait()
+        if item is not _DONE and item[1] is not None:
+            item[1].cancel()
+
+
+def _silence(future):
+    # Errors are re-raised to the consumer; don't log futures dropped after a failure
+    if not future.cancelled():
+        future.exception()
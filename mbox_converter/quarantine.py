@@ -0,0 +1,166 @@
+"""Isolation of messages that fail to parse or exceed their time or size budget.
+
+Such messages are not converted. Their raw bytes go to
+``<output>_quarantine.mbox`` and the reason to ``<output>_quarantine.jsonl``,
+one JSON object per line, while the run continues with the next message.
+When the output is redacted, the raw messages are only kept in a
+``quarantine_dir`` chosen by the user; otherwise the log only points to them.
+
+The time budget is enforced with a ``SIGALRM`` interval timer, which costs
+two system calls per message. Signals are only delivered to the main thread
+of a process, so the budget applies to the sync pipeline and to worker
+processes (``workers > 0``), but not to the thread pool of the async pipeline
+or on platforms without ``signal.setitimer`` such as Windows.
+"""
+
+import contextlib
+import json
+import os
+import signal
+import threading
+import time
+from collections import Counter
+from typing import NamedTuple, Optional
+
+from mbox_converter.sources import _FROM_LINE, MessageRef
+
+CAUSES = ["size", "timeout", "error"]
+_QUARANTINE_FROM_LINE = b"From quarantine Thu Jan  1 00:00:00 1970\n"
+
+
+class MessageTimeout(BaseException):
+    """Raised when a message exceeds its time budget.
+
+    Derived from :class:`BaseException`, so ``except Exception`` blocks in
+    the parsing code don't swallow it.
+    """
+
+
+class Failure(NamedTuple):
+    """A message that was quarantined instead of converted."""
+
+    ref: Optional[MessageRef]
+    cause: str
+    detail: str
+
+
+@contextlib.contextmanager
+def time_budget(seconds):
+    """Raise :class:`MessageTimeout` in the block once it runs for more than ``seconds``.
+
+    Does nothing if ``seconds`` is not positive or the timer is unavailable.
+    An interval timer the application has set is suspended in the block and
+    restored afterwards, so its signal may arrive late but is not lost.
+    """
+    if (
+        not seconds
+        or seconds <= 0
+        or not hasattr(signal, "setitimer")
+        or threading.current_thread() is not threading.main_thread()
+    ):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise MessageTimeout(f"more than {seconds} s")
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    delay, interval = signal.setitimer(signal.ITIMER_REAL, seconds)
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+        if delay:
+            # Re-arm the timer of the application with the time it had left; had it expired
+            # meanwhile, it fires right away
+            remaining = max(delay - (time.monotonic() - start), 1e-6)
+            signal.setitimer(signal.ITIMER_REAL, remaining, interval)
+
+
+class Quarantine:
+    """Raw messages set aside during a run, with a log of the reasons.
+
+    The files are only created once the first message is quarantined. Without
+    a ``base_output_name``, messages are only counted and no files are written.
+    Without ``keep_raw``, only the log is written and it only records the cause
+    and where the message is found in the input, not the error message, which
+    may quote the message.
+    """
+
+    def __init__(self, base_output_name=None, keep_raw=True):
+        self.mbox_path = None
+        self.log_path = None
+        if base_output_name is not None:
+            self.log_path = f"{base_output_name}_quarantine.jsonl"
+            if keep_raw:
+                self.mbox_path = f"{base_output_name}_quarantine.mbox"
+        self.counts: Counter = Counter()
+        self._mbox = None
+        self._log = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __getstate__(self):
+        # Converters holding the result of a run are sent to worker processes
+        return {**self.__dict__, "_mbox": None, "_log": None}
+
+    def add(self, raw, failure: Failure):
+        self.counts[failure.cause] += 1
+        if self.log_path is None:
+            return
+        if self._log is None:
+            os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+            self._log = open(self.log_path, "w", encoding="utf-8")
+            if self.mbox_path is not None:
+                self._mbox = open(self.mbox_path, "wb")
+        ref = failure.ref
+        entry = {
+            "cause": failure.cause,
+            "detail": None,
+            "timestamp": ref.timestamp if ref else None,
+            "source": ref.path if ref and ref.path else None,
+            "source_offset": [ref.start, ref.stop] if ref and ref.path is None else None,
+            "offset": None,
+            "length": None,
+        }
+        if self._mbox is not None:
+            start = self._mbox.tell()
+            self._mbox.write(_as_mbox_message(raw))
+            entry.update(detail=failure.detail, offset=start, length=self._mbox.tell() - start)
+        self._log.write(json.dumps(entry) + "\n")
+
+    def close(self):
+        for f in (self._mbox, self._log):
+            if f is not None:
+                f.close()
+        self._mbox = None
+        self._log = None
+
+    def summary(self) -> Optional[str]:
+        """One line counting the quarantined messages by cause, None if there are none."""
+        total = sum(self.counts.values())
+        if not total:
+            return None
+        causes = ", ".join(
+            f"{self.counts[cause]} {cause}" for cause in CAUSES if cause in self.counts
+        )
+        if self.log_path is None:
+            return f"Quarantined {total} message(s): {causes}."
+        if self.mbox_path is None:
+            return f"Quarantined {total} message(s), listed in {self.log_path}: {causes}."
+        return f"Quarantined {total} message(s) into {self.mbox_path}: {causes}."
+
+
+def _as_mbox_message(raw):
+    # Messages from mbox files keep their From line; others get one and escaped From lines
+    if not raw.startswith(b"From "):
+        raw = _QUARANTINE_FROM_LINE + _FROM_LINE.sub(b">From ", raw)
+    if not raw.endswith(b"\n"):
+        raw += b"\n"
+    return raw + b"\n"
@@ -0,0 +1,244 @@
+"""Redaction of personal data in the header fields and content of records.
+
+A :class:`Redactor` replaces e-mail addresses, phone numbers, a list of
+literal terms (e.g. customer names) and regular expressions (e.g. customer
+IDs) with a mask such as ``[EMAIL]``, or with a pseudonym such as
+``[EMAIL:1f3a9c0b52e7d46a]``. Pseudonyms are keyed hashes of the normalized
+value, so the same address or name always gets the same pseudonym and threads
+stay linkable. The key is read from the ``REDACT_KEY`` environment variable (or
+``.env`` file) and is required: without it, the pseudonyms of known addresses
+and phone numbers could be recomputed.
+
+Each kind of value is found the way that scans the text fastest, as this
+runs for every field of every message: addresses from their ``@``, phone
+numbers with an expression starting with a character class, which the regex
+engine looks for without trying every position, and the given patterns
+combined into a single expression. Terms are compiled into a trie shaped
+expression: terms sharing a prefix share a branch, so the regex engine follows
+one path, as an Aho-Corasick automaton would, and lists of many thousands of
+names cost little more than a single one. The expression is only tried where a
+word of the text starts one of the terms, which a set intersection of the
+words finds.
+"""
+
+import os
+import re
+import string
+from typing import Iterable, List, Tuple
+
+from mbox_converter.base import ADDRESS_PATTERN, load_env
+
+REDACT_MODES = ["none", "mask", "pseudonym"]
+KEY_VARIABLE = "REDACT_KEY"
+# Bytes of a pseudonym: 64 bits make a collision among millions of values very unlikely
+PSEUDONYM_BYTES = 8
+# Record fields that are redacted; dates are left as they are
+FIELDS = ["sent_from", "to", "subject", "content"]
+
+# The address pattern of extract_emails, taking a longer top level domain along
+_EMAIL = re.compile(rf"({ADDRESS_PATTERN})[a-zA-Z]*")
+_LOCAL_PART_CHARS = frozenset(string.ascii_letters + string.digits + "_-.")
+# Digits in groups separated by single spaces, dashes, dots, slashes or parentheses. The
+# pattern starts with a character class, so the regex engine skips other text quickly.
+_PHONE = re.compile(
+    r"[+(\d](?<![\w+].)(?:(?<=\()\+?\d|(?<=\+)\d)?(?:[ \-./()]{0,2}\d){6,18}(?![\w:])"
+)
+_DATE = re.compile(r"\d{1,4}([-./])\d{1,2}\1\d{1,4}")
+_MIN_PHONE_DIGITS = 7
+# Splits a lower case text into words to look up the first words of terms
+_SEPARATORS = str.maketrans(dict.fromkeys(string.punctuation + "‘’“”«»–—", " "))
+
+
+def read_list(path) -> List[str]:
+    """Non-empty lines of a file, without comment lines starting with ``#``."""
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def literal_pattern(terms: Iterable[str]) -> str:
+    """Regular expression matching any of ``terms``, built from a trie of the terms.
+
+    Spaces in a term match any whitespace, e.g. a line break between first
+    and last name.
+    """
+    trie: dict = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[""] = {}
+    return _trie_pattern(trie)
+
+
+def _trie_pattern(node):
+    branches = [
+        (r"\s+" if char == " " else re.escape(char)) + _trie_pattern(child)
+        for char, child in sorted(node.items())
+        if char
+    ]
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if "" in node:
+        # A term ends here; longer terms are tried first
+        pattern = f"(?:{pattern})?"
+    return pattern
+
+
+class Redactor:
+    """Replace addresses, phone numbers, ``terms`` and ``patterns`` in text.
+
+    ``terms`` are matched as whole words, ignoring case. ``mode`` is ``mask``
+    or ``pseudonym``, which needs a secret ``key``.
+    """
+
+    def __init__(self, mode="mask", terms=(), patterns=(), key=b""):
+        # hashlib is slow to import, so the CLI only loads it when redacting
+        from hashlib import blake2b
+
+        if mode not in REDACT_MODES[1:]:
+            raise ValueError(f"Unknown redaction mode: {mode}")
+        if mode == "pseudonym" and not key:
+            raise ValueError(f"Pseudonyms need a secret key, set {KEY_VARIABLE}")
+        self.mode = mode
+        self.key = key[: blake2b.MAX_KEY_SIZE]
+        self._blake2b = blake2b
+        self.patterns = None
+        if patterns:
+            self.patterns = re.compile("|".join(f"(?:{pattern})" for pattern in patterns))
+        terms = sorted({" ".join(term.lower().split()) for term in terms} - {""})
+        self.terms = None
+        if terms:
+            self.terms = re.compile(rf"(?<!\w)(?i:{literal_pattern(terms)})(?!\w)")
+        words = [term.translate(_SEPARATORS) for term in terms]
+        self._first_words = {word.split()[0] for word in words if word[:1].strip()}
+        # Terms starting with punctuation are looked for everywhere
+        self._scan_all = any(not word[:1].strip() for word in words)
+
+    @classmethod
+    def from_converter(cls, converter) -> "Redactor":
+        """Redactor for the ``redact``, ``redact_terms`` and ``redact_patterns`` options."""
+        terms = read_list(converter.redact_terms) if converter.redact_terms else []
+        patterns = read_list(converter.redact_patterns) if converter.redact_patterns else []
+        load_env()
+        key = os.getenv(KEY_VARIABLE, "").encode("utf-8")
+        return cls(converter.redact, terms, patterns, key)
+
+    def _term_matches(self, text):
+        folded = text.lower()
+        if self._scan_all or len(folded) != len(text):
+            yield from self.terms.finditer(text)
+            return
+        match_at = self.terms.match
+        for word in self._first_words.intersection(folded.translate(_SEPARATORS).split()):
+            position = folded.find(word)
+            while position >= 0:
+                match = match_at(text, position)
+                if match:
+                    yield match
+                position = folded.find(word, position + 1)
+
+    def _email_matches(self, text):
+        # Addresses are looked up from their "@", which is faster than trying the pattern at
+        # every word of the text
+        at = text.find("@")
+        while at >= 0:
+            start = at
+            while start and text[start - 1] in _LOCAL_PART_CHARS:
+                start -= 1
+            match = _EMAIL.match(text, start)
+            if match:
+                yield match
+                at = text.find("@", match.end())
+            else:
+                at = text.find("@", at + 1)
+
+    def matches(self, text) -> List[Tuple[int, int, str, str]]:
+        """Start, end, label and normalized value of every part of ``text`` to replace."""
+        found = [
+            (match.start(), match.end(), "EMAIL", match.group(1).lower())
+            for match in self._email_matches(text)
+        ]
+        for match in _PHONE.finditer(text):
+            phone = match.group()
+            digits = re.sub(r"\D", "", phone)
+            if len(digits) >= _MIN_PHONE_DIGITS and not _DATE.fullmatch(phone):
+                found.append((match.start(), match.end(), "PHONE", digits))
+        if self.patterns is not None:
+            found.extend(
+                (match.start(), match.end(), "ID", match.group().lower())
+                for match in self.patterns.finditer(text)
+                if match.group()
+            )
+        if self.terms is not None:
+            found.extend(
+                (match.start(), match.end(), "NAME", " ".join(match.group().lower().split()))
+                for match in self._term_matches(text)
+            )
+        if len(found) < 2:
+            return found
+        # Of overlapping matches, the leftmost and then the longest one is kept
+        found.sort(key=lambda found_match: (found_match[0], -found_match[1]))
+        end = 0
+        kept = []
+        for found_match in found:
+            if found_match[0] >= end:
+                kept.append(found_match)
+                end = found_match[1]
+        return kept
+
+    def replacement(self, label, value) -> str:
+        if self.mode == "mask":
+            return f"[{label}]"
+        digest = self._blake2b(
+            value.encode("utf-8"), digest_size=PSEUDONYM_BYTES, key=self.key, person=label.encode()
+        )
+        return f"[{label}:{digest.hexdigest()}]"
+
+    def redact(self, text) -> str:
+        found = self.matches(text)
+        if not found:
+            return text
+        parts = []
+        end = 0
+        for start, stop, label, value in found:
+            parts.append(text[end:start])
+            parts.append(self.replacement(label, value))
+            end = stop
+        parts.append(text[end:])
+        return "".join(parts)
+
+    def redact_record(self, record):
+        """The record with its :data:`FIELDS` redacted."""
+        redact = self.redact
+        return record._replace(
+            sent_from=redact(record.sent_from),
+            to=redact(record.to),
+            subject=redact(record.subject),
+            content=redact(record.content),
+        )
+
+
+class RedactingOutput:
+    """Output files of a run receiving redacted records.
+
+    Wraps the output of :meth:`MboxConverter.create_output` with the same
+    interface.
+    """
+
+    def __init__(self, output, redactor):
+        self.output = output
+        self.redactor = redactor
+
+    def write_batch(self, records):
+        self.output.write_batch([self.redactor.redact_record(record) for record in records])
+
+    def finish(self):
+        self.output.finish()
+
+    def close(self):
+        self.output.close()
+
+    def report(self):
+        self.output.report()
@@ -0,0 +1,169 @@
+"""Strip quoted replies, reply headers and signatures from message bodies.
+
+Three strippers are available by name:
+
+* ``compat`` -- :meth:`EmailReplyParser.parse_reply`, the reference behaviour.
+* ``fast`` -- a single-pass line classifier producing the same output as
+  ``compat`` for English mail, which additionally recognizes German, French
+  and Spanish reply headers ("Am ... schrieb ...:", "Le ... a écrit :",
+  "El ... escribió:") and their Outlook style header blocks.
+* ``none`` -- keeps the body as it is.
+"""
+
+import re
+from typing import Callable, Dict
+
+_REPLY_STRIPPERS: Dict[str, Callable[[str], str]] = {}
+
+# "On ... wrote:" and its translations, as the whole line
+_QUOTE_HEADER = r"On.*wrote:" r"|Am\s.*schrieb.*:" r"|Le\s.*a\s+écrit\s*:" r"|El\s.*escribió\s*:"
+# Outlook style "From: ..." header lines of a forwarded or quoted message
+_HEADER = (
+    r"\*?(?:From|Sent|To|Subject):\*? .+"
+    r"|\*?(?:Von|Gesendet|An|Betreff|De|Envoyé|À|Objet|Enviado|Para|Asunto) ?:\*? .+"
+)
+# One match per line tells whether it is a reply header, a header or a quoted line
+_LINE_KIND = re.compile(rf"(?P<quote_header>(?:{_QUOTE_HEADER})$)|(?P<header>{_HEADER})|>")
+_SIGNATURE = re.compile(
+    r"--|__|-\w|Sent from my \w|Von meinem \w|Envoyé de mon \w|Enviado desde mi \w"
+)
+# Anything that can make the result differ from the stripped text; bodies without
+# it skip the line classification. Searched in "\n" + text, as a literal prefix is
+# much faster to scan for than line starts.
+_NEEDS_SCAN = re.compile(
+    rf"\n(?:[^\S\n]*(?:>|{_SIGNATURE.pattern})| ?[_-]{{7}}"
+    r"|\*?(?:From|Sent|To|Subject|Von|Gesendet|An|Betreff|De|Envoyé|À|Objet|Enviado|Para|Asunto)"
+    r" ?:)"
+)
+_QUOTE_HEADER_WORDS = ("wrote", "schrieb", "écrit", "escribió")
+# Gmail wraps long translated reply headers over two lines
+_WRAPPED_LOCALE_HEADER = re.compile(r"^((?:Am|Le|El)\s[^\n]*)\n([^\n]*:)$", re.MULTILINE)
+_SIGNATURE_BOUNDARY = re.compile("([^\n])(?=\n ?[_-]{7,})")
+
+
+def register_reply_stripper(name):
+    """Decorator registering a function that strips quoted replies from a body."""
+
+    def decorator(func):
+        _REPLY_STRIPPERS[name] = func
+        return func
+
+    return decorator
+
+
+def get_reply_stripper(name) -> Callable[[str], str]:
+    try:
+        return _REPLY_STRIPPERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown reply stripper: {name}") from None
+
+
+def available_reply_strippers():
+    return list(_REPLY_STRIPPERS)
+
+
+@register_reply_stripper("fast")
+def strip_reply_fast(text):
+    text = text.replace("\r\n", "\n")
+    if _NEEDS_SCAN.search("\n" + text) is None and not any(
+        word in text for word in _QUOTE_HEADER_WORDS
+    ):
+        return text.strip()
+
+    text = _join_quote_header(text)
+    text = _WRAPPED_LOCALE_HEADER.sub(_join_locale_header, text)
+    # EmailReplyParser passes re.MULTILINE as the count, so at most 8 lines are fixed
+    text = _SIGNATURE_BOUNDARY.sub("\\1\n", text, count=8)
+
+    # Lines are classified bottom-up into fragments of equal kind. Each fragment
+    # is [lines, quoted, header, signature, hidden].
+    fragments = []
+    fragment = None
+    found_visible = False
+    match_kind = _LINE_KIND.match
+    match_signature = _SIGNATURE.match
+    lines = text.split("\n")
+    for line in reversed(lines):
+        kind = match_kind(line)
+        if kind is None:
+            is_quote_header = is_quoted = is_header = False
+        else:
+            is_quote_header = kind.lastgroup == "quote_header"
+            is_header = kind.lastgroup is not None
+            is_quoted = not is_header
+        is_blank = not line.strip()
+
+        if fragment is not None and is_blank and match_signature(fragment[0][-1].strip()):
+            fragment[3] = True
+            found_visible = _finish(fragment, fragments, found_visible)
+            fragment = None
+
+        if fragment is not None and (
+            (fragment[2] == is_header and fragment[1] == is_quoted)
+            or (fragment[1] and (is_quote_header or is_blank))
+        ):
+            fragment[0].append(line)
+        else:
+            if fragment is not None:
+                found_visible = _finish(fragment, fragments, found_visible)
+            fragment = [[line], is_quoted, is_header, False, False]
+
+    if fragment is not None:
+        _finish(fragment, fragments, found_visible)
+
+    return "\n".join(
+        fragment[0] for fragment in reversed(fragments) if not (fragment[4] or fragment[1])
+    )
+
+
+def _finish(fragment, fragments, found_visible):
+    lines = fragment[0]
+    lines.reverse()
+    fragment[0] = "\n".join(lines).strip()
+    if fragment[2]:
+        # Everything below a header belongs to the quoted message
+        found_visible = False
+        for previous in fragments:
+            previous[4] = True
+    if not found_visible:
+        if fragment[1] or fragment[2] or fragment[3] or not fragment[0]:
+            fragment[4] = True
+        else:
+            found_visible = True
+    fragments.append(fragment)
+    return found_visible
+
+
+def _join_quote_header(text):
+    # Joins an "On ... wrote:" header wrapped over several lines, like EmailReplyParser
+    # does with a regex search that is quadratic in the number of "On" occurrences.
+    wrote = text.rfind("wrote:")
+    if wrote < 4:
+        return text
+    start = text.rfind("On", 0, wrote - 2)
+    while start >= 0 and not text[start + 2].isspace():
+        start = text.rfind("On", 0, start)
+    if start < 0:
+        return text
+    end = text.find("wrote:", start + 4) + len("wrote:")
+    return text[:start] + text[start:end].replace("\n", "") + text[end:]
+
+
+def _join_locale_header(match):
+    joined = f"{match[1]} {match[2]}"
+    kind = _LINE_KIND.match(joined)
+    if kind is not None and kind.lastgroup == "quote_header":
+        return joined
+    return match[0]
+
+
+@register_reply_stripper("compat")
+def strip_reply_compat(text):
+    from email_reply_parser import EmailReplyParser
+
+    return EmailReplyParser.parse_reply(text)
+
+
+@register_reply_stripper("none")
+def strip_reply_none(text):
+    return text
@@ -0,0 +1,141 @@
+"""Rollover policies deciding when the converter starts a new output file.
+
+Policies can be combined with :class:`AnyPolicy`; a new file is started as
+soon as one of them asks for it. Size based policies read the byte counter of
+the writer backend, so no file system calls are needed to track file sizes.
+"""
+
+import datetime
+from typing import List, Optional
+
+PERIODS = ["none", "day", "week", "month", "year"]
+
+
+class RolloverPolicy:
+    """Base class of all rollover policies."""
+
+    # Set by policies that read ``output.bytes_written``; records are then
+    # passed to the writer one at a time so the counter is always current.
+    needs_bytes = False
+
+    def start(self, record):
+        """Called with the first record of a new output file."""
+
+    def should_rollover(self, record, output) -> bool:
+        """Return True if ``record`` must go into a new output file.
+
+        ``output`` describes the current file through its ``records_written``
+        and ``bytes_written`` counters.
+        """
+        return False
+
+    def label(self, record) -> Optional[str]:
+        """Name of the period ``record`` belongs to, used in output file names."""
+        return None
+
+
+class MaxDaysPolicy(RolloverPolicy):
+    """Start a new file once a message is more than ``max_days`` after the first one in the file."""
+
+    def __init__(self, max_days, date_format):
+        self.max_days = max_days
+        self.date_format = date_format
+        self.first_date = None
+
+    def _date(self, record):
+        if record.date:
+            return datetime.datetime.strptime(record.date, self.date_format)
+        return datetime.datetime.min
+
+    def start(self, record):
+        self.first_date = self._date(record)
+
+    def should_rollover(self, record, output):
+        return (self._date(record) - self.first_date).days > self.max_days
+
+
+class MaxMessagesPolicy(RolloverPolicy):
+    """Start a new file after ``max_messages`` messages."""
+
+    def __init__(self, max_messages):
+        self.max_messages = max_messages
+
+    def should_rollover(self, record, output):
+        return output.records_written >= self.max_messages
+
+
+class MaxBytesPolicy(RolloverPolicy):
+    """Start a new file once the current one has reached ``max_bytes``.
+
+    The limit is checked before each message, so a file exceeds it by at most
+    the size of its last message.
+    """
+
+    needs_bytes = True
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+
+    def should_rollover(self, record, output):
+        return output.bytes_written >= self.max_bytes
+
+
+class PeriodPolicy(RolloverPolicy):
+    """Start a new file for every calendar day, week, month or year.
+
+    Output files are named after the period, e.g. ``2024-01`` for months or
+    ``2024-W05`` for ISO weeks. Messages without a date go into ``undated``.
+    """
+
+    FORMATS = {"day": "%Y-%m-%d", "week": "%G-W%V", "month": "%Y-%m", "year": "%Y"}
+
+    def __init__(self, period):
+        if period not in self.FORMATS:
+            raise ValueError(f"Unknown rollover period: {period}")
+        self.period = period
+        self.format = self.FORMATS[period]
+        self.current = None
+
+    def label(self, record):
+        if not record.timestamp:
+            return "undated"
+        return datetime.datetime.fromtimestamp(record.timestamp).strftime(self.format)
+
+    def start(self, record):
+        self.current = self.label(record)
+
+    def should_rollover(self, record, output):
+        return self.label(record) != self.current
+
+
+class AnyPolicy(RolloverPolicy):
+    """Start a new file as soon as any of the combined policies asks for it."""
+
+    def __init__(self, policies: List[RolloverPolicy]):
+        self.policies = policies
+        self.needs_bytes = any(policy.needs_bytes for policy in policies)
+
+    def start(self, record):
+        for policy in self.policies:
+            policy.start(record)
+
+    def should_rollover(self, record, output):
+        return any(policy.should_rollover(record, output) for policy in self.policies)
+
+    def label(self, record):
+        labels = [policy.label(record) for policy in self.policies]
+        return "_".join(label for label in labels if label) or None
+
+
+def build_policy(max_days=-1, max_bytes=-1, max_messages=-1, period="none", date_format=None):
+    """Combine the configured limits into one policy; negative limits are disabled."""
+    policies: List[RolloverPolicy] = []
+    if period and period != "none":
+        policies.append(PeriodPolicy(period))
+    if max_days is not None and max_days >= 0:
+        policies.append(MaxDaysPolicy(max_days, date_format))
+    if max_messages is not None and max_messages > 0:
+        policies.append(MaxMessagesPolicy(max_messages))
+    if max_bytes is not None and max_bytes > 0:
+        policies.append(MaxBytesPolicy(max_bytes))
+    return AnyPolicy(policies)
@@ -0,0 +1,649 @@
+"""Long-running conversion service with a pool of warm worker processes.
+
+``mbox_converter serve`` accepts conversion jobs over HTTP on a Unix socket
+only the user running the service can access, or on a loopback address. Jobs
+read and write files as that user, and a TCP port has no authentication, so
+other addresses are refused unless explicitly allowed. Worker processes are
+started, and import the parsing dependencies, once when the service starts, so
+a job only pays for the conversion itself. A job is a JSON object of :data:`PARAMETERS`, plus an
+optional ``config`` file and the ``directory`` to write the output files to.
+
+``POST /jobs``
+    Submit a job. Jobs run on up to ``workers`` processes at once and wait in
+    a queue of at most ``max_queue`` jobs; a full queue is answered with
+    ``503``.
+``GET /jobs`` and ``GET /jobs/<id>``
+    State of all or one job: status, messages converted, printed output.
+``GET /jobs/<id>/events``
+    The job's events as JSON lines, streamed until the job is done or failed:
+    ``queued``, ``started``, ``progress``, ``log`` and ``done`` or ``failed``;
+    ``requeued`` if a dying worker process stopped the job.
+``GET /metrics``
+    Queue depth, running jobs and the throughput of the last minute.
+"""
+
+import contextlib
+import http.client
+import importlib
+import itertools
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.parameters import PARAMETERS
+
+DEFAULT_SOCKET = "mbox_converter.sock"
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8642
+# Imported by every worker process before its first job
+WARM_MODULES = ["bs4", "email_reply_parser", "dotenv", "yaml"]
+# Minimum seconds between two progress events of a job
+PROGRESS_INTERVAL = 0.5
+# Seconds of finished jobs the throughput metrics are computed from
+METRICS_WINDOW = 60
+# Finished jobs whose state is kept for queries
+KEEP_FINISHED = 1000
+# Times a job is started before a dying worker process fails it instead of requeueing it
+MAX_ATTEMPTS = 2
+FINAL_EVENTS = ["done", "failed"]
+
+_PARAMETERS = {param.name: param for param in PARAMETERS}
+# Queue of events to the service, set in each worker process
+_events = None
+
+
+class QueueFullError(RuntimeError):
+    """Raised when a job is submitted while the queue holds ``max_queue`` jobs."""
+
+
+def validate_job(options) -> Dict[str, Any]:
+    """Job of a submitted JSON object; raises ValueError for unknown or invalid parameters."""
+    if not isinstance(options, dict):
+        raise ValueError("A job must be a JSON object of parameters")
+    options = dict(options)
+    directory = os.path.abspath(options.pop("directory", None) or os.getcwd())
+    if not os.path.isdir(directory):
+        raise ValueError(f"Directory not found: {directory}")
+    config = options.pop("config", None)
+    for name, value in options.items():
+        param = _PARAMETERS.get(name)
+        if param is None:
+            raise ValueError(f"Unknown parameter: {name}")
+        if type(value) is not param.type_:
+            raise ValueError(f"{name} must be of type {param.type_.__name__}")
+        if param.choices is not None and value not in param.choices:
+            raise ValueError(f"Invalid value for {name}: {value!r}")
+    mbox_file = options.get("mbox_file")
+    if mbox_file is None and config is None:
+        raise ValueError("mbox_file is required")
+    if mbox_file is not None and not os.path.exists(os.path.join(directory, mbox_file)):
+        raise ValueError(f"mbox file not found: {mbox_file}")
+    return {"parameters": options, "config": config, "directory": directory}
+
+
+def _warm_up(events):
+    global _events
+    _events = events
+    for module in WARM_MODULES:
+        importlib.import_module(module)
+
+
+def _emit(job_id, event, **fields):
+    _events.put({"job": job_id, "event": event, "time": time.time(), **fields})
+
+
+class _EventLog:
+    """Standard output of a job, passed on as ``log`` events line by line."""
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self._line = ""
+
+    def write(self, text):
+        lines = (self._line + text).split("\n")
+        self._line = lines.pop()
+        for line in lines:
+            _emit(self.job_id, "log", line=line)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class _ProgressOutput:
+    """Output files of a job, counting the records written and reporting the count."""
+
+    def __init__(self, output, converter):
+        self.output = output
+        self.converter = converter
+        self._next_report = 0.0
+
+    def write_batch(self, records):
+        self.output.write_batch(records)
+        self.converter.messages_converted += len(records)
+        now = time.monotonic()
+        if now >= self._next_report and records:
+            _emit(self.converter.job_id, "progress", messages=self.converter.messages_converted)
+            self._next_report = now + PROGRESS_INTERVAL
+
+    def finish(self):
+        self.output.finish()
+
+    def close(self):
+        self.output.close()
+
+    def report(self):
+        self.output.report()
+
+
+class JobConverter(MboxConverter):
+    """Converter of a job, reporting the number of messages converted."""
+
+    def __init__(self, config, job_id):
+        super().__init__(config)
+        self.job_id = job_id
+        self.messages_converted = 0
+
+    def create_output(self):
+        return _ProgressOutput(super().create_output(), self)
+
+
+def run_job(job_id, job):
+    """Run a job in a worker process; its progress, output and result are sent as events."""
+    start = time.monotonic()
+    _emit(job_id, "started", pid=os.getpid())
+    previous_directory = os.getcwd()
+    try:
+        os.chdir(job["directory"])
+        config = ConfigParameterManager(config_file=job["config"], **job["parameters"])
+        converter = JobConverter(config, job_id)
+        with contextlib.redirect_stdout(_EventLog(job_id)):
+            if config.pipeline == "async":
+                import asyncio
+
+                asyncio.run(converter.convert_async())
+            else:
+                converter.convert()
+    except Exception as e:
+        _emit(job_id, "failed", error=str(e) or type(e).__name__)
+        return
+    finally:
+        os.chdir(previous_directory)
+    seconds = round(time.monotonic() - start, 3)
+    _emit(job_id, "done", messages=converter.messages_converted, seconds=seconds)
+
+
+class Job:
+    """A submitted job and the events received for it."""
+
+    def __init__(self, job_id, job):
+        self.id = job_id
+        self.job = job
+        self.status = "queued"
+        self.events: List[Dict[str, Any]] = []
+        self.messages = 0
+        self.output: List[str] = []
+        self.error: Optional[str] = None
+        self.submitted = time.time()
+        self.attempts = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def final(self):
+        return self.status in FINAL_EVENTS
+
+    def apply(self, event):
+        self.events.append(event)
+        kind = event["event"]
+        if kind == "started":
+            self.started = event["time"]
+        elif kind == "progress":
+            self.messages = event["messages"]
+        elif kind == "log":
+            self.output.append(event["line"])
+        elif kind == "requeued":
+            # Started again from scratch
+            self.status = "queued"
+            self.messages = 0
+            self.output = []
+        elif kind in FINAL_EVENTS:
+            self.status = kind
+            self.finished = event["time"]
+            self.messages = event.get("messages", self.messages)
+            self.error = event.get("error")
+
+    def state(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "status": self.status,
+            "messages": self.messages,
+            "error": self.error,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "output": self.output,
+        }
+
+
+class ConversionService:
+    """Queue of conversion jobs run by a pool of ``workers`` warm processes.
+
+    At most ``max_queue`` jobs wait for a worker. ``executor`` replaces the
+    process pool, e.g. in tests; its jobs report to :attr:`events`.
+
+    If a worker process dies, the pool stops all jobs running on it, not only
+    the one of that worker. The pool is replaced and these jobs are queued
+    again, ahead of the waiting ones; a job stopped :data:`MAX_ATTEMPTS` times
+    fails.
+    """
+
+    def __init__(self, workers=None, max_queue=100, executor=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self._condition = threading.Condition()
+        self._jobs: Dict[str, Job] = {}
+        self._queue: deque = deque()
+        self._finished: deque = deque()
+        self._recent: deque = deque()
+        self._ids = itertools.count(1)
+        self._dispatcher: Optional[threading.Thread] = None
+        self._closed = False
+        self.running = 0
+        self.counts = dict.fromkeys(
+            ["submitted", "rejected", "requeued", "done", "failed", "messages"], 0
+        )
+        self.started = time.time()
+        if executor is None:
+            import multiprocessing
+
+            # Workers start from a fresh interpreter, not a fork of the service's threads
+            self._context = multiprocessing.get_context("spawn")
+            self.events = self._context.Queue()
+            self._pool = self._start_pool()
+        else:
+            import queue
+
+            self._context = None
+            self.events = queue.SimpleQueue()
+            self._pool = executor
+
+    def _start_pool(self):
+        from concurrent.futures import ProcessPoolExecutor
+
+        pool = ProcessPoolExecutor(
+            self.workers, self._context, initializer=_warm_up, initargs=(self.events,)
+        )
+        # Every submission finding no idle worker starts one, so this starts them all now
+        for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        return pool
+
+    def __enter__(self):
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            # Wait for a pool being replaced, so it is shut down as well
+            self._condition.wait_for(lambda: self._pool is not None)
+        self._pool.shutdown(wait=True, cancel_futures=True)
+        if self._dispatcher is not None:
+            self.events.put(None)
+            self._dispatcher.join()
+
+    def submit(self, options) -> Job:
+        """Validate and queue a job; raises :class:`QueueFullError` if the queue is full."""
+        job = validate_job(options)
+        with self._condition:
+            if self.running >= self.workers and len(self._queue) >= self.max_queue:
+                self.counts["rejected"] += 1
+                raise QueueFullError(f"Queue is full ({self.max_queue} jobs)")
+            entry = Job(str(next(self._ids)), job)
+            self._jobs[entry.id] = entry
+            self.counts["submitted"] += 1
+            entry.apply({"job": entry.id, "event": "queued", "time": entry.submitted})
+            self._queue.append(entry)
+            self._run_next()
+        return entry
+
+    def _run_next(self):
+        # No pool while a new one is started after a worker died
+        while (
+            self._queue
+            and self.running < self.workers
+            and self._pool is not None
+            and not self._closed
+        ):
+            entry = self._queue.popleft()
+            if entry.final:
+                # Its result arrived after the job was requeued
+                continue
+            entry.status = "running"
+            entry.attempts += 1
+            self.running += 1
+            pool = self._pool
+            future = pool.submit(run_job, entry.id, entry.job)
+            future.add_done_callback(
+                lambda future, entry=entry, pool=pool: self._job_ended(entry, future, pool)
+            )
+
+    def _job_ended(self, entry, future, pool):
+        # The job's own events report its result; this only catches dying workers
+        from concurrent.futures.process import BrokenProcessPool
+
+        error = None if future.cancelled() else future.exception()
+        broken = isinstance(error, BrokenProcessPool)
+        with self._condition:
+            self.running -= 1
+            if error is not None and not entry.final:
+                now = time.time()
+                if broken and entry.attempts < MAX_ATTEMPTS and not self._closed:
+                    self.counts["requeued"] += 1
+                    self._apply({"job": entry.id, "event": "requeued", "time": now})
+                    self._queue.appendleft(entry)
+                else:
+                    message = repr(error)
+                    if broken:
+                        message = (
+                            f"A worker process died while the job ran ({entry.attempts} time(s)); "
+                            "the pool stopped all jobs running at the same time"
+                        )
+                    self._apply({"job": entry.id, "event": "failed", "time": now, "error": message})
+            if broken and pool is self._pool and self._context and not self._closed:
+                # Replaced once, not for every job it was running, and without holding the lock
+                # while the new workers start
+                self._pool = None
+                threading.Thread(target=self._replace_pool, args=(pool,), daemon=True).start()
+            self._run_next()
+
+    def _replace_pool(self, broken):
+        broken.shutdown(wait=False)
+        pool = broken
+        try:
+            pool = self._start_pool()
+        finally:
+            with self._condition:
+                # If no new pool could be started, jobs are rejected by the broken one
+                self._pool = pool
+                self._condition.notify_all()
+                self._run_next()
+
+    def _dispatch(self):
+        while (event := self.events.get()) is not None:
+            with self._condition:
+                self._apply(event)
+
+    def _apply(self, event):
+        entry = self._jobs.get(event["job"])
+        if entry is None or entry.final:
+            return
+        entry.apply(event)
+        if entry.final:
+            self.counts[entry.status] += 1
+            self.counts["messages"] += entry.messages
+            self._recent.append(entry)
+            self._finished.append(entry.id)
+            if len(self._finished) > KEEP_FINISHED:
+                del self._jobs[self._finished.popleft()]
+            print(f"Job {entry.id} {entry.status}: {entry.error or f'{entry.messages} messages'}")
+        self._condition.notify_all()
+
+    def job(self, job_id) -> Optional[Job]:
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Dict[str, Any]]:
+        with self._condition:
+            return [entry.state() for entry in self._jobs.values()]
+
+    def wait_events(self, entry, start, timeout=None):
+        """Events of a job from index ``start`` on, waiting for one; and whether it's final."""
+        with self._condition:
+            self._condition.wait_for(lambda: len(entry.events) > start or entry.final, timeout)
+            return entry.events[start:], entry.final
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._condition:
+            now = time.time()
+            while self._recent and self._recent[0].finished < now - METRICS_WINDOW:
+                self._recent.popleft()
+            window = max(min(METRICS_WINDOW, now - self.started), 1e-3)
+            waits = [entry.started - entry.submitted for entry in self._recent if entry.started]
+            return {
+                "workers": self.workers,
+                "running": self.running,
+                "queued": len(self._queue),
+                "max_queue": self.max_queue,
+                **self.counts,
+                "uptime": round(now - self.started, 3),
+                "jobs_per_minute": round(len(self._recent) * 60 / window, 3),
+                "messages_per_second": round(
+                    sum(entry.messages for entry in self._recent) / window, 3
+                ),
+                "mean_queue_seconds": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "mbox_converter"
+
+    @property
+    def service(self) -> ConversionService:
+        return self.server.service
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        if parts == ["metrics"]:
+            self._send_json(200, self.service.metrics())
+        elif parts == ["jobs"]:
+            self._send_json(200, self.service.jobs())
+        elif len(parts) in (2, 3) and parts[0] == "jobs":
+            entry = self.service.job(parts[1])
+            if entry is None:
+                self._send_json(404, {"error": f"Unknown job: {parts[1]}"})
+            elif len(parts) == 2:
+                self._send_json(200, entry.state())
+            elif parts[2] == "events":
+                self._stream_events(entry)
+            else:
+                self._send_json(404, {"error": f"Not found: {self.path}"})
+        else:
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/jobs":
+            self._send_json(404, {"error": f"Not found: {self.path}"})
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            entry = self.service.submit(json.loads(body or b"{}"))
+        except QueueFullError as e:
+            self._send_json(503, {"error": str(e)})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        else:
+            self._send_json(202, entry.state())
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream_events(self, entry):
+        # Without a Content-Length, the end of the stream is the end of the connection
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        start = 0
+        final = False
+        with contextlib.suppress(ConnectionError):
+            while not final:
+                events, final = self.service.wait_events(entry, start)
+                self.wfile.write(b"".join(json.dumps(event).encode() + b"\n" for event in events))
+                self.wfile.flush()
+                start += len(events)
+
+    def address_string(self):
+        # Clients of a Unix socket have no address
+        return self.client_address[0] if self.client_address else "local"
+
+    def log_message(self, format, *args):
+        # Jobs are logged by the service, not every request
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.server_address)
+        super().server_bind()
+        # Only the user running the service may submit jobs
+        os.chmod(self.server_address, 0o600)
+
+
+def is_loopback(host) -> bool:
+    """Whether every address ``host`` resolves to is a loopback address."""
+    import ipaddress
+
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, None)}
+    except (socket.gaierror, UnicodeError):
+        return False
+    return bool(addresses) and all(
+        ipaddress.ip_address(address).is_loopback for address in addresses
+    )
+
+
+def check_host(host, allow_remote=False):
+    """Raise ValueError for a ``host`` other than a loopback address unless ``allow_remote``."""
+    if not allow_remote and not is_loopback(host):
+        raise ValueError(
+            f"Refusing to listen on {host}: jobs are not authenticated, so only loopback "
+            "addresses are allowed (use a Unix socket, or allow remote clients explicitly)"
+        )
+
+
+def make_server(
+    service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, allow_remote=False
+):
+    """HTTP server of ``service`` on ``host``:``port`` or on the Unix socket ``socket_path``.
+
+    Raises ValueError for a ``host`` other than a loopback address unless
+    ``allow_remote`` is set, as anyone reaching the port could run jobs.
+    """
+    if socket_path:
+        server = _UnixHTTPServer(socket_path, _Handler)
+    else:
+        check_host(host, allow_remote)
+        server = ThreadingHTTPServer((host, port), _Handler)
+        server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, allow_remote=False):
+    """Serve ``service`` until interrupted or terminated."""
+    import signal
+
+    server = make_server(service, host, port, socket_path, allow_remote)
+    # serve_forever() runs in this thread, so it can only be stopped from another one
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    address = f"unix:{socket_path}" if socket_path else f"http://{host}:{server.server_port}"
+    print(f"Serving on {address} with {service.workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(socket_path)
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path, timeout=None):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class ServiceClient:
+    """Client of a service on ``host``:``port`` or on the Unix socket ``socket_path``.
+
+    Rejected jobs raise ValueError, or :class:`QueueFullError` if the queue
+    is full.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, socket_path=None, timeout=None):
+        self.host = host
+        self.port = port
+        self.socket_path = socket_path
+        self.timeout = timeout
+
+    def _connection(self):
+        if self.socket_path:
+            return _UnixConnection(self.socket_path, self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _request(self, method, path, data=None):
+        connection = self._connection()
+        try:
+            body = None if data is None else json.dumps(data).encode("utf-8")
+            headers = {} if body is None else {"Content-Type": "application/json"}
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            result = json.loads(response.read())
+        finally:
+            connection.close()
+        if response.status == 503:
+            raise QueueFullError(result["error"])
+        if response.status >= 400:
+            raise ValueError(result["error"])
+        return result
+
+    def submit(self, **options) -> Dict[str, Any]:
+        """Submit a job of ``options``; returns its state, including its ``id``."""
+        return self._request("POST", "/jobs", options)
+
+    def job(self, job_id) -> Dict[str, Any]:
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return self._request("GET", "/metrics")
+
+    def events(self, job_id):
+        """Yield the events of a job as they happen, until it is done or failed."""
+        connection = self._connection()
+        try:
+            connection.request("GET", f"/jobs/{job_id}/events")
+            response = connection.getresponse()
+            if response.status != 200:
+                raise ValueError(json.loads(response.read())["error"])
+            while line := response.readline():
+                yield json.loads(line)
+        finally:
+            connection.close()
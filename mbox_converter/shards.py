@@ -0,0 +1,304 @@
+"""Sharded conversion of a single mbox by several independent workers.
+
+A conversion is split into three steps that only share a directory:
+
+``plan``
+    Split the mbox into byte ranges starting at ``From`` lines and write
+    ``manifest.json`` with the ranges, a fingerprint of the mbox and the
+    configuration of the conversion.
+``work``
+    Convert shards into intermediate runs ``shard_NNNN.jsonl``: the records of
+    the shard's messages, sorted by date. Any number of worker processes, on
+    one or several hosts, can run at the same time; each claims shards by
+    creating ``shard_NNNN.claim`` exclusively. A claim records the host, pid
+    and time and is touched while the shard is converted, so the claim of a
+    worker that died is taken over once its process is gone (same host) or it
+    was not touched for ``claim_timeout`` seconds. At worst a shard is then
+    converted twice, which writes the same run.
+``merge``
+    Merge all runs by date and write the output files exactly as
+    :meth:`MboxConverter.convert` would for the same configuration.
+"""
+
+import contextlib
+import heapq
+import json
+import os
+import socket
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+from mbox_converter.base import EmailRecord, MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.index import fingerprint
+from mbox_converter.quarantine import Failure
+from mbox_converter.sources import _FROM_LINE, MboxSource, in_range
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+# Buffer size of the run files, which are written and read sequentially
+RUN_BUFFER_SIZE = 1 << 20
+# Seconds without progress after which the claim of a shard is taken over by another worker
+CLAIM_TIMEOUT = 600
+# Seconds between two touches of the claim of the shard being converted
+CLAIM_REFRESH = 10
+
+
+def plan_shards(data, count) -> List[Tuple[int, int]]:
+    """Split mbox contents ``data`` into at most ``count`` byte ranges of similar size.
+
+    Every range starts at a ``From`` line, so no message is split; ranges
+    without a message boundary are merged into the previous one.
+    """
+    first = _FROM_LINE.search(data)
+    if first is None:
+        return []
+    starts = [first.start()]
+    for i in range(1, count):
+        match = _FROM_LINE.search(data, max(starts[-1] + 1, len(data) * i // count))
+        if match is None:
+            break
+        if match.start() > starts[-1]:
+            starts.append(match.start())
+    return list(zip(starts, starts[1:] + [len(data)]))
+
+
+class ShardManifest:
+    """Shards of an mbox and the configuration to convert them with."""
+
+    def __init__(self, path, mbox_file, mbox_fingerprint, shards, config):
+        self.path = os.path.abspath(path)
+        self.mbox_file = mbox_file
+        self.mbox_fingerprint = list(mbox_fingerprint)
+        self.shards = [tuple(shard) for shard in shards]
+        self.config = config
+
+    @property
+    def directory(self):
+        return os.path.dirname(self.path)
+
+    def run_path(self, shard) -> str:
+        return os.path.join(self.directory, f"shard_{shard:04d}.jsonl")
+
+    def claim_path(self, shard) -> str:
+        return os.path.join(self.directory, f"shard_{shard:04d}.claim")
+
+    def converter(self) -> MboxConverter:
+        return MboxConverter(ConfigParameterManager(**self.config))
+
+    @classmethod
+    def create(cls, converter, shard_dir, count) -> "ShardManifest":
+        """Plan ``count`` shards of the converter's mbox and write the manifest to ``shard_dir``."""
+        if converter.source_class is not MboxSource:
+            raise ValueError(f"Sharding needs an mbox file: {converter.mbox_file}")
+        _check_no_export(converter)
+        config = converter.config.to_dict()
+        # Workers on other hosts must find the mbox and format dates the same way
+        config["mbox_file"] = os.path.abspath(converter.mbox_file)
+        config["date_format"] = converter.date_format
+        with MboxSource(config["mbox_file"]) as source:
+            data = source._map or b""
+            mbox_fingerprint = fingerprint(data, os.fstat(source._file.fileno()))
+            shards = plan_shards(data, count)
+
+        os.makedirs(shard_dir, exist_ok=True)
+        manifest = cls(
+            os.path.join(shard_dir, MANIFEST_NAME),
+            config["mbox_file"],
+            mbox_fingerprint,
+            shards,
+            config,
+        )
+        entry = {
+            "version": MANIFEST_VERSION,
+            "mbox_file": manifest.mbox_file,
+            "fingerprint": manifest.mbox_fingerprint,
+            "shards": [list(shard) for shard in shards],
+            "config": config,
+        }
+        tmp_path = _tmp_path(manifest.path)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # Dates from YAML config files are written as YYYY-MM-DD
+            json.dump(entry, f, indent=2, default=str)
+        os.replace(tmp_path, manifest.path)
+        return manifest
+
+    @classmethod
+    def load(cls, path) -> "ShardManifest":
+        with open(path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+        if entry.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported shard manifest version: {entry.get('version')}")
+        return cls(path, entry["mbox_file"], entry["fingerprint"], entry["shards"], entry["config"])
+
+    def is_done(self, shard) -> bool:
+        return os.path.exists(self.run_path(shard))
+
+    def claim(self, shard, timeout=CLAIM_TIMEOUT) -> bool:
+        """Claim a shard for this worker; False if another worker holds a live claim on it."""
+        path = self.claim_path(shard)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if not self.claim_is_stale(shard, timeout):
+                return False
+            # Two workers may both find the claim stale, and one may remove the claim the
+            # other just created. Each reads its claim back below and backs off if it was
+            # replaced; if that happens after the check, both convert the shard, each into
+            # its own temporary file, and the later rename writes the same run again.
+            try:
+                os.remove(path)
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except (FileNotFoundError, FileExistsError):
+                return False
+        token = uuid.uuid4().hex
+        owner = {
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "time": time.time(),
+            "token": token,
+        }
+        with os.fdopen(fd, "w") as f:
+            json.dump(owner, f)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get("token") == token
+        except (FileNotFoundError, ValueError):
+            return False
+
+    def claim_is_stale(self, shard, timeout=CLAIM_TIMEOUT) -> bool:
+        """Whether the worker claiming a shard died or made no progress for ``timeout`` seconds."""
+        path = self.claim_path(shard)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                owner = json.load(f)
+            touched = os.stat(path).st_mtime
+        except FileNotFoundError:
+            return True
+        except ValueError:
+            # Written by a worker that died before finishing the claim, or an older version
+            owner = {}
+            touched = os.stat(path).st_mtime
+        if time.time() - touched > timeout:
+            return True
+        if owner.get("host") == socket.gethostname() and owner.get("pid") != os.getpid():
+            try:
+                os.kill(owner["pid"], 0)
+            except ProcessLookupError:
+                return True
+            except (PermissionError, OSError):
+                pass
+        return False
+
+    def pending(self) -> List[int]:
+        """Shards without a run yet."""
+        return [shard for shard in range(len(self.shards)) if not self.is_done(shard)]
+
+
+def _tmp_path(path):
+    # Unique across hosts sharing the shard directory, which may run workers with the same pid
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+
+def convert_shard(manifest, shard) -> str:
+    """Convert the messages of one shard into a run file sorted by date; return its path.
+
+    The run is written to a temporary file and renamed when complete, so a
+    run file always holds the whole shard. Messages failing to parse go to
+    the shard's quarantine, ``shard_NNNN_quarantine.mbox`` in the shard
+    directory or ``quarantine_dir``.
+    """
+    converter = manifest.converter()
+    start, stop = manifest.shards[shard]
+    claim_path = manifest.claim_path(shard)
+    next_refresh = time.monotonic() + CLAIM_REFRESH
+    with MboxSource(manifest.mbox_file) as source:
+        data = source._map or b""
+        if list(fingerprint(data, os.fstat(source._file.fileno()))) != manifest.mbox_fingerprint:
+            raise ValueError(f"mbox changed since the shards were planned: {manifest.mbox_file}")
+        refs = [
+            ref
+            for ref in source.scan_range(start, stop)
+            if in_range(ref.timestamp, converter.since, converter.until)
+        ]
+        # Stable, so messages with the same date keep their mbox order as in scan_sorted
+        refs.sort(key=lambda ref: ref.timestamp)
+
+        path = manifest.run_path(shard)
+        tmp_path = _tmp_path(path)
+        quarantine_name = os.path.join(
+            converter.quarantine_dir or manifest.directory,
+            os.path.basename(path)[: -len(".jsonl")],
+        )
+        try:
+            with (
+                open(tmp_path, "w", encoding="utf-8", buffering=RUN_BUFFER_SIZE) as f,
+                converter.open_quarantine(quarantine_name) as quarantine,
+            ):
+                for ref, raw in source.iter_raw(refs):
+                    if time.monotonic() >= next_refresh:
+                        # Shows other workers that this claim is alive
+                        with contextlib.suppress(FileNotFoundError):
+                            os.utime(claim_path)
+                        next_refresh = time.monotonic() + CLAIM_REFRESH
+                    record = converter.record_or_failure(raw, ref)
+                    if isinstance(record, Failure):
+                        quarantine.add(raw, record)
+                        continue
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, path)
+            summary = quarantine.summary()
+            if summary:
+                print(summary)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return path
+
+
+def run_worker(
+    manifest, shard: Optional[int] = None, claim_timeout: float = CLAIM_TIMEOUT
+) -> List[int]:
+    """Convert ``shard``, or claim and convert pending shards until none is left.
+
+    Claims of dead workers and claims without progress for ``claim_timeout``
+    seconds are taken over. Returns the shards converted by this worker.
+    """
+    if shard is not None:
+        if not 0 <= shard < len(manifest.shards):
+            raise ValueError(f"Unknown shard: {shard}")
+        convert_shard(manifest, shard)
+        return [shard]
+    converted = []
+    for pending in manifest.pending():
+        if manifest.claim(pending, claim_timeout):
+            convert_shard(manifest, pending)
+            converted.append(pending)
+    return converted
+
+
+def iter_run(path):
+    with open(path, "r", encoding="utf-8", buffering=RUN_BUFFER_SIZE) as f:
+        for line in f:
+            yield EmailRecord(*json.loads(line))
+
+
+def merge_runs(manifest):
+    """Merge the runs of all shards by date into the configured output files."""
+    missing = manifest.pending()
+    if missing:
+        raise ValueError(f"Shards not converted yet: {', '.join(map(str, missing))}")
+    converter = manifest.converter()
+    _check_no_export(converter)
+    runs = [iter_run(manifest.run_path(shard)) for shard in range(len(manifest.shards))]
+    # Shards are in mbox order, so ties by date keep the mbox order like scan_sorted
+    records = heapq.merge(*runs, key=lambda record: (record.timestamp, record.start))
+    converter.write_records(records)
+
+
+def _check_no_export(converter):
+    # Raw eml entries can't be rebuilt from the runs, and an export is limited by reading speed
+    if converter.export != "none":
+        raise ValueError("Sharded conversion writes output files; run --export without shards")
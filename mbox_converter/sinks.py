@@ -0,0 +1,225 @@
+"""Run plans writing several outputs in a single pass over the input.
+
+A run plan is configured with the ``sinks`` parameter, a list of mappings in
+the configuration file::
+
+    sinks:
+      - name: llm
+        format: txt
+        period: month
+      - name: analysts
+        format: csv
+        filters:
+          since: 2024-01-01
+          from: "@example\\.com$"
+      - name: metadata
+        format: csv
+        content: false
+
+Each sink overrides the output options of the main configuration: the field
+selection, format, rollover and chunking parameters in :data:`SINK_OPTIONS`.
+Its ``filters`` select the messages it receives. Messages are read, parsed
+and cleaned once and then handed to every sink; the output files of a sink are
+named ``<input>_<name>``.
+"""
+
+import copy
+import re
+from typing import Callable, List, Optional
+
+from mbox_converter.base import MboxConverter, _OutputFiles, day_start
+
+# Parameters a sink can override
+SINK_OPTIONS = {
+    "sent_from",
+    "to",
+    "date",
+    "subject",
+    "content",
+    "format",
+    "max_days",
+    "max_bytes",
+    "max_messages",
+    "period",
+    "chunk_tokens",
+    "token_estimator",
+}
+FILTERS = {"since", "until", "from", "to", "subject"}
+
+
+def build_filter(filters) -> Optional[Callable]:
+    """Turn a mapping of :data:`FILTERS` into a predicate on records, None if it is empty.
+
+    ``since`` and ``until`` are inclusive dates; ``from``, ``to`` and
+    ``subject`` are regular expressions searched in the respective field.
+    """
+    unknown = set(filters) - FILTERS
+    if unknown:
+        raise ValueError(f"Unknown filter: {', '.join(sorted(unknown))}")
+    checks = []
+    if filters.get("since") is not None:
+        since = day_start(filters["since"])
+        checks.append(lambda record: record.timestamp >= since)
+    if filters.get("until") is not None:
+        until = day_start(filters["until"]) + 86400
+        checks.append(lambda record: 0 < record.timestamp < until)
+    for field, name in [("sent_from", "from"), ("to", "to"), ("subject", "subject")]:
+        if filters.get(name) is not None:
+            search = re.compile(filters[name]).search
+            checks.append(lambda record, field=field, search=search: search(getattr(record, field)))
+    if not checks:
+        return None
+    return lambda record: all(check(record) for check in checks)
+
+
+class Sink:
+    """One output of a run plan: its output files and the filter selecting its messages."""
+
+    def __init__(self, name, output, accepts=None):
+        self.name = name
+        self.output = output
+        self.accepts = accepts
+
+    def write_batch(self, records):
+        if self.accepts is not None:
+            records = [record for record in records if self.accepts(record)]
+        if records:
+            self.output.write_batch(records)
+
+
+class RunPlan:
+    """Fan out every batch of records to several sinks.
+
+    Has the same interface as the output files of a single conversion, so
+    :meth:`MboxConverter.convert` and the async pipeline use either one. With
+    a ``redactor``, the filters of the sinks see the original fields and the
+    sinks receive the redacted records. With ``boilerplate``, a
+    :class:`~mbox_converter.boilerplate.BoilerplateOutput` sets the routed
+    records aside until all of them were counted, so they are redacted before
+    they reach its temporary file.
+    """
+
+    def __init__(self, sinks: List[Sink], redactor=None, boilerplate=None):
+        self.sinks = sinks
+        self.redactor = redactor
+        self.boilerplate = None
+        # Bit masks of the sinks accepting each record held back by the boilerplate stage
+        self._masks: List[int] = []
+        self._dispatched = 0
+        if boilerplate is not None:
+            from mbox_converter.boilerplate import BoilerplateOutput
+
+            min_count, sketch_bytes = boilerplate
+            self.boilerplate = BoilerplateOutput(_Dispatch(self), min_count, sketch_bytes)
+
+    @classmethod
+    def from_converter(cls, converter, redactor=None):
+        sinks = []
+        names = set()
+        for i, options in enumerate(converter.sinks, start=1):
+            options = dict(options)
+            name = str(options.pop("name", i))
+            if name in names:
+                raise ValueError(f"Duplicate sink name: {name}")
+            names.add(name)
+            accepts = build_filter(options.pop("filters", None) or {})
+            unknown = set(options) - SINK_OPTIONS
+            if unknown:
+                raise ValueError(f"Unknown option for sink {name}: {', '.join(sorted(unknown))}")
+
+            config = copy.copy(converter.config)
+            for key, value in options.items():
+                setattr(config, key, value)
+            config.sinks = []
+            output = _OutputFiles(MboxConverter(config), f"{converter.output_name}_{name}")
+            sinks.append(Sink(name, output, accepts))
+        boilerplate = None
+        if converter.boilerplate > 0:
+            boilerplate = (converter.boilerplate, converter.boilerplate_sketch_mb * 1024 * 1024)
+        return cls(sinks, redactor, boilerplate)
+
+    def write_batch(self, records):
+        masks = [self._route(record) for record in records]
+        if self.boilerplate is None:
+            if self.redactor is not None:
+                # Each record is redacted once, however many sinks accept it
+                records = [
+                    self.redactor.redact_record(record) if mask else record
+                    for record, mask in zip(records, masks)
+                ]
+            self._dispatch(records, masks)
+            return
+        if self.redactor is not None:
+            # All records are counted, so all of them are redacted before they are set aside
+            records = [self.redactor.redact_record(record) for record in records]
+        self._masks.extend(masks)
+        self.boilerplate.write_batch(records)
+
+    def finish(self):
+        if self.boilerplate is not None:
+            self.boilerplate.finish()
+        else:
+            self._finish_sinks()
+
+    def close(self):
+        if self.boilerplate is not None:
+            self.boilerplate.close()
+        else:
+            self._close_sinks()
+
+    def report(self):
+        if self.boilerplate is not None:
+            self.boilerplate.report()
+        else:
+            self._report_sinks()
+
+    def _route(self, record):
+        mask = 0
+        for i, sink in enumerate(self.sinks):
+            if sink.accepts is None or sink.accepts(record):
+                mask |= 1 << i
+        return mask
+
+    def _dispatch(self, records, masks):
+        for i, sink in enumerate(self.sinks):
+            selected = [record for record, mask in zip(records, masks) if mask >> i & 1]
+            if selected:
+                sink.output.write_batch(selected)
+
+    def _dispatch_held_back(self, records):
+        # The boilerplate stage returns the records in the order they were written
+        start = self._dispatched
+        self._dispatched += len(records)
+        self._dispatch(records, self._masks[start : self._dispatched])
+
+    def _finish_sinks(self):
+        for sink in self.sinks:
+            sink.output.finish()
+
+    def _close_sinks(self):
+        for sink in self.sinks:
+            sink.output.close()
+
+    def _report_sinks(self):
+        for sink in self.sinks:
+            print(f"Sink {sink.name}:")
+            sink.output.report()
+
+
+class _Dispatch:
+    # Output wrapped by the boilerplate stage of a run plan, handing its records to the sinks
+
+    def __init__(self, plan):
+        self.plan = plan
+
+    def write_batch(self, records):
+        self.plan._dispatch_held_back(records)
+
+    def finish(self):
+        self.plan._finish_sinks()
+
+    def close(self):
+        self.plan._close_sinks()
+
+    def report(self):
+        self.plan._report_sinks()
@@ -0,0 +1,505 @@
+"""Message sources that locate and read raw messages from mailboxes.
+
+A source first scans the mailbox for message boundaries and dates without
+parsing whole messages, and then reads individual raw messages on demand.
+Besides single mbox files, Maildir trees and directories of ``.eml`` files are
+supported; :func:`source_for` picks the source class for a path.
+"""
+
+import email
+import itertools
+import mailbox
+import math
+import mmap
+import os
+import random
+import re
+from collections import deque
+from email.utils import mktime_tz, parsedate_tz
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+# Threads reading message files in parallel, hiding per-file open latency
+READ_THREADS = 16
+# Message files read per thread task
+READ_BATCH_SIZE = 16
+# Bytes read at once while looking for the end of the header block
+HEAD_SIZE = 8192
+# Ways of picking the messages of a preview
+SAMPLE_MODES = ["first", "last", "random"]
+
+_FROM_LINE = re.compile(rb"^From ", re.MULTILINE)
+_END = object()
+_HEADER_END = re.compile(rb"\n\r?\n")
+_DATE_HEADER = re.compile(
+    rb"^Date:[ \t]*([^\r\n]*(?:\r?\n[ \t][^\r\n]*)*)", re.MULTILINE | re.IGNORECASE
+)
+
+
+class MessageRef(NamedTuple):
+    """Location and sort key of a single message inside a mailbox.
+
+    ``start`` and ``stop`` are byte offsets in the mbox file, or in the message
+    file ``path`` for sources keeping one message per file.
+    """
+
+    timestamp: int
+    start: int
+    stop: int
+    path: Optional[str] = None
+
+
+def parse_timestamp(date_header):
+    """Convert a Date header into a UTC timestamp, using 0 for missing or invalid dates."""
+    try:
+        return mktime_tz(parsedate_tz(date_header)) or 0
+    except Exception:
+        return 0
+
+
+def parse_message(raw):
+    """Parse the raw bytes of an mbox message, including its ``From`` line."""
+    from_line, _, body = raw.partition(b"\n")
+    msg = mailbox.mboxMessage(body.replace(mailbox.linesep, b"\n"))
+    msg.set_from(from_line.rstrip(b"\r")[5:].decode("ascii", errors="replace"))
+    return msg
+
+
+def parse_file_message(raw):
+    """Parse the raw bytes of a message stored in a file of its own."""
+    return email.message_from_bytes(raw)
+
+
+class MessageSource:
+    """Base class of all message sources.
+
+    Subclasses implement :meth:`scan` and :meth:`read`; :attr:`parse` turns
+    what :meth:`read` returns into an :class:`email.message.Message`.
+    """
+
+    parse = staticmethod(parse_message)
+
+    def __init__(self, path, read_threads=READ_THREADS, use_index=False):
+        self.path = path
+        self.read_threads = read_threads
+        self.use_index = use_index
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def scan(self) -> List[MessageRef]:
+        """Return references to all messages in mailbox order."""
+        raise NotImplementedError
+
+    def scan_sorted(self, since=None, until=None) -> List[MessageRef]:
+        """Return references to the messages dated ``since <= timestamp < until``, by date.
+
+        Without limits all messages are returned, undated ones first. With
+        ``until``, undated messages are left out.
+        """
+        refs = [ref for ref in self.scan() if in_range(ref.timestamp, since, until)]
+        refs.sort(key=lambda ref: ref.timestamp)
+        return refs
+
+    def head(self, n) -> List[MessageRef]:
+        """Return references to the first ``n`` messages in mailbox order."""
+        return self.scan()[:n]
+
+    def tail(self, n) -> List[MessageRef]:
+        """Return references to the last ``n`` messages in mailbox order."""
+        return self.scan()[-n:] if n > 0 else []
+
+    def sample(self, n, rng: random.Random) -> List[MessageRef]:
+        """Return references to ``n`` messages picked at random, in mailbox order."""
+        return _pick(self.scan(), n, rng)
+
+    def read(self, ref: MessageRef) -> bytes:
+        """Return the raw bytes of the referenced message."""
+        raise NotImplementedError
+
+    def read_many(self, refs) -> List[bytes]:
+        """Return the raw bytes of several messages."""
+        return [self.read(ref) for ref in refs]
+
+    def iter_raw(self, refs) -> Iterator[Tuple[MessageRef, bytes]]:
+        """Yield ``(ref, raw)`` for all ``refs`` in the given order."""
+        for ref in refs:
+            yield ref, self.read(ref)
+
+    def iter_heads(self, refs) -> Iterator[Tuple[MessageRef, bytes]]:
+        """Yield ``(ref, head)`` for all ``refs``, where ``head`` includes the message's headers.
+
+        Sources that can read the header block alone return little more than
+        it; others return the whole message.
+        """
+        return self.iter_raw(refs)
+
+
+class MboxSource(MessageSource):
+    """Scan and read messages of a single mbox file.
+
+    Boundaries follow the rules of :class:`mailbox.mbox`, so a message read
+    through this class is identical to the one ``mailbox.mbox`` yields.
+    """
+
+    def __init__(self, path, read_threads=READ_THREADS, use_index=False):
+        super().__init__(path, read_threads, use_index)
+        self._file = None
+        self._map = None
+
+    def open(self):
+        self._file = open(self.path, "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def scan(self):
+        if self._map is None:
+            return []
+        return self.scan_range(0, len(self._map))
+
+    def scan_range(self, start, stop) -> List[MessageRef]:
+        """Return references to the messages starting in the byte range ``[start, stop)``.
+
+        ``stop`` must be the end of the mbox or the start of a message.
+        """
+        data = self._map
+        if data is None:
+            return []
+        starts = [match.start() for match in _FROM_LINE.finditer(data, start, stop)]
+        ends = starts[1:] + [stop]
+        refs = []
+        for start, end in zip(starts, ends):
+            stop = _message_stop(data, start, end)
+            refs.append(MessageRef(_scan_timestamp(data, start, stop), start, stop))
+        return refs
+
+    def scan_sorted(self, since=None, until=None):
+        if not self.use_index or self._map is None:
+            return super().scan_sorted(since, until)
+        from mbox_converter.index import load_or_build
+
+        index = load_or_build(self.path, self._map, os.fstat(self._file.fileno()))
+        return index.refs(since, until)
+
+    def head(self, n):
+        if self._map is None or n <= 0:
+            return []
+        starts = []
+        for match in _FROM_LINE.finditer(self._map):
+            starts.append(match.start())
+            if len(starts) == n:
+                break
+        return [self._ref_at(start) for start in starts]
+
+    def tail(self, n):
+        data = self._map
+        if data is None or n <= 0:
+            return []
+        # Search backwards from the end for lines starting with "From "
+        starts = []
+        end = len(data)
+        while len(starts) < n:
+            pos = data.rfind(b"\nFrom ", 0, end + 4)
+            if pos < 0:
+                if data[:5] == b"From ":
+                    starts.append(0)
+                break
+            starts.append(pos + 1)
+            end = pos + 1
+        return [self._ref_at(start) for start in reversed(starts)]
+
+    def sample(self, n, rng):
+        """Pick messages from the sidecar index if it is current, else from the boundaries.
+
+        Sampling the boundaries only runs the ``From`` line search over the
+        mbox, without looking at any header.
+        """
+        data = self._map
+        if data is None or n <= 0:
+            return []
+        if self.use_index:
+            from mbox_converter.index import MessageIndex, fingerprint, index_path
+
+            stat = os.fstat(self._file.fileno())
+            index = MessageIndex.load(index_path(self.path), fingerprint(data, stat))
+            if index is not None:
+                picked = sorted(_pick(range(len(index)), n, rng), key=lambda i: index.starts[i])
+                return [
+                    MessageRef(
+                        index.timestamps[i], index.starts[i], index.starts[i] + index.lengths[i]
+                    )
+                    for i in picked
+                ]
+        starts = _reservoir((match.start() for match in _FROM_LINE.finditer(data)), n, rng)
+        return [self._ref_at(start) for start in starts]
+
+    def read(self, ref):
+        return self._map[ref.start : ref.stop]
+
+    def _ref_at(self, start):
+        data = self._map
+        match = _FROM_LINE.search(data, start + 1)
+        stop = _message_stop(data, start, match.start() if match else len(data))
+        return MessageRef(_scan_timestamp(data, start, stop), start, stop)
+
+
+class _FileSource(MessageSource):
+    """Messages stored one per file, read by a pool of threads.
+
+    Scanning reads the header block of every file to find its date, reading
+    prefetches whole files ahead of the consumer. Files are enumerated with
+    :func:`os.scandir` in name order, so messages with the same date keep a
+    stable order.
+    """
+
+    parse = staticmethod(parse_file_message)
+
+    def __init__(self, path, read_threads=READ_THREADS, use_index=False):
+        super().__init__(path, read_threads, use_index)
+        self._pool = None
+
+    def open(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self._pool = ThreadPoolExecutor(max(1, self.read_threads))
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+    def message_files(self) -> List[str]:
+        raise NotImplementedError
+
+    def scan(self):
+        paths = sorted(self.message_files())
+        refs = []
+        for batch in self._pool.map(_scan_files, _batches(paths)):
+            refs.extend(batch)
+        return refs
+
+    def head(self, n):
+        return _scan_files(sorted(self.message_files())[: max(0, n)])
+
+    def tail(self, n):
+        return _scan_files(sorted(self.message_files())[-n:] if n > 0 else [])
+
+    def sample(self, n, rng):
+        return _scan_files(_pick(sorted(self.message_files()), n, rng))
+
+    def read(self, ref):
+        with open(ref.path, "rb") as f:
+            return f.read()
+
+    def read_many(self, refs):
+        raw = []
+        for batch in self._pool.map(self._read_batch, _batches(refs)):
+            raw.extend(batch)
+        return raw
+
+    def iter_raw(self, refs):
+        return self._prefetch(refs, self._read_batch)
+
+    def iter_heads(self, refs):
+        return self._prefetch(refs, _read_heads)
+
+    def _prefetch(self, refs, read_batch):
+        batches = iter(_batches(refs))
+        pending: deque = deque()
+        for batch in batches:
+            pending.append((batch, self._pool.submit(read_batch, batch)))
+            if len(pending) >= self.read_threads:
+                break
+        while pending:
+            batch, future = pending.popleft()
+            upcoming = next(batches, None)
+            if upcoming is not None:
+                pending.append((upcoming, self._pool.submit(read_batch, upcoming)))
+            yield from zip(batch, future.result())
+
+    def _read_batch(self, refs):
+        return [self.read(ref) for ref in refs]
+
+
+class MaildirSource(_FileSource):
+    """Messages of a Maildir, including its Maildir++ subfolders such as ``.Sent``."""
+
+    def message_files(self):
+        paths = []
+        for folder in [self.path] + _maildir_subfolders(self.path):
+            for subdir in ("cur", "new"):
+                paths.extend(_list_files(os.path.join(folder, subdir)))
+        return paths
+
+
+class EmlDirectorySource(_FileSource):
+    """All ``.eml`` files in a directory and its subdirectories."""
+
+    def message_files(self):
+        paths = []
+        pending = [self.path]
+        while pending:
+            with os.scandir(pending.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        pending.append(entry.path)
+                    elif entry.name.lower().endswith(".eml") and entry.is_file():
+                        paths.append(entry.path)
+        return paths
+
+
+def sample_refs(source, mode, n, seed=None, since=None, until=None) -> List[MessageRef]:
+    """References to the first, last or ``n`` random messages of an open source.
+
+    Without a date range, messages are picked in mailbox order by seeking to
+    their boundaries, so the mailbox is not scanned as a whole. With ``since``
+    or ``until``, they are picked from the dated messages of the range.
+    """
+    if mode not in SAMPLE_MODES:
+        raise ValueError(f"Unknown sample mode: {mode}")
+    rng = random.Random(seed)
+    if since is not None or until is not None:
+        refs = source.scan_sorted(since, until)
+        if mode == "first":
+            return refs[: max(0, n)]
+        if mode == "last":
+            return refs[-n:] if n > 0 else []
+        return _pick(refs, n, rng)
+    if mode == "first":
+        return source.head(n)
+    if mode == "last":
+        return source.tail(n)
+    return source.sample(n, rng)
+
+
+def in_range(timestamp, since=None, until=None):
+    if since is not None and timestamp < since:
+        return False
+    return until is None or 0 < timestamp < until
+
+
+def is_maildir(path):
+    return os.path.isdir(os.path.join(path, "cur")) and os.path.isdir(os.path.join(path, "new"))
+
+
+def source_for(path):
+    """Source class for ``path``: a Maildir, a directory of ``.eml`` files or an mbox file."""
+    if os.path.isdir(path):
+        return MaildirSource if is_maildir(path) else EmlDirectorySource
+    return MboxSource
+
+
+def _maildir_subfolders(path):
+    with os.scandir(path) as entries:
+        return [
+            entry.path
+            for entry in entries
+            if entry.name.startswith(".") and entry.is_dir() and is_maildir(entry.path)
+        ]
+
+
+def _list_files(path):
+    if not os.path.isdir(path):
+        return []
+    with os.scandir(path) as entries:
+        return [
+            entry.path for entry in entries if not entry.name.startswith(".") and entry.is_file()
+        ]
+
+
+def _pick(items, n, rng):
+    """Pick ``n`` items of a sequence at random, keeping their order."""
+    return [items[i] for i in sorted(rng.sample(range(len(items)), min(max(0, n), len(items))))]
+
+
+def _reservoir(items, n, rng):
+    """Pick ``n`` items of an iterable of unknown length at random in one pass, keeping their order.
+
+    Uses reservoir sampling with geometric skips (algorithm L), so random
+    numbers are only drawn for items that enter the reservoir.
+    """
+    items = iter(items)
+    picked = list(enumerate(itertools.islice(items, n)))
+    if len(picked) < n or n <= 0:
+        return [item for _, item in picked]
+    position = n - 1
+    weight = math.exp(math.log(_uniform(rng)) / n)
+    while True:
+        skip = int(math.log(_uniform(rng)) / math.log(1 - weight))
+        item = next(itertools.islice(items, skip, None), _END)
+        if item is _END:
+            break
+        position += skip + 1
+        picked[rng.randrange(n)] = (position, item)
+        weight *= math.exp(math.log(_uniform(rng)) / n)
+    picked.sort(key=lambda entry: entry[0])
+    return [item for _, item in picked]
+
+
+def _uniform(rng):
+    # In the open interval (0, 1), as the logarithms above need
+    return rng.random() or 0.5
+
+
+def _batches(items):
+    return [items[i : i + READ_BATCH_SIZE] for i in range(0, len(items), READ_BATCH_SIZE)]
+
+
+def _scan_files(paths):
+    return [_scan_file(path) for path in paths]
+
+
+def _scan_file(path):
+    head, size = _read_head(path)
+    return MessageRef(_scan_timestamp(head, 0, len(head)), 0, size, path)
+
+
+def _read_heads(refs):
+    return [_read_head(ref.path)[0] for ref in refs]
+
+
+def _read_head(path):
+    # Blocks of the file up to the end of its header block, and the size of the file
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        head = f.read(HEAD_SIZE)
+        while len(head) < size and _HEADER_END.search(head) is None:
+            more = f.read(HEAD_SIZE)
+            if not more:
+                break
+            head += more
+    return head, size
+
+
+def _message_stop(data, start, end):
+    # mailbox.mbox drops a single empty line separating a message from the next one
+    sep = mailbox.linesep
+    if end - start > len(sep) and data[end - 2 * len(sep) : end] == sep + sep:
+        return end - len(sep)
+    return end
+
+
+def _scan_timestamp(data, start, stop):
+    header_end = _HEADER_END.search(data, start, stop)
+    end = header_end.start() + 1 if header_end else stop
+    match = _DATE_HEADER.search(data, start, end)
+    if match is None:
+        return 0
+    return parse_timestamp(match.group(1).decode("ascii", errors="replace"))
@@ -0,0 +1,327 @@
+"""Statistics of an archive computed from message headers only.
+
+``mbox_converter stats archive.mbox`` reports messages per day and month, the
+top senders, a histogram of message sizes and how many output files the
+configured rollover limits would produce, without parsing or rendering any
+message body.
+
+The statistics work on columns of timestamps, sizes and interned sender ids
+held in NumPy arrays. For mbox files the columns come straight from the
+sidecar index (see :mod:`mbox_converter.index`), so repeated runs on a large
+archive only read the index.
+"""
+
+import datetime
+import os
+from typing import Callable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError as error:  # pragma: no cover - depends on the installation
+    raise ImportError(
+        "The stats command requires NumPy: pip install mbox_converter[stats]"
+    ) from error
+
+from mbox_converter.index import (
+    MessageIndex,
+    from_header,
+    load_or_build,
+    sender_address,
+    sender_hash,
+)
+from mbox_converter.sources import MboxSource, MessageRef
+
+# Local dates are looked up once per quarter hour, the finest UTC offset granularity
+_BUCKET = 900
+# Ordinal of datetime.min, the date MaxDaysPolicy uses for undated messages
+_UNDATED_DAY = 1
+_UNDATED_PERIOD = -1
+
+
+class ArchiveStats:
+    """Aggregates over the timestamp, size and sender columns of an archive.
+
+    ``timestamps`` must be sorted, as returned by the message sources; 0 marks
+    an undated message. ``senders`` holds sender hashes, which are interned into
+    small integer ids. ``sender_name`` maps the position of a message to its
+    sender address, to name the top senders.
+    """
+
+    def __init__(self, timestamps, sizes, senders, sender_name: Optional[Callable] = None):
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        hashes, first, sender_ids, counts = np.unique(
+            np.asarray(senders, dtype=np.uint64),
+            return_index=True,
+            return_inverse=True,
+            return_counts=True,
+        )
+        self.sender_ids = sender_ids.reshape(-1).astype(np.int32)
+        self.sender_hashes = hashes
+        self.sender_counts = counts
+        self._sender_first = first
+        self.sender_name = sender_name
+        self.days = local_days(self.timestamps)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def undated(self) -> int:
+        return int(np.count_nonzero(self.timestamps == 0))
+
+    @property
+    def total_bytes(self) -> int:
+        return int(self.sizes.sum())
+
+    def per_day(self) -> List[Tuple[datetime.date, int]]:
+        """Number of dated messages for every day with mail, in date order."""
+        days, counts = np.unique(self.days[self.timestamps != 0], return_counts=True)
+        return [
+            (datetime.date.fromordinal(int(day)), int(count)) for day, count in zip(days, counts)
+        ]
+
+    def per_month(self) -> List[Tuple[str, int]]:
+        """Number of dated messages per ``YYYY-MM`` month, in date order."""
+        months = period_keys(self.days[self.timestamps != 0], "month")
+        keys, counts = np.unique(months, return_counts=True)
+        return [
+            (f"{key // 12:04d}-{key % 12 + 1:02d}", int(count)) for key, count in zip(keys, counts)
+        ]
+
+    def top_senders(self, n=10) -> List[Tuple[str, int]]:
+        """The ``n`` most frequent senders with their message counts.
+
+        Senders with the same count are ordered by their first message.
+        """
+        order = np.lexsort((self._sender_first, -self.sender_counts))[:n]
+        top = []
+        for i in order:
+            if self.sender_name is not None:
+                name = self.sender_name(int(self._sender_first[i]))
+            else:
+                name = f"{int(self.sender_hashes[i]):016x}"
+            top.append((name or "(unknown)", int(self.sender_counts[i])))
+        return top
+
+    def size_histogram(self) -> List[Tuple[int, int, int]]:
+        """``(lower, upper, count)`` for power-of-two size bins, ``lower <= size < upper``."""
+        if not len(self):
+            return []
+        bins = np.zeros(len(self.sizes), dtype=np.int64)
+        positive = self.sizes > 0
+        bins[positive] = np.floor(np.log2(self.sizes[positive])).astype(np.int64) + 1
+        counts = np.bincount(bins)
+        return [
+            (0 if i == 0 else 1 << (i - 1), 1 << i, int(count))
+            for i, count in enumerate(counts)
+            if count
+        ]
+
+    def simulate_rollover(
+        self, max_days=-1, max_bytes=-1, max_messages=-1, period="none"
+    ) -> np.ndarray:
+        """Number of messages in each output file the rollover limits would produce.
+
+        Mirrors :mod:`mbox_converter.rollover`, with each limit jumping to its
+        next file boundary. ``max_bytes`` is applied to the raw message sizes,
+        so it estimates an upper bound of the number of files: rendered
+        messages are smaller than their raw form.
+        """
+        n = len(self)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        limits: List[Callable[[int], int]] = []
+        if period and period != "none":
+            keys = period_keys(self.days, period)
+            keys[self.timestamps == 0] = _UNDATED_PERIOD
+            changes = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+            changes = np.append(changes, n)
+            limits.append(lambda i: int(changes[np.searchsorted(changes, i, side="right")]))
+        if max_days is not None and max_days >= 0:
+            days = self.days
+            if np.all(days[1:] >= days[:-1]):
+                limits.append(
+                    lambda i: int(np.searchsorted(days, days[i] + max_days, side="right"))
+                )
+            else:
+                # Dates before 1970 sort before undated messages
+                limits.append(lambda i: _next_day_rollover(days, i, max_days))
+        if max_messages is not None and max_messages > 0:
+            limits.append(lambda i: i + max_messages)
+        if max_bytes is not None and max_bytes > 0:
+            offsets = np.concatenate(([0], np.cumsum(self.sizes)))
+            limits.append(lambda i: int(np.searchsorted(offsets, offsets[i] + max_bytes)))
+
+        if not limits:
+            return np.array([n], dtype=np.int64)
+        starts = [0]
+        i = 0
+        while True:
+            i = min(max(i + 1, min(limit(i) for limit in limits)), n)
+            if i >= n:
+                break
+            starts.append(i)
+        return np.diff(np.append(starts, n))
+
+    def report(self, top=10, rollover=None) -> str:
+        """Text summary of the statistics.
+
+        ``rollover`` holds keyword arguments of :meth:`simulate_rollover`.
+        """
+        lines = [f"Messages: {len(self)} ({self.undated} undated), {format_size(self.total_bytes)}"]
+        per_day = self.per_day()
+        if per_day:
+            counts = [count for _, count in per_day]
+            lines.append(
+                f"Dates: {per_day[0][0]} to {per_day[-1][0]}, {len(per_day)} day(s) with mail, "
+                f"up to {max(counts)} message(s) per day"
+            )
+            lines.append("Busiest days:")
+            busiest = sorted(per_day, key=lambda item: -item[1])[:top]
+            lines.extend(f"  {day}  {count:>8}" for day, count in busiest)
+            lines.append("Messages per month:")
+            lines.extend(f"  {month}  {count:>8}" for month, count in self.per_month())
+        lines.append("Top senders:")
+        lines.extend(f"  {count:>8}  {name}" for name, count in self.top_senders(top))
+        lines.append("Message sizes:")
+        lines.extend(
+            f"  {format_size(lower):>10} - {format_size(upper):>10}  {count:>8}"
+            for lower, upper, count in self.size_histogram()
+        )
+        if rollover:
+            files = self.simulate_rollover(**rollover)
+            limits = ", ".join(f"{key}={value}" for key, value in rollover.items())
+            lines.append(f"Rollover ({limits}): {len(files)} file(s)")
+            if len(files):
+                lines.append(
+                    f"  messages per file: min {int(files.min())}, "
+                    f"median {int(np.median(files))}, max {int(files.max())}"
+                )
+        return "\n".join(lines)
+
+
+def local_days(timestamps) -> np.ndarray:
+    """Ordinal of the local date of every timestamp; undated messages get ``datetime.min``."""
+    buckets, inverse = np.unique(timestamps // _BUCKET, return_inverse=True)
+    ordinals = np.fromiter(
+        (_local_ordinal(int(bucket) * _BUCKET) for bucket in buckets), np.int64, len(buckets)
+    )
+    days = ordinals[inverse.reshape(-1)]
+    days[timestamps == 0] = _UNDATED_DAY
+    return days
+
+
+def period_keys(days, period) -> np.ndarray:
+    """Key of the day, ISO week, month or year every day ordinal falls into."""
+    if period == "day":
+        return np.array(days, dtype=np.int64)
+    unique, inverse = np.unique(days, return_inverse=True)
+    dates = [datetime.date.fromordinal(int(day)) for day in unique]
+    if period == "week":
+        keys = [date.isocalendar()[0] * 53 + date.isocalendar()[1] for date in dates]
+    elif period == "month":
+        keys = [date.year * 12 + date.month - 1 for date in dates]
+    elif period == "year":
+        keys = [date.year for date in dates]
+    else:
+        raise ValueError(f"Unknown rollover period: {period}")
+    return np.array(keys, dtype=np.int64).reshape(-1)[inverse.reshape(-1)]
+
+
+def format_size(size) -> str:
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if size < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def build_report(converter, top=10) -> str:
+    """Statistics report of the converter's input, limited to its date range.
+
+    The rollover simulation uses the converter's ``max_days``, ``max_bytes``,
+    ``max_messages`` and ``period``.
+    """
+    rollover = {}
+    for name, disabled in [
+        ("max_days", -1),
+        ("max_bytes", -1),
+        ("max_messages", -1),
+        ("period", "none"),
+    ]:
+        value = getattr(converter, name)
+        if value is not None and value != disabled:
+            rollover[name] = value
+
+    with converter.open_source() as source:
+        stats = collect_stats(source, converter.since, converter.until)
+        return stats.report(top, rollover)
+
+
+def collect_stats(source, since=None, until=None) -> ArchiveStats:
+    """Read the header columns of an open message source into :class:`ArchiveStats`.
+
+    Mbox files use the sidecar index (if the source is configured to use it)
+    or a header scan; other sources read the header block of every message file.
+    Top senders are named by reading their messages, so the source must still
+    be open when they are requested.
+    """
+    if isinstance(source, MboxSource):
+        columns, refs = _mbox_columns(source, since, until)
+    else:
+        columns, refs = _file_columns(source, since, until)
+
+    def sender_name(position):
+        return sender_address(from_header(source.read(refs(position))))
+
+    return ArchiveStats(*columns, sender_name=sender_name)
+
+
+def _mbox_columns(source, since, until):
+    data = source._map
+    if data is None:
+        index = MessageIndex.build(b"")
+    elif source.use_index:
+        index = load_or_build(source.path, data, os.fstat(source._file.fileno()))
+    else:
+        index = MessageIndex.build(data)
+    timestamps = np.frombuffer(index.timestamps, dtype=np.int64)
+    starts = np.frombuffer(index.starts, dtype=np.int64)
+    lengths = np.frombuffer(index.lengths, dtype=np.int64)
+    senders = np.frombuffer(index.senders, dtype=np.uint64)
+
+    lo = 0 if since is None else int(np.searchsorted(timestamps, since))
+    hi = len(timestamps)
+    if until is not None:
+        hi = int(np.searchsorted(timestamps, until))
+        lo = max(lo, int(np.searchsorted(timestamps, 0, side="right")))
+    hi = max(lo, hi)
+
+    def refs(position):
+        i = lo + position
+        return MessageRef(int(timestamps[i]), int(starts[i]), int(starts[i] + lengths[i]))
+
+    return (timestamps[lo:hi], lengths[lo:hi], senders[lo:hi]), refs
+
+
+def _file_columns(source, since, until):
+    refs = source.scan_sorted(since, until)
+    senders = np.zeros(len(refs), dtype=np.uint64)
+    for i, (_, head) in enumerate(source.iter_heads(refs)):
+        senders[i] = sender_hash(from_header(head))
+    timestamps = np.fromiter((ref.timestamp for ref in refs), np.int64, len(refs))
+    sizes = np.fromiter((ref.stop - ref.start for ref in refs), np.int64, len(refs))
+    return (timestamps, sizes, senders), refs.__getitem__
+
+
+def _local_ordinal(timestamp):
+    try:
+        return datetime.datetime.fromtimestamp(timestamp).toordinal()
+    except (OverflowError, OSError, ValueError):
+        return _UNDATED_DAY
+
+
+def _next_day_rollover(days, i, max_days):
+    limit = days[i] + max_days
+    later = np.flatnonzero(days[i + 1 :] > limit)
+    return i + 1 + int(later[0]) if len(later) else len(days)
@@ -0,0 +1,199 @@
+"""Output writer backends and their registry.
+
+A writer renders batches of :class:`~mbox_converter.base.EmailRecord` into an
+output file. Backends are registered under the name of their output format
+with :func:`register_writer`. Third-party packages can provide additional
+backends through the ``mbox_converter.writers`` entry point group, e.g.::
+
+    [project.entry-points."mbox_converter.writers"]
+    jsonl = "my_package.writers:JsonlWriter"
+"""
+
+import os
+from operator import attrgetter
+from typing import Callable, Dict, List, Sequence, Type
+
+ENTRY_POINT_GROUP = "mbox_converter.writers"
+
+# Output files are written through a buffer of this size, in large blocks
+WRITE_BUFFER_SIZE = 1 << 20
+
+_WRITERS: Dict[str, Type["OutputWriter"]] = {}
+
+
+class OutputWriter:
+    """Base class of all output writer backends.
+
+    Subclasses implement :meth:`render` or :meth:`render_batch`; opening, rolling over, closing
+    and byte accounting are handled here. Output files are written in binary
+    mode, with ``newline`` controlling how ``"\\n"`` is translated (``None``
+    for the platform line separator, ``""`` for no translation). Each batch is
+    encoded once and appended to a buffer of :data:`WRITE_BUFFER_SIZE` bytes,
+    which is flushed to the file when full.
+    """
+
+    extension: str = ""
+    newline = None
+    encoding = "utf-8"
+
+    def __init__(self, include_options):
+        self.include_options = include_options
+        self.path = None
+        self.bytes_written = 0
+        self.records_written = 0
+        self._file = None
+        self._linesep = os.linesep if self.newline is None else "\n"
+
+    def open(self, path):
+        """Start a new output file."""
+        self._file = open(path, "wb", buffering=WRITE_BUFFER_SIZE)
+        self.path = path
+        self.bytes_written = 0
+        self.records_written = 0
+        header = self.render_header()
+        if header:
+            self._write(header)
+
+    def write_batch(self, records):
+        """Render and write a batch of records with a single write call."""
+        self._write(self.render_batch(records))
+        self.records_written += len(records)
+
+    def rollover(self, path):
+        """Close the current output file and continue in a new one."""
+        self.close()
+        self.open(path)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def render_header(self) -> str:
+        return ""
+
+    def render(self, record) -> str:
+        raise NotImplementedError
+
+    def render_batch(self, records) -> str:
+        return "".join(map(self.render, records))
+
+    def _write(self, text):
+        if self._linesep != "\n":
+            text = text.replace("\n", self._linesep)
+        data = text.encode(self.encoding)
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+
+def compile_renderer(template: str, values: Sequence[Callable]) -> Callable[..., str]:
+    """Build a render function filling the ``{}`` fields of ``template`` from a record.
+
+    ``values`` holds one function per field, returning its value for a record.
+    Writers build the template once from their options, so rendering a record
+    is a single ``str.format`` call without per-field checks.
+    """
+    format_ = template.format
+    if len(values) == 1:
+        (value,) = values
+        return lambda record: format_(value(record))
+    return lambda record: format_(*[value(record) for value in values])
+
+
+def register_writer(name):
+    """Class decorator registering a writer backend for the output format ``name``."""
+
+    def decorator(cls):
+        cls.extension = cls.extension or name
+        _WRITERS[name] = cls
+        return cls
+
+    return decorator
+
+
+def _entry_points():
+    # importlib.metadata is slow to import and to scan, so only use it when needed
+    from importlib.metadata import entry_points
+
+    return entry_points(group=ENTRY_POINT_GROUP)
+
+
+def _load_entry_points():
+    for entry_point in _entry_points():
+        if entry_point.name not in _WRITERS:
+            register_writer(entry_point.name)(entry_point.load())
+
+
+def get_writer(name) -> Type[OutputWriter]:
+    """Return the writer class registered for the output format ``name``."""
+    if name not in _WRITERS:
+        _load_entry_points()
+    try:
+        return _WRITERS[name]
+    except KeyError:
+        raise ValueError(f"Unknown output format: {name}") from None
+
+
+def available_formats(discover=True) -> List[str]:
+    """Names of all registered output formats, plus installed plugins if ``discover`` is set."""
+    names = list(_WRITERS)
+    if discover:
+        names.extend(ep.name for ep in _entry_points() if ep.name not in names)
+    return names
+
+
+@register_writer("txt")
+class TxtWriter(OutputWriter):
+    """Plain text blocks with the selected header fields followed by the content."""
+
+    # Header lines and their values, in output order
+    FIELDS = [
+        ("from", "From: {}\n", attrgetter("sent_from")),
+        ("to", "To: {}\n", attrgetter("to")),
+        ("date", "Date: {}\n", lambda r: r.date or "Unknown"),
+        ("subject", "Subject: {}\n", attrgetter("subject")),
+    ]
+
+    def __init__(self, include_options):
+        super().__init__(include_options)
+        fields = [(line, value) for option, line, value in self.FIELDS if include_options[option]]
+        if include_options.get("content", True):
+            fields.append(("\n{}\n", attrgetter("content")))
+        self.render = compile_renderer(
+            "".join(line for line, _ in fields) + "-----\n\n", [value for _, value in fields]
+        )
+
+
+@register_writer("csv")
+class CsvWriter(OutputWriter):
+    """One quoted CSV row per message."""
+
+    newline = ""
+
+    # Column names and values, in output order
+    FIELDS = [
+        ("from", "From", attrgetter("sent_from")),
+        ("to", "To", attrgetter("to")),
+        ("date", "Date", lambda r: r.date or ""),
+        ("subject", "Subject", lambda r: r.subject.replace('"', '""')),
+        ("content", "Content", lambda r: r.content.replace('"', '""').replace("\n", " ").strip()),
+    ]
+
+    def __init__(self, include_options):
+        super().__init__(include_options)
+        self.columns = [
+            (name, value)
+            for option, name, value in self.FIELDS
+            if include_options.get(option, True)
+        ]
+        if not self.columns:
+            raise ValueError("CSV output needs at least one field or the content")
+        values = [value for _, value in self.columns]
+        self.render = compile_renderer(",".join(['"{}"'] * len(values)) + "\n", values)
+        self._field_renderers = [compile_renderer('"{}"', [value]) for value in values]
+
+    def render_header(self):
+        return ",".join(name for name, _ in self.columns) + "\n"
+
+    def fields(self, record):
+        return [render(record) for render in self._field_renderers]
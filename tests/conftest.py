@@ -12,3 +12,51 @@ def go_to_tmpdir(request):
     # Chdir only for the duration of the test.
     with tmpdir.as_cwd():
         yield
+
+
+SAMPLE_MESSAGES = [
+    (
+        "alice@example.com",
+        "bob@example.com",
+        "Thu, 04 Jan 2024 12:00:00 +0000",
+        "Second",
+        "Later text",
+    ),
+    (
+        "bob@example.com",
+        "alice@example.com",
+        "Mon, 01 Jan 2024 12:00:00 +0000",
+        "First",
+        "Hello\nBob",
+    ),
+    (
+        "carol@example.com",
+        "bob@example.com",
+        "not a date",
+        "No date",
+        '<p>Some "quoted" <b>HTML</b></p>',
+    ),
+    (
+        "alice@example.com",
+        "carol@example.com",
+        "Fri, 01 Mar 2024 08:30:00 +0100",
+        "Re: First",
+        "Reply",
+    ),
+]
+
+
+def write_mbox(path, messages=SAMPLE_MESSAGES):
+    """Write a small mbox file with one message per (from, to, date, subject, body) tuple."""
+    with open(path, "w", encoding="utf-8", newline="\n") as f:
+        for sender, recipient, date, subject, body in messages:
+            f.write(f"From {sender} Mon Jan  1 00:00:00 2024\n")
+            f.write(f"From: {sender}\nTo: {recipient}\nDate: {date}\nSubject: {subject}\n")
+            f.write("Content-Type: text/plain; charset=utf-8\n\n")
+            f.write(f"{body}\n\n")
+    return str(path)
+
+
+@pytest.fixture
+def sample_mbox(tmpdir):
+    return write_mbox(tmpdir / "sample.mbox")
@@ -1,4 +1,4 @@
-from unittest.mock import Mock, patch
+from unittest.mock import Mock
 
 import pytest
 
@@ -11,7 +11,7 @@ from mbox_converter.base import (
 )
 from mbox_converter.base import NAME
 from mbox_converter.config import ConfigParameterManager
-
+from tests.conftest import write_mbox
 
 # install pytest and pytest-mock and run tests manually from the terminal:
 # pip install pytest pytest-mock
@@ -100,56 +100,110 @@ def test_build_csv_output(mock_email):
     assert "Test Subject" in fields[3]
 
 
-@patch("mbox_converter.base.mailbox.mbox")
-@patch("mbox_converter.base.open", create=True)
-def test_parse_creates_output(mock_open, mock_mbox, mocker):
-    fake_email = Mock()
-    fake_email.get.side_effect = lambda x, d=None: {
-        "from": "a@a.com",
-        "to": "b@b.com",
-        "date": "Mon, 05 Jun 2023 12:34:56 +0000",
-        "subject": "Test",
-    }.get(x, d)
-    fake_email.walk.return_value = [
-        Mock(get_payload=lambda decode: b"Text", get_content_maintype=lambda: "text")
-    ]
+def test_parse_creates_output(sample_mbox, mocker):
+    mock_open = mocker.patch("mbox_converter.writers.open", mocker.mock_open())
 
-    mock_mbox.return_value = [fake_email]
-    mock_file = mock_open.return_value.__enter__.return_value
-
-    config = ConfigParameterManager()
+    config = ConfigParameterManager(mbox_file=sample_mbox)
     parser = MboxConverter(config)
     parser.convert()
 
     assert mock_open.called
-    # assert mock_file.write.called
-
-
-def test_max_days_split(mocker):
-    """Test splitting by max_days across multiple mock emails."""
-    email1 = Mock()
-    email2 = Mock()
-    email1.get.side_effect = email2.get.side_effect = lambda x, d=None: {
-        "from": "a@a.com",
-        "to": "b@b.com",
-        "date": "Mon, 01 Jan 2024 12:00:00 +0000",
-        "subject": "First",
-    }.get(x, d)
-    email2.get = lambda x, d=None: {
-        "from": "a@a.com",
-        "to": "b@b.com",
-        "date": "Thu, 04 Jan 2024 12:00:00 +0000",  # 3 days later
-        "subject": "Second",
-    }.get(x, d)
-    email1.walk.return_value = email2.walk.return_value = [
-        Mock(get_payload=lambda decode: b"Text", get_content_maintype=lambda: "text")
-    ]
-
-    mocker.patch("mbox_converter.base.mailbox.mbox", return_value=[(email1), (email2)])
-    mock_open = mocker.patch("mbox_converter.base.open", mocker.mock_open())
-    config = ConfigParameterManager()
+    assert mock_open.return_value.write.called
+
+
+def test_max_days_split(tmpdir, mocker):
+    """Test splitting by max_days across multiple emails."""
+    mbox_file = write_mbox(
+        tmpdir / "split.mbox",
+        [
+            ("a@a.com", "b@b.com", "Mon, 01 Jan 2024 12:00:00 +0000", "First", "Text"),
+            ("a@a.com", "b@b.com", "Thu, 04 Jan 2024 12:00:00 +0000", "Second", "Text"),
+        ],
+    )
+    mock_open = mocker.patch("mbox_converter.writers.open", mocker.mock_open())
+    config = ConfigParameterManager(mbox_file=mbox_file)
     config.max_days = 2
     parser = MboxConverter(config)
     parser.convert()
 
     assert mock_open.call_count >= 2  # Should open two output files
+
+
+def test_iter_records(sample_mbox):
+    config = ConfigParameterManager(mbox_file=sample_mbox)
+    records = list(MboxConverter(config).iter_records())
+
+    assert [record.subject for record in records] == ["No date", "First", "Second", "Re: First"]
+    first = records[1]
+    assert first.sent_from == "bob@example.com"
+    assert first.to == "alice@example.com"
+    assert first.date == "2024-01-01"
+    assert first.content == "Hello\nBob"
+    assert first.timestamp == 1704110400
+    with open(sample_mbox, "rb") as f:
+        f.seek(first.start)
+        assert f.read(first.stop - first.start).startswith(b"From bob@example.com")
+    assert records[0].date is None
+    assert records[0].content == 'Some "quoted" HTML'
+
+
+def test_preview_renders_like_conversion(sample_mbox):
+    config = ConfigParameterManager(mbox_file=sample_mbox, format="csv", content=False)
+    converter = MboxConverter(config)
+    records = converter.preview_records("first", 2)
+    assert [record.subject for record in records] == ["Second", "First"]
+    assert converter.render_preview(records) == (
+        "From,To,Date,Subject\n"
+        '"alice@example.com","bob@example.com","2024-01-04","Second"\n'
+        '"bob@example.com","alice@example.com","2024-01-01","First"\n'
+    )
+
+    config = ConfigParameterManager(mbox_file=sample_mbox, period="month")
+    converter = MboxConverter(config)
+    converter.convert()
+    records = converter.preview_records("last", 1)
+    with open("sample_2024-03_001.txt", encoding="utf-8") as f:
+        assert converter.render_preview(records) == f.read()
+
+
+def test_iter_records_does_not_write_files(sample_mbox, mocker):
+    mock_open = mocker.patch("mbox_converter.writers.open", mocker.mock_open())
+    config = ConfigParameterManager(mbox_file=sample_mbox)
+    assert len(list(MboxConverter(config).iter_records())) == 4
+    assert not mock_open.called
+
+
+@pytest.mark.parametrize("pipeline", ["sync", "async"])
+def test_convert_maildir_and_eml_directory_like_mbox(tmpdir, sample_mbox, pipeline):
+    import asyncio
+    import mailbox
+
+    maildir = mailbox.Maildir(str(tmpdir / "Maildir"))
+    (tmpdir / "eml").mkdir()
+    for i, message in enumerate(mailbox.mbox(sample_mbox)):
+        maildir.add(mailbox.MaildirMessage(message))
+        (tmpdir / "eml" / f"{i}.eml").write_binary(message.as_bytes())
+
+    for mbox_file in [sample_mbox, str(tmpdir / "Maildir") + "/", str(tmpdir / "eml")]:
+        converter = MboxConverter(ConfigParameterManager(mbox_file=mbox_file, read_threads=2))
+        if pipeline == "async":
+            asyncio.run(converter.convert_async())
+        else:
+            converter.convert()
+    expected = (tmpdir / "sample_001.txt").read_binary()
+    assert (tmpdir / "Maildir_001.txt").read_binary() == expected
+    assert (tmpdir / "eml_001.txt").read_binary() == expected
+
+
+def test_dotenv_loaded_once_and_only_when_needed(mocker, monkeypatch):
+    import mbox_converter.base as base
+
+    monkeypatch.setattr(base, "_env_loaded", False)
+    load_dotenv = mocker.patch("dotenv.load_dotenv")
+
+    MboxConverter(ConfigParameterManager(date_format="%Y"))
+    assert not load_dotenv.called
+
+    MboxConverter(ConfigParameterManager(date_format=""))
+    MboxConverter(ConfigParameterManager(date_format=""))
+    assert load_dotenv.call_count == 1
@@ -0,0 +1,88 @@
+import asyncio
+import glob
+
+from mbox_converter.base import MboxConverter
+from mbox_converter.boilerplate import BoilerplateFilter, CountMinSketch, normalize
+from mbox_converter.config import ConfigParameterManager
+from tests.conftest import write_mbox
+
+DISCLAIMER = (
+    "This e-mail may contain confidential information.\n"
+    "If you are not the intended recipient, please delete it."
+)
+FOOTER = "Mailing list 42: unsubscribe at https://lists.example.com"
+
+
+def message(i, body):
+    return (
+        f"user{i}@example.com",
+        "list@example.com",
+        f"Mon, 0{i + 1} Jan 2024 12:00:00 +0000",
+        f"Topic {i}",
+        body,
+    )
+
+
+def archive(tmpdir):
+    messages = [
+        message(0, f"First question about the release plan\n\n{DISCLAIMER}"),
+        message(1, f"Second text, written by someone else\n{FOOTER}"),
+        message(2, f"Thanks,\nThird answer with a longer line of text\n\n{DISCLAIMER}"),
+        message(3, f"Fourth\n\n  {DISCLAIMER.upper()}  \n{FOOTER}"),
+        message(4, "Fifth message without any footer at all"),
+    ]
+    return write_mbox(tmpdir / "list.mbox", messages)
+
+
+def test_count_min_sketch():
+    sketch = CountMinSketch(64)
+    keys = [f"key {i}".encode() for i in range(100)]
+    for repeat in range(1, 5):
+        sketch.add_all(key for i, key in enumerate(keys) if i % 5 >= repeat)
+    assert all(count >= i % 5 for i, count in enumerate(sketch.counts(keys)))
+    exact = CountMinSketch(1 << 20)
+    exact.add_all([b"a", b"a"])
+    assert (exact.count(b"a"), exact.count(b"b")) == (2, 0)
+
+
+def test_filter_removes_repeated_paragraphs_and_lines():
+    assert normalize("  Ticket  #1234\tOPEN ") == "ticket #1234 open"
+    contents = [
+        f"Unique text number one\n\n{DISCLAIMER}",
+        f"Another unique text\n{FOOTER}\n\n{DISCLAIMER}",
+        f"Thanks,\nThanks,\n{FOOTER}",
+    ]
+    boilerplate = BoilerplateFilter(2, 1 << 16)
+    for content in contents:
+        boilerplate.add(content)
+    expected = ["Unique text number one", "Another unique text", "Thanks,\nThanks,"]
+    assert [boilerplate.strip(content) for content in contents] == expected
+    assert (boilerplate.paragraphs_removed, boilerplate.lines_removed) == (2, 2)
+    assert boilerplate.bytes_removed == sum(map(len, contents)) - sum(map(len, expected))
+    assert boilerplate.summary().startswith(f"Removed {boilerplate.bytes_removed} bytes")
+    assert boilerplate.strip("Unique text number one") == "Unique text number one"
+
+
+def test_conversion_without_boilerplate(tmpdir, capsys):
+    mbox_file = archive(tmpdir)
+    config = ConfigParameterManager(mbox_file=mbox_file, boilerplate=2, format="csv")
+    MboxConverter(config).convert()
+    output = open("list_001.csv", encoding="utf-8").read()
+    assert "confidential" not in output.lower() and "unsubscribe" not in output
+    assert "Thanks, Third answer with a longer line of text" in output
+    assert "Fifth message without any footer at all" in output
+    assert (
+        # The disclaimer of the fourth message shares its paragraph with the footer
+        "bytes of boilerplate from 4 message(s): 2 paragraph(s), 4 line(s)."
+        in capsys.readouterr().out
+    )
+
+    # The async pipeline writes the same output
+    config.boilerplate = 3
+    MboxConverter(config).convert()
+    expected = open("list_001.csv", encoding="utf-8").read()
+    assert "unsubscribe" in expected and "confidential" not in expected
+    for path in glob.glob("list_*.csv"):
+        (tmpdir / path).remove()
+    asyncio.run(MboxConverter(config).convert_async())
+    assert open("list_001.csv", encoding="utf-8").read() == expected
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+import mbox_converter.cache as cache_module
+from mbox_converter.base import MboxConverter
+from mbox_converter.cache import RecordCache
+from mbox_converter.config import ConfigParameterManager
+
+FIELDS = ("a@a.com", "b@b.com", "2024-01-01", "Subject", "Content")
+
+
+def test_cache_round_trip(tmpdir):
+    path = str(tmpdir / "cache.sqlite")
+    with RecordCache(path, 1 << 20, "variant") as cache:
+        key = cache.key(b"raw message")
+        assert cache.get_many([key]) == {}
+        cache.put_many([(key, FIELDS)])
+
+    with RecordCache(path, 1 << 20, "variant") as cache:
+        assert cache.get_many([key, cache.key(b"other")]) == {key: FIELDS}
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    with RecordCache(path, 1 << 20, "other variant") as cache:
+        assert cache.key(b"raw message") != key
+        assert cache.get_many([cache.key(b"raw message")]) == {}
+
+
+def test_cache_version_change_drops_entries(tmpdir, monkeypatch):
+    path = str(tmpdir / "cache.sqlite")
+    with RecordCache(path, 1 << 20) as cache:
+        key = cache.key(b"raw")
+        cache.put_many([(key, FIELDS)])
+
+    monkeypatch.setattr(cache_module, "CACHE_VERSION", cache_module.CACHE_VERSION + 1)
+    with RecordCache(path, 1 << 20) as cache:
+        assert cache.get_many([key]) == {}
+
+
+def test_cache_evicts_least_recently_used(tmpdir):
+    path = str(tmpdir / "cache.sqlite")
+    entry = ("", "", None, "", "x" * 936)  # 1000 bytes with the overhead
+    with RecordCache(path, 3500) as cache:
+        keys = [cache.key(bytes([i])) for i in range(3)]
+        cache.put_many([(key, entry) for key in keys])
+    with RecordCache(path, 3500) as cache:
+        cache.get_many(keys[:1])
+        cache.put_many([(cache.key(b"new"), entry)])
+
+    with RecordCache(path, 3500) as cache:
+        found = cache.get_many(keys + [cache.key(b"new")])
+    assert keys[0] in found and cache.key(b"new") in found
+    assert len(found) == 3
+
+
+@pytest.mark.parametrize("pipeline", ["sync", "async"])
+def test_convert_reuses_cached_fields(tmpdir, sample_mbox, mocker, pipeline):
+    def convert(**options):
+        config = ConfigParameterManager(
+            mbox_file=sample_mbox, cache_file=str(tmpdir / "cache.sqlite"), **options
+        )
+        converter = MboxConverter(config)
+        if pipeline == "async":
+            asyncio.run(converter.convert_async())
+        else:
+            converter.convert()
+
+    convert()
+    expected = (tmpdir / "sample_001.txt").read_binary()
+    (tmpdir / "sample_001.txt").remove()
+
+    build_record = mocker.patch.object(MboxConverter, "build_record")
+    convert()
+    assert not build_record.called
+    assert (tmpdir / "sample_001.txt").read_binary() == expected
+
+    convert(subject=False, format="csv")
+    assert not build_record.called
+    assert b"Subject" not in (tmpdir / "sample_001.csv").read_binary()
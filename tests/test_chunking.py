@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from mbox_converter.base import EmailRecord, MboxConverter
+from mbox_converter.chunking import (
+    TokenChunker,
+    available_token_estimators,
+    estimate_chars,
+    estimate_words,
+    get_token_estimator,
+    thread_key,
+)
+from mbox_converter.config import ConfigParameterManager
+from tests.conftest import write_mbox
+
+
+def record(subject, content, timestamp=0):
+    return EmailRecord("", "", None, subject, content, timestamp, timestamp, timestamp + 1)
+
+
+def test_estimators():
+    assert estimate_chars("a" * 8) == 2
+    assert estimate_words("one two three") == 4
+    assert get_token_estimator("words") is estimate_words
+    assert available_token_estimators()[:2] == ["chars", "words"]
+    with pytest.raises(ValueError):
+        get_token_estimator("gpt")
+
+
+def test_thread_key():
+    assert thread_key("Re: AW: Fwd:  Quarterly Report ") == "quarterly report"
+    assert thread_key("RE[2]: Quarterly report") == "quarterly report"
+    assert thread_key("Regarding the report") == "regarding the report"
+
+
+def test_chunker_keeps_threads_together():
+    chunker = TokenChunker(10, estimator=lambda text: text.count("x"), lookahead=2)
+    chunks = []
+    for i, subject in enumerate(["a", "b", "Re: a", "c", "Re: b", "Re: a"]):
+        chunks.extend(chunker.add(record(subject, "xxx", i)))
+    chunks.extend(chunker.flush())
+
+    subjects = [[r.subject for r in chunk.records] for chunk in chunks]
+    assert subjects == [["a", "Re: a", "Re: a"], ["b", "Re: b", "c"]]
+    assert [chunk.tokens for chunk in chunks] == [9, 9]
+    assert [chunk.threads for chunk in chunks] == [1, 2]
+
+
+def test_chunker_splits_oversized_thread():
+    chunker = TokenChunker(6, estimator=len)
+    chunks = []
+    for i in range(5):
+        chunks.extend(chunker.add(record("topic", "xxxx", i)))
+    chunks.extend(chunker.flush())
+
+    assert [len(chunk.records) for chunk in chunks] == [1, 1, 1, 1, 1]
+    assert [r.timestamp for chunk in chunks for r in chunk.records] == [0, 1, 2, 3, 4]
+
+
+def test_chunker_emits_in_streaming_fashion():
+    chunker = TokenChunker(10, estimator=len, lookahead=2)
+    emitted = [len(chunker.add(record(f"s{i}", "xxxxx", i))) for i in range(8)]
+    assert sum(emitted) > 0
+    assert chunker.pending_tokens <= 20
+
+
+def test_convert_writes_chunk_manifest(tmpdir):
+    messages = [
+        ("a@a.com", "b@b.com", f"Mon, {day:02d} Jan 2024 12:00:00 +0000", subject, "word " * 40)
+        for day, subject in enumerate(["One", "Two", "Re: One", "Three", "Re: Two"], start=1)
+    ]
+    mbox_file = write_mbox(tmpdir / "chunks.mbox", messages)
+    config = ConfigParameterManager(mbox_file=mbox_file, chunk_tokens=120)
+    MboxConverter(config).convert()
+
+    manifest = [json.loads(line) for line in open("chunks_chunks.jsonl", encoding="utf-8")]
+    assert sum(entry["messages"] for entry in manifest) == 5
+    assert all(entry["tokens"] <= 120 for entry in manifest)
+    data = open("chunks_001.txt", "rb").read()
+    assert sum(entry["length"] for entry in manifest) == len(data)
+    first = data[manifest[0]["offset"] : manifest[0]["offset"] + manifest[0]["length"]]
+    assert first.decode("utf-8").count("Subject: ") == manifest[0]["messages"]
+    assert b"Subject: One" in first and b"Subject: Re: One" in first
+    # 2024-01-01 and 2024-01-03, the dates of "One" and "Re: One"
+    assert (manifest[0]["first_timestamp"], manifest[0]["last_timestamp"]) == (
+        1704110400,
+        1704283200,
+    )
+    with open(mbox_file, "rb") as f:
+        start, stop = manifest[0]["sources"][0]
+        f.seek(start)
+        assert f.read(stop - start).startswith(b"From a@a.com")
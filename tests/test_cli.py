@@ -11,7 +11,7 @@ import tempfile
 import unittest
 from io import StringIO
 from pathlib import Path
-from unittest.mock import MagicMock, patch, mock_open
+from unittest.mock import AsyncMock, MagicMock, patch, mock_open
 
 from mbox_converter import cli
 
@@ -32,6 +32,16 @@ class TestArgumentParsing(unittest.TestCase):
             with self.assertRaises(SystemExit):
                 cli.parse_arguments()
 
+    def test_boolean_arguments(self):
+        """Test that boolean options accept explicit true/false values."""
+        test_args = ["--to", "False", "--subject", "yes", "test.mbox"]
+
+        with patch("sys.argv", ["cli.py"] + test_args):
+            args = cli.parse_arguments()
+
+        self.assertIs(args.to, False)
+        self.assertIs(args.subject, True)
+
     def test_positional_argument_required(self):
         """Test that mbox_file positional argument is required."""
         with patch("sys.argv", ["cli.py"]):
@@ -79,6 +89,44 @@ class TestMainFunction(unittest.TestCase):
             mock_converter_class.assert_called_once_with(mock_config)
             mock_converter.convert.assert_called_once()
 
+    @patch("mbox_converter.cli.ConfigParameterManager")
+    @patch("mbox_converter.cli.MboxConverter")
+    def test_main_async_pipeline(self, mock_converter_class, mock_config_class):
+        """Test that the async pipeline is used when requested."""
+        mock_config = MagicMock()
+        mock_config.mbox_file = str(self.test_mbox)
+        mock_config.pipeline = "async"
+        mock_config_class.return_value = mock_config
+
+        mock_converter = MagicMock()
+        mock_converter.convert_async = AsyncMock()
+        mock_converter_class.return_value = mock_converter
+
+        test_args = ["cli.py", "--pipeline", "async", str(self.test_mbox)]
+
+        with patch("sys.argv", test_args):
+            result = cli.main()
+
+            self.assertEqual(result, 0)
+            mock_converter.convert_async.assert_awaited_once()
+            mock_converter.convert.assert_not_called()
+
+    @patch("sys.stdout", new_callable=StringIO)
+    def test_preview_subcommand(self, mock_stdout):
+        """Test that the preview subcommand prints rendered messages without writing files."""
+        self.test_mbox.write_text(
+            "From a@example.com\nFrom: a@example.com\nSubject: One\n\nFirst\n\n"
+            "From b@example.com\nFrom: b@example.com\nSubject: Two\n\nSecond\n"
+        )
+        argv = ["preview", "--config", "", "--sample", "last", "--count", "1"]
+        result = cli.main(argv + [str(self.test_mbox)])
+
+        self.assertEqual(result, 0)
+        output = mock_stdout.getvalue()
+        self.assertIn("Subject: Two", output)
+        self.assertNotIn("Subject: One", output)
+        self.assertEqual(sorted(Path(self.temp_dir).iterdir()), [self.test_mbox])
+
     @patch("mbox_converter.cli.ConfigParameterManager")
     def test_main_file_not_found(self, mock_config_class):
         """Test main function with non-existent mbox file."""
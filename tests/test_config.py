@@ -0,0 +1,35 @@
+import yaml
+
+from mbox_converter.config import ConfigParameterManager
+
+
+def test_config_file_parsed_once(tmpdir, mocker, capsys):
+    path = tmpdir / "config.yaml"
+    path.write("format: csv\nmax_days: 7\n")
+    safe_load = mocker.spy(yaml, "safe_load")
+
+    first = ConfigParameterManager(config_file=str(path))
+    second = ConfigParameterManager(config_file=str(path), max_days=3)
+
+    assert safe_load.call_count == 1
+    assert (first.format, first.max_days) == ("csv", 7)
+    assert (second.format, second.max_days) == ("csv", 3)
+    assert capsys.readouterr().out == ""
+
+
+def test_config_file_reloaded_when_changed(tmpdir):
+    path = tmpdir / "config.json"
+    path.write('{"format": "csv"}')
+    assert ConfigParameterManager(config_file=str(path)).format == "csv"
+
+    path.write('{"format": "txt", "subject": false}')
+    config = ConfigParameterManager(config_file=str(path))
+    assert (config.format, config.subject) == ("txt", False)
+
+
+def test_cli_doc_only_marks_the_mbox_file_required(tmpdir):
+    ConfigParameterManager.generate_cli_markdown_doc(str(tmpdir / "cli.md"))
+    doc = (tmpdir / "cli.md").read_text("utf-8")
+    rows = [line for line in doc.splitlines() if "*required*" in line]
+    assert [row.split("|")[1].strip() for row in rows] == ["`path/to/file.mbox`"]
+    assert "| `--since` " in doc and "python -m mbox_converter.cli example.mbox\n" in doc
@@ -0,0 +1,89 @@
+import email
+import glob
+import tarfile
+import zipfile
+
+import pytest
+
+from mbox_converter import cli
+from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.export import EntryNamer, entry_stem, open_export
+
+# In date order, undated messages first
+NAMES = [
+    "undated/undated_carol@example.com",
+    "2024-01/20240101T120000Z_bob@example.com",
+    "2024-01/20240104T120000Z_alice@example.com",
+    "2024-03/20240301T073000Z_alice@example.com",
+]
+
+
+def export(mbox_file, **options):
+    config = ConfigParameterManager(mbox_file=mbox_file, **options)
+    MboxConverter(config).convert()
+
+
+def test_entry_names():
+    assert entry_stem(0, "") == "undated/undated_unknown"
+    assert (
+        entry_stem(1704110400, "Jörg Müller <../x>") == "2024-01/20240101T120000Z_J_rg_M_ller_.._x"
+    )
+    namer = EntryNamer()
+    names = [namer.name(t, "a@b.com", "txt") for t in (1, 1, 2, 2, 2)]
+    assert names == [
+        "1970-01/19700101T000001Z_a@b.com.txt",
+        "1970-01/19700101T000001Z_a@b.com_2.txt",
+        "1970-01/19700101T000002Z_a@b.com.txt",
+        "1970-01/19700101T000002Z_a@b.com_2.txt",
+        "1970-01/19700101T000002Z_a@b.com_3.txt",
+    ]
+    with pytest.raises(ValueError, match="Unknown export format: rar"):
+        open_export("rar", "x")
+
+
+@pytest.mark.parametrize("compression", ["deflated", "stored", "bzip2", "lzma"])
+def test_zip_export_of_text_entries(sample_mbox, compression):
+    export(sample_mbox, export="zip", export_compression=compression)
+    assert not glob.glob("sample_*.txt")
+    with zipfile.ZipFile("sample.zip") as archive:
+        assert archive.testzip() is None
+        infos = archive.infolist()
+        assert [info.filename for info in infos] == [f"{name}.txt" for name in NAMES]
+        assert {info.compress_type for info in infos} == {
+            getattr(zipfile, f"ZIP_{compression.upper()}")
+        }
+        text = archive.read(f"{NAMES[1]}.txt").decode("utf-8")
+        assert archive.getinfo(f"{NAMES[2]}.txt").date_time == (2024, 1, 4, 12, 0, 0)
+    assert text == (
+        "From: bob@example.com\nTo: alice@example.com\nDate: 2024-01-01\nSubject: First\n"
+        "\nHello\nBob\n"
+    )
+
+
+def test_export_is_deterministic(sample_mbox, tmpdir):
+    export(sample_mbox, export="zip", since="2024-01-02")
+    first = (tmpdir / "sample.zip").read_binary()
+    export(sample_mbox, export="zip", since="2024-01-02")
+    assert (tmpdir / "sample.zip").read_binary() == first
+    with zipfile.ZipFile("sample.zip") as archive:
+        assert archive.namelist() == [f"{NAMES[2]}.txt", f"{NAMES[3]}.txt"]
+
+
+@pytest.mark.parametrize("compression, path", [("stored", "sample.tar"), ("lzma", "sample.tar.xz")])
+def test_tar_export_of_eml_entries(sample_mbox, compression, path):
+    export(sample_mbox, export="tar", export_entry="eml", export_compression=compression)
+    with tarfile.open(path) as archive:
+        members = archive.getmembers()
+        assert [member.name for member in members] == [f"{name}.eml" for name in NAMES]
+        assert members[1].mtime == 1704110400
+        raw = archive.extractfile(members[1]).read()
+    assert raw.startswith(b"From: bob@example.com\n")
+    assert email.message_from_bytes(raw)["subject"] == "First"
+
+
+def test_export_command(sample_mbox, capsys):
+    assert cli.main(["--config", "", "--export", "tar", "--export_entry", "eml", sample_mbox]) == 0
+    assert "Exported 4 messages into sample.tar.gz." in capsys.readouterr().out
+    with tarfile.open("sample.tar.gz") as archive:
+        assert len(archive.getnames()) == 4
@@ -0,0 +1,93 @@
+import os
+from pathlib import Path
+
+from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.index import (
+    MessageIndex,
+    fingerprint,
+    index_path,
+    load_or_build,
+    message_id_hash,
+    sender_hash,
+)
+from mbox_converter.sources import MboxSource
+from tests.conftest import write_mbox
+
+EXAMPLE_MBOX = Path(__file__).parent.parent / "example.mbox"
+
+
+def load(path):
+    with MboxSource(path) as source:
+        return MessageIndex.load(index_path(path), fingerprint(source._map, os.stat(path)))
+
+
+def test_hashes():
+    assert sender_hash("Alice <ALICE@Example.com>") == sender_hash("alice@example.com")
+    assert sender_hash("") == 0
+    assert message_id_hash(" <id@host> ") == message_id_hash("<id@host>") != 0
+
+
+def test_build_matches_scan():
+    with MboxSource(str(EXAMPLE_MBOX)) as source:
+        index = MessageIndex.build(source._map)
+        assert index.refs() == source.scan_sorted()
+        assert len(set(index.message_ids)) == len(index)
+
+
+def test_index_round_trip_and_staleness(sample_mbox):
+    with MboxSource(sample_mbox, use_index=True) as source:
+        refs = source.scan_sorted()
+    with MboxSource(sample_mbox) as source:
+        assert refs == source.scan_sorted()
+    index = load(sample_mbox)
+    assert index.refs() == refs
+    assert list(index.senders)[1] == sender_hash("bob@example.com")
+
+    stat = os.stat(sample_mbox)
+    with open(sample_mbox, "r+b") as f:
+        f.seek(stat.st_size - 3)
+        f.write(b"X")
+    os.utime(sample_mbox, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert load(sample_mbox) is None
+
+
+def test_damaged_index_is_rebuilt(sample_mbox, mocker):
+    with open(index_path(sample_mbox), "wb") as f:
+        f.write(b"MBXIDX garbage")
+    build = mocker.spy(MessageIndex, "build")
+    with MboxSource(sample_mbox, use_index=True) as source:
+        assert len(source.scan_sorted()) == 4
+    assert build.call_count == 1
+    assert load(sample_mbox) is not None
+
+
+def test_index_date_range_matches_scan(tmpdir):
+    messages = [
+        ("a@a.com", "b@b.com", f"Mon, {day:02d} Jan 2024 12:00:00 +0000", f"Day {day}", "Text")
+        for day in [5, 1, 3, 3, 2, 4]
+    ] + [("a@a.com", "b@b.com", "not a date", "Undated", "Text")]
+    mbox_file = write_mbox(tmpdir / "range.mbox", messages)
+    with MboxSource(mbox_file) as source:
+        index = load_or_build(mbox_file, source._map, os.stat(mbox_file))
+        for since, until in [
+            (None, None),
+            (1704240000, None),
+            (None, 1704326400),
+            (1704240000, 1704326400),
+        ]:
+            assert index.refs(since, until) == source.scan_sorted(since, until)
+
+
+def test_converter_reuses_index_and_limits_dates(sample_mbox, mocker):
+    config = ConfigParameterManager(mbox_file=sample_mbox)
+    assert len(list(MboxConverter(config).iter_records())) == 4
+
+    build = mocker.spy(MessageIndex, "build")
+    config = ConfigParameterManager(mbox_file=sample_mbox, since="2024-01-02", until="2024-03-01")
+    records = list(MboxConverter(config).iter_records())
+    assert not build.called
+    assert [record.subject for record in records] == ["Second", "Re: First"]
+
+    config.index = False
+    assert list(MboxConverter(config).iter_records()) == records
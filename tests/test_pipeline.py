@@ -0,0 +1,71 @@
+import asyncio
+import concurrent.futures
+import glob
+
+import pytest
+
+from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.pipeline import ConverterPool, _parse_in_worker
+
+
+def read_outputs(pattern):
+    return {path: open(path, "rb").read() for path in sorted(glob.glob(pattern))}
+
+
+@pytest.mark.parametrize("output_format", ["txt", "csv"])
+@pytest.mark.parametrize("max_days", [-1, 2, 1000])
+def test_async_matches_sync(sample_mbox, output_format, max_days):
+    config = ConfigParameterManager(mbox_file=sample_mbox, format=output_format, max_days=max_days)
+    MboxConverter(config).convert()
+    expected = read_outputs(f"sample_*.{output_format}")
+    for path in expected:
+        open(path, "w").close()
+
+    asyncio.run(MboxConverter(config).convert_async(queue_size=2))
+
+    assert expected
+    assert read_outputs(f"sample_*.{output_format}") == expected
+
+
+def test_async_with_process_pool(sample_mbox):
+    config = ConfigParameterManager(mbox_file=sample_mbox, format="csv", max_days=1000)
+    MboxConverter(config).convert()
+    expected = read_outputs("sample_*.csv")
+
+    with concurrent.futures.ProcessPoolExecutor(2) as pool:
+        asyncio.run(MboxConverter(config).convert_async(executor=pool))
+
+    assert read_outputs("sample_*.csv") == expected
+
+
+def test_converter_pool_sends_the_converter_once(sample_mbox, mocker):
+    converter = MboxConverter(ConfigParameterManager(mbox_file=sample_mbox))
+
+    async def collect(pool):
+        return [record async for record in converter.aiter_records(executor=pool)]
+
+    with ConverterPool(converter, 2) as pool:
+        submit = mocker.spy(pool, "submit")
+        records = asyncio.run(collect(pool))
+    assert records == list(converter.iter_records())
+    # Only the raw messages are sent with a batch
+    assert [call.args[0] for call in submit.call_args_list] == [_parse_in_worker]
+    refs = [ref for ref, _ in submit.call_args.args[1]]
+    assert [ref.start for ref in refs] == [record.start for record in records]
+
+
+def test_async_propagates_errors(sample_mbox, mocker):
+    mocker.patch.object(MboxConverter, "record_from_bytes", side_effect=ValueError("broken"))
+    config = ConfigParameterManager(mbox_file=sample_mbox, quarantine=False)
+    with pytest.raises(ValueError, match="broken"):
+        asyncio.run(MboxConverter(config).convert_async(queue_size=1))
+
+
+def test_aiter_records_matches_iter_records(sample_mbox):
+    converter = MboxConverter(ConfigParameterManager(mbox_file=sample_mbox))
+
+    async def collect():
+        return [record async for record in converter.aiter_records(queue_size=1)]
+
+    assert asyncio.run(collect()) == list(converter.iter_records())
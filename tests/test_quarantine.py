@@ -0,0 +1,147 @@
+import asyncio
+import json
+import mailbox
+import os
+import signal
+import time
+
+import pytest
+
+from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.quarantine import MessageTimeout, time_budget
+from tests.conftest import SAMPLE_MESSAGES, write_mbox
+
+build_record = MboxConverter.build_record
+
+
+def pathological(self, email, ref=None):
+    """Build records normally, except for the messages whose subject names a failure."""
+    if email["subject"] == "Second":
+        raise ValueError("broken MIME tree")
+    if email["subject"] == "First":
+        time.sleep(5)
+    return build_record(self, email, ref)
+
+
+def read_log(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_time_budget():
+    with pytest.raises(MessageTimeout):
+        with time_budget(0.05):
+            time.sleep(1)
+    with time_budget(0):
+        time.sleep(0.01)
+
+
+def test_time_budget_restores_the_application_timer():
+    ticks = []
+    previous = signal.signal(signal.SIGALRM, lambda signum, frame: ticks.append(signum))
+    try:
+        signal.setitimer(signal.ITIMER_REAL, 10, 5)
+        with time_budget(1):
+            time.sleep(0.01)
+        delay, interval = signal.getitimer(signal.ITIMER_REAL)
+        assert 9 < delay < 10 and interval == 5 and ticks == []
+
+        # A timer expiring within the budget fires once the budget is over
+        signal.setitimer(signal.ITIMER_REAL, 0.01)
+        with time_budget(1):
+            time.sleep(0.05)
+        time.sleep(0.01)
+        assert ticks == [signal.SIGALRM]
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+@pytest.mark.parametrize("pipeline", ["sync", "workers"])
+def test_failing_messages_are_quarantined(tmpdir, mocker, capsys, pipeline):
+    big = (
+        "dave@example.com",
+        "bob@example.com",
+        "Tue, 02 Jan 2024 12:00:00 +0000",
+        "Big",
+        "x" * 2**20,
+    )
+    mbox_file = write_mbox(tmpdir / "sample.mbox", SAMPLE_MESSAGES + [big])
+    mocker.patch.object(MboxConverter, "build_record", pathological)
+    config = ConfigParameterManager(
+        mbox_file=mbox_file,
+        message_timeout=0.2,
+        max_message_mb=1,
+        workers=2,
+    )
+    converter = MboxConverter(config)
+    start = time.perf_counter()
+    if pipeline == "sync":
+        converter.convert()
+    else:
+        asyncio.run(converter.convert_async())
+    assert time.perf_counter() - start < 4
+
+    output = (tmpdir / "sample_001.txt").read_text("utf-8")
+    assert [line for line in output.splitlines() if line.startswith("Subject:")] == [
+        "Subject: No date",
+        "Subject: Re: First",
+    ]
+    causes = sorted(entry["cause"] for entry in read_log("sample_quarantine.jsonl"))
+    quarantined = sorted(message["subject"] for message in mailbox.mbox("sample_quarantine.mbox"))
+    assert causes == ["error", "size", "timeout"]
+    assert quarantined == ["Big", "First", "Second"]
+    assert "Quarantined 3 message(s) into sample_quarantine.mbox: 1 size, 1 timeout, 1 error." in (
+        capsys.readouterr().out
+    )
+
+
+def test_thread_pool_quarantines_errors(sample_mbox, mocker):
+    def broken(self, email, ref=None):
+        if email["subject"] == "Second":
+            raise ValueError("broken MIME tree")
+        return build_record(self, email, ref)
+
+    mocker.patch.object(MboxConverter, "build_record", broken)
+    converter = MboxConverter(ConfigParameterManager(mbox_file=sample_mbox))
+    asyncio.run(converter.convert_async(queue_size=1))
+    assert converter.quarantined.counts == {"error": 1}
+    assert len(mailbox.mbox("sample_quarantine.mbox")) == 1
+
+
+def test_quarantine_log_points_to_source(tmpdir, mocker):
+    mbox_file = write_mbox(tmpdir / "sample.mbox")
+    mocker.patch.object(MboxConverter, "build_record", pathological)
+    converter = MboxConverter(ConfigParameterManager(mbox_file=mbox_file, message_timeout=0.1))
+    records = list(converter.iter_records("sample"))
+    assert len(records) == 2
+    assert converter.quarantined.counts == {"error": 1, "timeout": 1}
+
+    entries = read_log("sample_quarantine.jsonl")
+    with open(mbox_file, "rb") as f, open("sample_quarantine.mbox", "rb") as quarantine:
+        data = f.read()
+        box = quarantine.read()
+    for entry in entries:
+        start, stop = entry["source_offset"]
+        assert box[entry["offset"] : entry["offset"] + entry["length"]] == data[start:stop] + b"\n"
+    assert entries[0]["detail"] == "more than 0.1 s"
+    assert entries[1]["detail"] == "ValueError: broken MIME tree"
+
+
+def test_no_quarantine_files_without_failures(sample_mbox, tmpdir):
+    MboxConverter(ConfigParameterManager(mbox_file=sample_mbox)).convert()
+    assert not (tmpdir / "sample_quarantine.mbox").exists()
+
+
+def test_library_callers_choose_where_to_quarantine(tmpdir, mocker):
+    mbox_file = write_mbox(tmpdir / "sample.mbox")
+    mocker.patch.object(MboxConverter, "build_record", pathological)
+    converter = MboxConverter(ConfigParameterManager(mbox_file=mbox_file, message_timeout=0.1))
+    assert len(list(converter.iter_records())) == 2
+    assert converter.quarantined.summary() == "Quarantined 2 message(s): 1 timeout, 1 error."
+    assert tmpdir.listdir(lambda path: "quarantine" in path.basename) == []
+
+    os.mkdir("failed")
+    assert len(list(converter.iter_records(os.path.join("failed", "run")))) == 2
+    assert len(mailbox.mbox(os.path.join("failed", "run_quarantine.mbox"))) == 2
@@ -0,0 +1,96 @@
+import zipfile
+
+import pytest
+
+from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.redaction import Redactor, literal_pattern
+from tests.conftest import write_mbox
+
+TEXT = (
+    "Call Ann Smith at +49 30 1234567 or (030) 123-4567 about order CUST-004711.\n"
+    "Mail ann.smith@example.com, not on 2024-01-04 or 12.03.2024 at 12:00 (v1.2.3)."
+)
+
+
+def test_mask():
+    redactor = Redactor("mask", ["ann smith", "Bob"], [r"CUST-\d{6}"])
+    assert redactor.redact(TEXT) == (
+        "Call [NAME] at [PHONE] or [PHONE] about order [ID].\n"
+        "Mail [EMAIL], not on 2024-01-04 or 12.03.2024 at 12:00 (v1.2.3)."
+    )
+    # Terms are whole words, ignoring case and the whitespace between their words
+    assert redactor.redact("BOB's, Bobby and ANN\n  smith") == "[NAME]'s, Bobby and [NAME]"
+    with pytest.raises(ValueError, match="Unknown redaction mode: none"):
+        Redactor("none")
+
+
+def test_literal_pattern_is_a_trie():
+    assert literal_pattern(["ab", "abc", "ad", "b c"]) == r"(?:a(?:b(?:c)?|d)|b\s+c)"
+    names = [f"name{i} surname{i % 97}" for i in range(10000)]
+    redactor = Redactor("mask", names)
+    assert redactor.redact("To Name1234 Surname70 and name12345 surname0.") == (
+        "To [NAME] and name12345 surname0."
+    )
+
+
+def test_pseudonyms_are_stable_and_keyed():
+    redactor = Redactor("pseudonym", ["Ann Smith"], key=b"secret")
+    first = redactor.redact("From Ann Smith <ann@example.com>")
+    assert first == redactor.redact("From ANN  SMITH <Ann@Example.com>")
+    name, address = first.split(" <")
+    assert name.startswith("From [NAME:") and address.startswith("[EMAIL:")
+    assert len(address) == len("[EMAIL:]>") + 16
+    assert redactor.redact("ann@example.org") != address.rstrip(">")
+    other = Redactor("pseudonym", ["Ann Smith"], key=b"other secret")
+    assert other.redact("From Ann Smith <ann@example.com>") != first
+    with pytest.raises(ValueError, match="Pseudonyms need a secret key, set REDACT_KEY"):
+        Redactor("pseudonym", ["Ann Smith"])
+
+
+def test_conversion_is_redacted(tmpdir, monkeypatch, capsys):
+    monkeypatch.setenv("REDACT_KEY", "secret")
+    (tmpdir / "names.txt").write_text("# Customers\nBob\n\n", encoding="utf-8")
+    mbox_file = write_mbox(
+        tmpdir / "mail.mbox",
+        [
+            ("bob@example.com", "ann@example.com", "Mon, 01 Jan 2024 12:00:00 +0000", "Bob", "Hi"),
+            ("ann@example.com", "bob@example.com", "Tue, 02 Jan 2024 12:00:00 +0000", "Re", "Ok"),
+        ],
+    )
+    config = ConfigParameterManager(
+        mbox_file=mbox_file, redact="pseudonym", redact_terms="names.txt", format="csv"
+    )
+    MboxConverter(config).convert()
+    output = open("mail_001.csv", encoding="utf-8").read()
+    assert "example.com" not in output and "Bob" not in output
+    bob = Redactor("pseudonym", key=b"secret").redact("bob@example.com")
+    # The same pseudonym for the sender of one message and the recipient of the other
+    assert output.count(bob) == 2
+
+    config.export = "zip"
+    MboxConverter(config).convert()
+    with zipfile.ZipFile("mail.zip") as archive:
+        assert archive.namelist()[0] == f"2024-01/20240101T120000Z_EMAIL_{bob[7:-1]}.txt"
+        assert "example.com" not in archive.read(archive.namelist()[1]).decode("utf-8")
+    config.export_entry = "eml"
+    with pytest.raises(ValueError, match="Raw eml entries can't be redacted"):
+        MboxConverter(config).convert()
+
+
+def test_quarantine_keeps_raw_messages_out_of_redacted_output(tmpdir, mocker):
+    def broken(self, email, ref=None):
+        raise ValueError(f"broken message from {email['from']}")
+
+    mbox_file = write_mbox(tmpdir / "mail.mbox")
+    mocker.patch.object(MboxConverter, "build_record", broken)
+    config = ConfigParameterManager(mbox_file=mbox_file, redact="mask")
+    MboxConverter(config).convert()
+    assert not (tmpdir / "mail_quarantine.mbox").exists()
+    log = (tmpdir / "mail_quarantine.jsonl").read_text("utf-8")
+    assert "example.com" not in log and len(log.splitlines()) == 4
+
+    config.quarantine_dir = "private"
+    MboxConverter(config).convert()
+    assert "example.com" in (tmpdir / "private" / "mail_quarantine.jsonl").read_text("utf-8")
+    assert (tmpdir / "private" / "mail_quarantine.mbox").exists()
@@ -0,0 +1,103 @@
+import random
+
+import pytest
+from email_reply_parser import EmailReplyParser
+
+from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.reply import (
+    available_reply_strippers,
+    get_reply_stripper,
+    strip_reply_compat,
+    strip_reply_fast,
+)
+from tests.conftest import write_mbox
+
+CORPUS = [
+    "",
+    "Just a plain message.\n\nWith two paragraphs.\n",
+    "Thanks, sounds good!\r\n\r\nOn Mon, Jan 1, 2024 at 10:00 AM Alice <a@example.com> wrote:\r\n"
+    "> Shall we meet?\r\n>\r\n> Alice\r\n",
+    "Yes.\n\nOn Mon, Jan 1, 2024 at 10:00 AM Alice Example <\na@example.com> wrote:\n\n> Shall we?\n",
+    "Fine by me.\n\n-- \nBob\nExample Corp\n",
+    "Fine by me.\n\nSent from my iPhone\n",
+    "Please see below.\n________________________________\nFrom: Alice\nSent: Monday\n"
+    "To: Bob\nSubject: Report\n\nHere is the report.\n",
+    "Top\n> inline quote\nanswer to it\n> another quote\nsecond answer\n",
+    "*From:* Alice\n*Sent:* Monday\n\nforwarded body\n",
+    "Only one thing: On second thought I wrote: nothing.\n",
+    "Regards\n-Bob\n",
+    "> all quoted\n> nothing else\n",
+]
+
+
+def test_registry():
+    assert available_reply_strippers() == ["fast", "compat", "none"]
+    assert get_reply_stripper("fast") is strip_reply_fast
+    assert get_reply_stripper("none")(" text ") == " text "
+    with pytest.raises(ValueError):
+        get_reply_stripper("talon")
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_fast_matches_compat_on_corpus(text):
+    assert strip_reply_fast(text) == strip_reply_compat(text)
+
+
+def test_fast_matches_compat_on_random_bodies():
+    lines = [
+        "Hello Bob,",
+        "",
+        "  ",
+        "Thanks for the update.",
+        "> quoted line",
+        ">> deeper",
+        "On Mon, Jan 1, 2024 at 10:00 AM Alice <a@example.com> wrote:",
+        "On Mon, Jan 1, 2024 at 10:00 AM Alice",
+        "<a@example.com> wrote:",
+        "From: Alice",
+        "Subject: Hi",
+        "-- ",
+        "__________",
+        " _______",
+        "Sent from my phone",
+        "-Bob",
+        "On second thought",
+    ]
+    rnd = random.Random(0)
+    for _ in range(2000):
+        text = "\n".join(rnd.choice(lines) for _ in range(rnd.randint(0, 12)))
+        assert strip_reply_fast(text) == EmailReplyParser.parse_reply(text), text
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Danke!\n\nAm 01.02.2024 um 10:00 schrieb Max Mustermann <\nmax@example.de>:\n> Hallo\n",
+        "Danke!\n\nVon: Max\nGesendet: Montag\nAn: Bob\nBetreff: Test\n\nAlter Text\n",
+        "Danke!\n\nVon meinem iPhone gesendet\n",
+        "Danke!\n\nLe 1 févr. 2024 à 10:00, Jean <jean@example.fr> a écrit :\n> Salut\n",
+        "Danke!\n\nEl 1 feb 2024, a las 10:00, Juan <juan@example.es> escribió:\n> Hola\n",
+    ],
+)
+def test_fast_strips_localized_replies(text):
+    assert strip_reply_fast(text) == "Danke!"
+
+
+def test_fast_keeps_lines_resembling_localized_headers():
+    text = "Danke!\nAm Ende:\nweiter"
+    assert strip_reply_fast(text) == text
+
+
+def test_converter_uses_configured_stripper(tmpdir):
+    body = "Danke!\n\nAm 01.02.2024 um 10:00 schrieb Max <max@example.de>:\n> Hallo"
+    messages = [("a@a.com", "b@b.com", "Mon, 01 Jan 2024 12:00:00 +0000", "Hi", body)]
+    mbox_file = write_mbox(tmpdir / "reply.mbox", messages)
+
+    contents = {}
+    for name in available_reply_strippers():
+        config = ConfigParameterManager(mbox_file=mbox_file, reply_stripper=name)
+        contents[name] = next(MboxConverter(config).iter_records()).content
+    assert contents["fast"] == "Danke!"
+    assert contents["compat"].startswith("Danke!\n\nAm 01.02.2024")
+    assert "> Hallo" in contents["none"]
@@ -0,0 +1,93 @@
+import glob
+import os
+
+from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.rollover import (
+    AnyPolicy,
+    MaxBytesPolicy,
+    MaxDaysPolicy,
+    MaxMessagesPolicy,
+    PeriodPolicy,
+    build_policy,
+)
+from tests.conftest import write_mbox
+
+DATES = [
+    "Mon, 01 Jan 2024 12:00:00 +0000",
+    "Tue, 02 Jan 2024 12:00:00 +0000",
+    "Wed, 31 Jan 2024 12:00:00 +0000",
+    "Thu, 01 Feb 2024 12:00:00 +0000",
+    "Fri, 02 Feb 2024 12:00:00 +0000",
+    "Sat, 03 Feb 2024 12:00:00 +0000",
+    "Mon, 01 Apr 2024 12:00:00 +0000",
+]
+
+
+def make_converter(tmpdir, **options):
+    messages = [
+        ("a@a.com", "b@b.com", date, f"Message {i}", "x" * 100) for i, date in enumerate(DATES)
+    ]
+    mbox_file = write_mbox(tmpdir / "roll.mbox", messages)
+    return MboxConverter(ConfigParameterManager(mbox_file=mbox_file, **options))
+
+
+def convert(tmpdir, **options):
+    make_converter(tmpdir, **options).convert()
+    return sorted(glob.glob("roll_*.txt"))
+
+
+def count_messages(path):
+    return open(path, encoding="utf-8").read().count("\n-----\n")
+
+
+def test_build_policy_skips_disabled_limits():
+    assert build_policy().policies == []
+    policy = build_policy(
+        max_days=3, max_bytes=10, max_messages=2, period="month", date_format="%Y"
+    )
+    assert [type(p) for p in policy.policies] == [
+        PeriodPolicy,
+        MaxDaysPolicy,
+        MaxMessagesPolicy,
+        MaxBytesPolicy,
+    ]
+    assert policy.needs_bytes
+    assert not AnyPolicy([MaxMessagesPolicy(2)]).needs_bytes
+
+
+def test_unlimited_writes_single_file(tmpdir):
+    assert convert(tmpdir) == ["roll_001.txt"]
+
+
+def test_max_messages(tmpdir):
+    files = convert(tmpdir, max_messages=3)
+    assert [count_messages(path) for path in files] == [3, 3, 1]
+
+
+def test_max_bytes_uses_writer_counter(tmpdir, mocker):
+    converter = make_converter(tmpdir, max_bytes=300)
+    stat = mocker.spy(os, "stat")
+    converter.convert()
+    assert not stat.called
+    files = sorted(glob.glob("roll_*.txt"))
+    sizes = [os.path.getsize(path) for path in files]
+    assert len(files) == 4
+    assert all(size >= 300 for size in sizes[:-1])
+    assert [count_messages(path) for path in files] == [2, 2, 2, 1]
+
+
+def test_period_names_files(tmpdir):
+    files = convert(tmpdir, period="month")
+    assert files == ["roll_2024-01_001.txt", "roll_2024-02_001.txt", "roll_2024-04_001.txt"]
+    assert [count_messages(path) for path in files] == [3, 3, 1]
+
+
+def test_period_combined_with_max_messages(tmpdir):
+    files = convert(tmpdir, period="year", max_messages=4)
+    assert files == ["roll_2024_001.txt", "roll_2024_002.txt"]
+
+
+def test_max_days_combined_with_max_messages(tmpdir):
+    files = convert(tmpdir, max_days=5, max_messages=3)
+    assert [count_messages(path) for path in files] == [2, 3, 1, 1]
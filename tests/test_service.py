@@ -0,0 +1,202 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pytest
+
+from mbox_converter import cli
+from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.service import (
+    ConversionService,
+    QueueFullError,
+    ServiceClient,
+    is_loopback,
+    make_server,
+    validate_job,
+)
+from tests.conftest import write_mbox
+
+ROOT = Path(__file__).parent.parent
+
+
+class PendingExecutor:
+    """Executor whose jobs only end when the test completes their futures."""
+
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        self.futures.append(Future())
+        return self.futures[-1]
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+@pytest.fixture(scope="module")
+def service():
+    with ConversionService(workers=2, max_queue=10) as service:
+        yield service
+
+
+@pytest.fixture
+def server(service, request):
+    socket_path = getattr(request, "param", None)
+    server = make_server(service, port=0, socket_path=socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    if socket_path:
+        yield ServiceClient(socket_path=socket_path, timeout=30)
+    else:
+        yield ServiceClient(port=server.server_port, timeout=30)
+    server.shutdown()
+    server.server_close()
+
+
+def test_validate_job(sample_mbox, tmpdir):
+    job = validate_job({"mbox_file": "sample.mbox", "max_days": 7, "format": "csv"})
+    assert job == {
+        "parameters": {"mbox_file": "sample.mbox", "max_days": 7, "format": "csv"},
+        "config": None,
+        "directory": str(tmpdir),
+    }
+    invalid = [
+        ({"mbox_file": "sample.mbox", "colour": "red"}, "Unknown parameter: colour"),
+        ({"mbox_file": "sample.mbox", "max_days": "7"}, "max_days must be of type int"),
+        ({"mbox_file": "sample.mbox", "period": "decade"}, "Invalid value for period: 'decade'"),
+        ({"format": "csv"}, "mbox_file is required"),
+        ({"mbox_file": "missing.mbox"}, "mbox file not found: missing.mbox"),
+        ([], "A job must be a JSON object"),
+    ]
+    for options, message in invalid:
+        with pytest.raises(ValueError, match=message):
+            validate_job(options)
+
+
+def test_queue_and_concurrency_limits(sample_mbox):
+    executor = PendingExecutor()
+    service = ConversionService(workers=1, max_queue=1, executor=executor)
+    first = service.submit({"mbox_file": sample_mbox})
+    second = service.submit({"mbox_file": sample_mbox})
+    with pytest.raises(QueueFullError, match="Queue is full"):
+        service.submit({"mbox_file": sample_mbox})
+    assert (first.status, second.status, len(executor.futures)) == ("running", "queued", 1)
+    metrics = service.metrics()
+    assert (metrics["running"], metrics["queued"], metrics["rejected"]) == (1, 1, 1)
+
+    # A finished job makes room for the next one; a crashed worker fails its job
+    executor.futures[0].set_result(None)
+    assert (second.status, len(executor.futures)) == ("running", 2)
+    executor.futures[1].set_exception(RuntimeError("worker died"))
+    assert second.status == "failed" and "worker died" in second.error
+    assert service.metrics()["failed"] == 1
+
+
+def test_jobs_stopped_by_a_dying_worker_are_requeued(sample_mbox):
+    executor = PendingExecutor()
+    service = ConversionService(workers=2, max_queue=2, executor=executor)
+    first = service.submit({"mbox_file": sample_mbox})
+    second = service.submit({"mbox_file": sample_mbox})
+    # The pool stops every job running on it
+    for future in list(executor.futures):
+        future.set_exception(BrokenProcessPool("A child process terminated abruptly"))
+    assert (first.status, second.status, len(executor.futures)) == ("running", "running", 4)
+    assert [event["event"] for event in first.events] == ["queued", "requeued"]
+
+    executor.futures[2].set_exception(BrokenProcessPool("A child process terminated abruptly"))
+    assert first.status == "failed" and "A worker process died" in first.error
+    assert service.metrics()["requeued"] == 2
+
+
+def test_pool_is_replaced_when_a_worker_dies(tmpdir):
+    messages = [
+        (f"user{i}@example.com", "bob@example.com", "Mon, 01 Jan 2024 12:00:00 +0000", "Hi", "Text")
+        for i in range(3000)
+    ]
+    mbox_file = write_mbox(tmpdir / "big.mbox", messages)
+    os.mkdir("a")
+    os.mkdir("b")
+    with ConversionService(workers=2, max_queue=2) as service:
+        jobs = [service.submit({"mbox_file": mbox_file, "directory": name}) for name in "ab"]
+        deadline = time.monotonic() + 30
+        while not all(job.started for job in jobs) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        os.kill(jobs[0].events[1]["pid"], signal.SIGKILL)
+        for job in jobs:
+            while not service.wait_events(job, 0, timeout=30)[1]:
+                pass
+        assert [job.status for job in jobs] == ["done", "done"]
+        assert all(job.messages == 3000 for job in jobs)
+        assert service.metrics()["requeued"] == 2
+
+
+@pytest.mark.parametrize("server", [None, "service.sock"], indirect=True)
+def test_jobs_stream_progress_and_results(server, sample_mbox, tmpdir):
+    os.mkdir("out")
+    job = server.submit(mbox_file=sample_mbox, format="csv", max_days=30, directory="out")
+    assert job["status"] in ("queued", "running")
+    events = list(server.events(job["id"]))
+    assert [event["event"] for event in events if event["event"] != "log"] == [
+        "queued",
+        "started",
+        "progress",
+        "done",
+    ]
+    assert events[-1]["messages"] == 4
+    state = server.job(job["id"])
+    assert state["status"] == "done" and state["messages"] == 4
+    assert state["output"][-1] == "Generated output for 4 messages into 3 file(s)."
+
+    # The same files as a conversion in this process
+    config = ConfigParameterManager(mbox_file=sample_mbox, format="csv", max_days=30)
+    MboxConverter(config).convert()
+    for name in ("sample_001.csv", "sample_002.csv", "sample_003.csv"):
+        assert (tmpdir / "out" / name).read_binary() == (tmpdir / name).read_binary()
+
+    failed = server.submit(mbox_file=sample_mbox, since="yesterday", pipeline="async")
+    assert list(server.events(failed["id"]))[-1]["event"] == "failed"
+    metrics = server.metrics()
+    assert metrics["done"] >= 1 and metrics["failed"] >= 1 and metrics["messages"] >= 4
+    assert metrics["queued"] == 0 and metrics["jobs_per_minute"] > 0
+
+    with pytest.raises(ValueError, match="Unknown parameter: colour"):
+        server.submit(mbox_file=sample_mbox, colour="red")
+    with pytest.raises(ValueError, match="Unknown job: 0"):
+        server.job("0")
+
+
+def test_only_loopback_addresses_without_opt_in(service, capsys):
+    with pytest.raises(ValueError, match="Refusing to listen on 0.0.0.0"):
+        make_server(service, host="0.0.0.0", port=0)
+    assert cli.main(["serve", "--host", "0.0.0.0"]) == 1
+    assert "Refusing to listen on 0.0.0.0" in capsys.readouterr().out
+    assert is_loopback("localhost") and is_loopback("::1") and not is_loopback("")
+    server = make_server(service, host="0.0.0.0", port=0, allow_remote=True)
+    server.server_close()
+
+
+def test_serve_command(sample_mbox, tmpdir):
+    # Listens on a Unix socket in the working directory by default
+    socket_path = str(tmpdir / "mbox_converter.sock")
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    command = [sys.executable, "-m", "mbox_converter.cli", "serve", "--workers", "1"]
+    process = subprocess.Popen(command, env=env)
+    try:
+        deadline = time.monotonic() + 30
+        while not os.path.exists(socket_path) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        client = ServiceClient(socket_path=socket_path, timeout=30)
+        job = client.submit(mbox_file=sample_mbox, directory=str(tmpdir))
+        assert list(client.events(job["id"]))[-1]["event"] == "done"
+        assert (tmpdir / "sample_001.txt").exists()
+    finally:
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=30) == 0
+    assert not os.path.exists(socket_path)
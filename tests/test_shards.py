@@ -0,0 +1,168 @@
+import glob
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+from mbox_converter import cli
+from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.shards import ShardManifest, merge_runs, plan_shards, run_worker
+from mbox_converter.sources import MboxSource
+from tests.conftest import write_mbox
+
+ROOT = Path(__file__).parent.parent
+
+
+def archive(tmpdir):
+    messages = [
+        (
+            f"user{i % 7}@example.com",
+            "b@b.com",
+            (
+                f"Mon, {i * 37 % 28 + 1:02d} {['Jan', 'Mar', 'Jun'][i % 3]} 2024 12:00:00 +0000"
+                if i % 11
+                else "not a date"
+            ),
+            f"Message {i}",
+            f"Text {i}\n" * (i % 5 + 1),
+        )
+        for i in range(60)
+    ]
+    return write_mbox(tmpdir / "archive.mbox", messages)
+
+
+def test_plan_shards_aligns_to_messages(tmpdir):
+    mbox_file = archive(tmpdir)
+    with MboxSource(mbox_file) as source:
+        data = source._map
+        shards = plan_shards(data, 4)
+        assert len(shards) == 4
+        assert shards[0][0] == 0 and shards[-1][1] == len(data)
+        assert all(data[start : start + 5] == b"From " for start, _ in shards)
+        assert all(stop == start for (_, stop), (start, _) in zip(shards, shards[1:]))
+        refs = [ref for start, stop in shards for ref in source.scan_range(start, stop)]
+        assert refs == source.scan()
+        assert len(plan_shards(data, 1000)) == 60
+    assert plan_shards(b"", 4) == []
+
+
+def test_sharded_conversion_matches_single_node(tmpdir):
+    mbox_file = archive(tmpdir)
+    cli.main(["shard", "plan", "--config", "", "--shards", "5", "--max_days", "20", mbox_file])
+    manifest = str(tmpdir / "shards" / "manifest.json")
+
+    # Independent worker processes claiming shards from the shared directory
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    command = [sys.executable, "-m", "mbox_converter.cli", "shard", "work", manifest]
+    workers = [subprocess.Popen(command, cwd=ROOT, env=env) for _ in range(3)]
+    assert [worker.wait() for worker in workers] == [0, 0, 0]
+    assert len(glob.glob(str(tmpdir / "shards" / "shard_*.jsonl"))) == 5
+
+    os.mkdir("merged")
+    os.chdir("merged")
+    assert cli.main(["shard", "merge", manifest]) == 0
+    os.chdir("..")
+    config = ConfigParameterManager(mbox_file=mbox_file, max_days=20)
+    MboxConverter(config).convert()
+
+    merged = sorted(os.listdir("merged"))
+    assert len(merged) > 1
+    assert merged == sorted(glob.glob("archive_*.txt"))
+    for name in merged:
+        assert (tmpdir / "merged" / name).read_binary() == (tmpdir / name).read_binary()
+
+
+def test_merge_with_date_range_and_csv(tmpdir):
+    mbox_file = archive(tmpdir)
+    options = {"since": "2024-03-01", "format": "csv", "period": "month"}
+    config = ConfigParameterManager(mbox_file=mbox_file, **options)
+    manifest = ShardManifest.create(MboxConverter(config), "shards", 3)
+    assert run_worker(manifest, 1) == [1]
+    with pytest.raises(ValueError, match="Shards not converted yet: 0, 2"):
+        merge_runs(manifest)
+    assert run_worker(ShardManifest.load(manifest.path)) == [0, 2]
+
+    os.mkdir("merged")
+    os.chdir("merged")
+    merge_runs(manifest)
+    os.chdir("..")
+    MboxConverter(config).convert()
+    assert sorted(os.listdir("merged")) == ["archive_2024-03_001.csv", "archive_2024-06_001.csv"]
+    for name in os.listdir("merged"):
+        assert (tmpdir / "merged" / name).read_binary() == (tmpdir / name).read_binary()
+
+
+def test_worker_rejects_changed_mbox(tmpdir):
+    mbox_file = archive(tmpdir)
+    manifest = ShardManifest.create(
+        MboxConverter(ConfigParameterManager(mbox_file=mbox_file)), "shards", 2
+    )
+    with open(mbox_file, "a") as f:
+        f.write("From x\n\nappended\n")
+    with pytest.raises(ValueError, match="mbox changed since the shards were planned"):
+        run_worker(manifest)
+
+
+def test_stale_claims_are_taken_over(tmpdir):
+    mbox_file = archive(tmpdir)
+    manifest = ShardManifest.create(
+        MboxConverter(ConfigParameterManager(mbox_file=mbox_file)), "shards", 3
+    )
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    owner = {"host": socket.gethostname(), "time": time.time()}
+    claims = {0: dict(owner, pid=dead.pid), 1: dict(owner, pid=os.getppid()), 2: owner}
+    for shard, claim in claims.items():
+        with open(manifest.claim_path(shard), "w") as f:
+            json.dump(claim, f)
+    # Shard 2 was claimed by a worker on another host an hour ago
+    os.utime(manifest.claim_path(2), (time.time() - 3600,) * 2)
+
+    assert run_worker(manifest) == [0, 2]
+    with pytest.raises(ValueError, match="Shards not converted yet: 1"):
+        merge_runs(manifest)
+    assert run_worker(manifest, claim_timeout=0) == [1]
+    with open(manifest.claim_path(1)) as f:
+        assert json.load(f)["pid"] == os.getpid()
+
+
+def test_claim_lost_to_another_worker(tmpdir, mocker):
+    mbox_file = archive(tmpdir)
+    manifest = ShardManifest.create(
+        MboxConverter(ConfigParameterManager(mbox_file=mbox_file)), "shards", 1
+    )
+    path = manifest.claim_path(0)
+    dump = json.dump
+
+    def dump_then_lose(claim, f):
+        # Another worker removes the new claim and creates its own right after it is written
+        dump(claim, f)
+        with open(f"{path}.other", "w") as other:
+            dump(dict(claim, token="other"), other)
+        os.replace(f"{path}.other", path)
+
+    mocker.patch("mbox_converter.shards.json.dump", side_effect=dump_then_lose)
+    assert not manifest.claim(0)
+    mocker.stopall()
+    assert not manifest.claim(0)
+    os.utime(path, (time.time() - 3600,) * 2)
+    assert manifest.claim(0)
+
+
+def test_export_is_rejected(tmpdir):
+    mbox_file = archive(tmpdir)
+    config = ConfigParameterManager(mbox_file=mbox_file, export="zip")
+    with pytest.raises(ValueError, match="run --export without shards"):
+        ShardManifest.create(MboxConverter(config), "shards", 2)
+    config.export = "none"
+    manifest = ShardManifest.create(MboxConverter(config), "shards", 2)
+    run_worker(manifest)
+    manifest.config["export"] = "zip"
+    with pytest.raises(ValueError, match="run --export without shards"):
+        merge_runs(manifest)
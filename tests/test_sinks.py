@@ -0,0 +1,126 @@
+import asyncio
+import datetime
+
+import pytest
+
+from mbox_converter.base import EmailRecord, MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from mbox_converter.sinks import build_filter
+from tests.conftest import write_mbox
+
+RUN_PLAN = """
+subject: false
+sinks:
+  - name: llm
+    format: txt
+    subject: true
+  - name: analysts
+    format: csv
+    filters:
+      since: 2024-01-02
+      from: "^alice@"
+  - name: metadata
+    format: csv
+    content: false
+    max_messages: 2
+"""
+
+
+def record(sent_from, subject, day):
+    timestamp = datetime.datetime(2024, 1, day).timestamp() if day else 0
+    return EmailRecord(sent_from, "", None, subject, "", timestamp, None, None)
+
+
+def test_build_filter():
+    accepts = build_filter({"since": "2024-01-02", "until": datetime.date(2024, 1, 3)})
+    assert [accepts(record("", "", day)) for day in [0, 1, 2, 3, 4]] == [
+        False,
+        False,
+        True,
+        True,
+        False,
+    ]
+    accepts = build_filter({"from": "@example\\.com$", "subject": "(?i)invoice"})
+    assert accepts(record("a@example.com", "Your INVOICE", 1))
+    assert not accepts(record("a@example.org", "Your invoice", 1))
+    assert build_filter({}) is None
+    with pytest.raises(ValueError, match="Unknown filter: sender"):
+        build_filter({"sender": "a"})
+
+
+@pytest.mark.parametrize("pipeline", ["sync", "async"])
+def test_run_plan_parses_once_and_matches_single_runs(tmpdir, sample_mbox, mocker, pipeline):
+    (tmpdir / "plan.yaml").write(RUN_PLAN)
+    config = ConfigParameterManager(config_file=str(tmpdir / "plan.yaml"), mbox_file=sample_mbox)
+    build_record = mocker.spy(MboxConverter, "build_record")
+    converter = MboxConverter(config)
+    if pipeline == "async":
+        asyncio.run(converter.convert_async())
+    else:
+        converter.convert()
+    assert build_record.call_count == 4
+
+    txt = (tmpdir / "sample_llm_001.txt").read_binary()
+    MboxConverter(ConfigParameterManager(mbox_file=sample_mbox)).convert()
+    assert txt == (tmpdir / "sample_001.txt").read_binary()
+
+    analysts = (tmpdir / "sample_analysts_001.csv").read_text("utf-8").splitlines()
+    assert analysts[0] == "From,To,Date,Content"
+    assert [row.split(",")[0] for row in analysts[1:]] == ['"alice@example.com"'] * 2
+    assert (tmpdir / "sample_metadata_001.csv").read_text("utf-8") == (
+        "From,To,Date\n"
+        '"carol@example.com","bob@example.com",""\n'
+        '"bob@example.com","alice@example.com","2024-01-01"\n'
+    )
+    assert (tmpdir / "sample_metadata_002.csv").check()
+
+
+def test_run_plan_rejects_unknown_options(sample_mbox):
+    config = ConfigParameterManager(mbox_file=sample_mbox, sinks=[{"name": "a", "cache": "x"}])
+    with pytest.raises(ValueError, match="Unknown option for sink a: cache"):
+        MboxConverter(config).convert()
+    config.sinks = [{"name": "a"}, {"name": "a"}]
+    with pytest.raises(ValueError, match="Duplicate sink name: a"):
+        MboxConverter(config).convert()
+
+
+def test_sink_filters_see_unredacted_fields(sample_mbox, tmpdir):
+    sinks = [{"name": "alice", "format": "csv", "filters": {"from": r"^alice@example\.com$"}}]
+    config = ConfigParameterManager(mbox_file=sample_mbox, sinks=sinks, redact="mask")
+    MboxConverter(config).convert()
+    rows = (tmpdir / "sample_alice_001.csv").read_text("utf-8").splitlines()
+    assert [row.split(",")[0] for row in rows[1:]] == ['"[EMAIL]"'] * 2
+    assert "example.com" not in "".join(rows)
+
+
+def test_boilerplate_spill_of_sinks_is_redacted(tmpdir, mocker):
+    footer = "Sent by tester@example.com, reply to unsubscribe@example.com"
+    messages = [
+        (
+            f"tester{i}@example.com",
+            "list@example.com",
+            f"Mon, 0{i} Jan 2024 12:00:00 +0000",
+            f"Message {i}",
+            f"Text number {i}\n\n{footer}",
+        )
+        for i in range(1, 5)
+    ]
+    mbox_file = write_mbox(tmpdir / "list.mbox", messages)
+    # Keep the temporary file of the boilerplate stage on disk
+    spill = mocker.patch(
+        "mbox_converter.boilerplate.tempfile.TemporaryFile",
+        side_effect=lambda *args, **kwargs: open("spill.jsonl", "w+", encoding="utf-8"),
+    )
+    sinks = [{"name": "all"}, {"name": "late", "filters": {"from": r"^tester[34]@"}}]
+    config = ConfigParameterManager(
+        mbox_file=mbox_file, sinks=sinks, redact="mask", boilerplate=2, index=False
+    )
+    MboxConverter(config).convert()
+    assert spill.call_count == 1
+    assert "[EMAIL]" in (tmpdir / "spill.jsonl").read_text("utf-8")
+    for path in tmpdir.listdir():
+        if path.basename != "list.mbox":
+            assert "example.com" not in path.read_text("utf-8"), path.basename
+    late = (tmpdir / "list_late_001.txt").read_text("utf-8")
+    assert "Text number 3" in late and "Text number 1" not in late
+    assert "unsubscribe" not in late
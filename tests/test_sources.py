@@ -0,0 +1,149 @@
+import mailbox
+import os
+import random
+from pathlib import Path
+
+import pytest
+
+from mbox_converter.sources import (
+    EmlDirectorySource,
+    MaildirSource,
+    MboxSource,
+    parse_message,
+    parse_timestamp,
+    sample_refs,
+    source_for,
+)
+from tests.conftest import write_mbox
+
+EXAMPLE_MBOX = Path(__file__).parent.parent / "example.mbox"
+
+
+def test_parse_timestamp():
+    assert parse_timestamp("Mon, 01 Jan 2024 12:00:00 +0000") == 1704110400
+    assert parse_timestamp("not a date") == 0
+    assert parse_timestamp(None) == 0
+
+
+def test_scan_matches_mailbox_boundaries(sample_mbox):
+    box = mailbox.mbox(sample_mbox)
+    expected = [box._toc[key] for key in box.iterkeys()]
+    with MboxSource(sample_mbox) as source:
+        refs = source.scan()
+    assert [(ref.start, ref.stop) for ref in refs] == expected
+    assert [ref.timestamp for ref in refs] == [1704369600, 1704110400, 0, 1709278200]
+
+
+def test_read_matches_mailbox_messages():
+    box = mailbox.mbox(str(EXAMPLE_MBOX))
+    with MboxSource(str(EXAMPLE_MBOX)) as source:
+        messages = [parse_message(source.read(ref)) for ref in source.scan()]
+    assert [msg.as_bytes() for msg in messages] == [msg.as_bytes() for msg in box]
+    assert [msg.get_from() for msg in messages] == [msg.get_from() for msg in box]
+
+
+def test_scan_empty_file(tmpdir):
+    path = tmpdir / "empty.mbox"
+    path.write("")
+    with MboxSource(str(path)) as source:
+        assert source.scan() == []
+
+
+def copy_to_maildir(mbox_path, maildir_path):
+    maildir = mailbox.Maildir(str(maildir_path))
+    for message in mailbox.mbox(mbox_path):
+        maildir.add(mailbox.MaildirMessage(message))
+    return maildir
+
+
+def test_source_for(tmpdir, sample_mbox):
+    copy_to_maildir(sample_mbox, tmpdir / "Maildir")
+    (tmpdir / "eml").mkdir()
+    assert source_for(sample_mbox) is MboxSource
+    assert source_for(str(tmpdir / "Maildir")) is MaildirSource
+    assert source_for(str(tmpdir / "eml")) is EmlDirectorySource
+
+
+def test_maildir_source_reads_cur_new_and_subfolders(tmpdir, sample_mbox):
+    maildir = copy_to_maildir(sample_mbox, tmpdir / "Maildir")
+    sent = maildir.add_folder("Sent")
+    sent.add(b"From: a@a.com\nDate: Tue, 02 Jan 2024 12:00:00 +0000\nSubject: Sent\n\nBody\n")
+    for key in list(maildir.iterkeys())[:2]:
+        message = maildir[key]
+        message.set_subdir("cur")
+        maildir[key] = message
+    (tmpdir / "Maildir" / "tmp" / "partial").write("From: x@x.com\n\nincomplete")
+
+    with MaildirSource(str(tmpdir / "Maildir"), read_threads=2) as source:
+        refs = source.scan()
+        messages = [source.parse(raw) for _, raw in source.iter_raw(refs)]
+        assert source.read_many(refs) == [raw for _, raw in source.iter_raw(refs)]
+    assert sorted(ref.timestamp for ref in refs) == [
+        0,
+        1704110400,
+        1704196800,
+        1704369600,
+        1709278200,
+    ]
+    assert all(ref.stop == os.path.getsize(ref.path) for ref in refs)
+    assert sorted(msg["subject"] for msg in messages) == [
+        "First",
+        "No date",
+        "Re: First",
+        "Second",
+        "Sent",
+    ]
+
+
+def test_eml_directory_source_reads_subdirectories(tmpdir):
+    tmpdir.mkdir("eml").mkdir("2024")
+    tmpdir.join("eml", "a.eml").write_binary(b"Date: Mon, 01 Jan 2024 12:00:00 +0000\n\nA\n")
+    tmpdir.join("eml", "2024", "b.EML").write_binary(b"Subject: B\r\n\r\nB\r\n")
+    tmpdir.join("eml", "notes.txt").write("not a message")
+
+    with EmlDirectorySource(str(tmpdir / "eml")) as source:
+        refs = source.scan()
+        assert [ref.timestamp for ref in refs] == [0, 1704110400]
+        assert source.parse(source.read(refs[0]))["subject"] == "B"
+
+
+def test_scan_file_with_long_header(tmpdir):
+    path = tmpdir / "long.eml"
+    received = b"".join(b"Received: from host%d\n" % i for i in range(2000))
+    path.write_binary(received + b"Date: Mon, 01 Jan 2024 12:00:00 +0000\n\nBody\n")
+    with EmlDirectorySource(str(tmpdir)) as source:
+        assert [ref.timestamp for ref in source.scan()] == [1704110400]
+
+
+@pytest.mark.parametrize("use_index", [False, True])
+def test_head_tail_and_sample_match_scan(tmpdir, use_index):
+    messages = [
+        ("a@a.com", "b@b.com", f"Mon, {day:02d} Jan 2024 12:00:00 +0000", f"M{day}", "Text")
+        for day in range(1, 21)
+    ]
+    mbox_file = write_mbox(tmpdir / "many.mbox", messages)
+    if use_index:
+        with MboxSource(mbox_file, use_index=True) as source:
+            source.scan_sorted()
+    with MboxSource(mbox_file, use_index=use_index) as source:
+        refs = source.scan()
+        assert source.head(3) == refs[:3]
+        assert source.tail(3) == refs[-3:]
+        assert source.tail(50) == refs
+        assert source.head(0) == source.tail(0) == []
+        sample = source.sample(5, random.Random(7))
+        assert sample == source.sample(5, random.Random(7))
+        assert len(set(sample)) == 5 and set(sample) <= set(refs)
+        assert sample == sorted(sample, key=lambda ref: ref.start)
+        assert sample_refs(source, "last", 2, since=1704110400, until=1704240000) == refs[:2]
+        with pytest.raises(ValueError, match="Unknown sample mode: middle"):
+            sample_refs(source, "middle", 2)
+
+
+def test_file_source_head_tail_and_sample(tmpdir, sample_mbox):
+    copy_to_maildir(sample_mbox, tmpdir / "Maildir")
+    with MaildirSource(str(tmpdir / "Maildir")) as source:
+        refs = source.scan()
+        assert source.head(2) == refs[:2]
+        assert source.tail(1) == refs[-1:]
+        assert set(sample_refs(source, "random", 3, seed=1)) <= set(refs)
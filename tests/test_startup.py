@@ -0,0 +1,68 @@
+"""Startup cost of the command line entry point.
+
+Spawning many short conversions must not pay for dependencies that are only
+needed once messages are actually parsed.
+"""
+
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+# Modules that must only be imported on the code paths that use them
+LAZY_MODULES = [
+    "bs4",
+    "dotenv",
+    "email_reply_parser",
+    "yaml",
+    "asyncio",
+    "concurrent.futures",
+    "importlib.metadata",
+]
+
+# Time importing mbox_converter.cli may add to the start of a fresh interpreter, as a multiple
+# of the interpreter's own start measured in the same run, so it holds on slow machines too.
+# Measured at 3-5 times locally; eager imports of the dependencies above took 10-15 times.
+IMPORT_TIME_FACTOR = 8
+
+PROBE = """
+import json, sys
+import mbox_converter.cli
+sys.argv = ["cli", "--format", "csv", "--max_days", "7", "example.mbox"]
+mbox_converter.cli.parse_arguments()
+print(json.dumps({"modules": sorted(sys.modules)}))
+"""
+
+
+def probe():
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout)
+
+
+def test_cli_does_not_import_heavy_dependencies():
+    modules = probe()["modules"]
+    assert [module for module in LAZY_MODULES if module in modules] == []
+
+
+def wall_time(code):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, check=True)
+    return time.perf_counter() - start
+
+
+def test_cli_import_time_budget():
+    # Alternate the runs, so a busy moment of the machine affects both the same
+    baseline, with_cli = [], []
+    for _ in range(7):
+        baseline.append(wall_time("pass"))
+        with_cli.append(wall_time("import mbox_converter.cli"))
+    startup, elapsed = min(baseline), min(with_cli) - min(baseline)
+    assert elapsed < IMPORT_TIME_FACTOR * startup, (
+        f"importing the CLI took {elapsed * 1000:.0f} ms, "
+        f"starting the interpreter {startup * 1000:.0f} ms"
+    )
@@ -0,0 +1,128 @@
+import contextlib
+import datetime
+import glob
+import os
+from unittest.mock import patch
+
+import pytest
+
+from mbox_converter import cli
+from mbox_converter.base import MboxConverter
+from mbox_converter.config import ConfigParameterManager
+from tests.conftest import write_mbox
+
+np = pytest.importorskip("numpy")
+from mbox_converter.stats import ArchiveStats, collect_stats  # noqa: E402
+
+DATES = [
+    "Mon, 01 Jan 2024 12:00:00 +0000",
+    "Mon, 01 Jan 2024 13:00:00 +0000",
+    "Tue, 02 Jan 2024 12:00:00 +0000",
+    "Wed, 31 Jan 2024 12:00:00 +0000",
+    "not a date",
+    "Thu, 01 Feb 2024 12:00:00 +0000",
+    "Fri, 02 Feb 2024 12:00:00 +0000",
+    "Sat, 03 Feb 2024 12:00:00 +0000",
+    "Mon, 01 Apr 2024 12:00:00 +0000",
+]
+
+
+@contextlib.contextmanager
+def stats_of(path, **options):
+    converter = MboxConverter(ConfigParameterManager(mbox_file=path, **options))
+    with converter.open_source() as source:
+        yield collect_stats(source, converter.since, converter.until)
+
+
+def test_aggregates(sample_mbox):
+    with stats_of(sample_mbox) as stats:
+        top = stats.top_senders(2)
+    assert top == [("alice@example.com", 2), ("carol@example.com", 1)]
+    assert len(stats) == 4
+    assert stats.undated == 1
+    # Without the empty line separating each message from the next one
+    assert stats.total_bytes == os.path.getsize(sample_mbox) - 4
+    assert stats.per_day() == [
+        (datetime.date(2024, 1, 1), 1),
+        (datetime.date(2024, 1, 4), 1),
+        (datetime.date(2024, 3, 1), 1),
+    ]
+    assert stats.per_month() == [("2024-01", 2), ("2024-03", 1)]
+    assert len(set(stats.sender_ids)) == 3
+    assert sum(count for _, _, count in stats.size_histogram()) == 4
+    for lower, upper, _ in stats.size_histogram():
+        assert upper == 2 * lower
+
+
+def test_date_range_and_file_sources(sample_mbox, tmpdir):
+    with stats_of(sample_mbox, since="2024-01-02") as stats:
+        assert [count for _, count in stats.per_day()] == [1, 1]
+
+    eml_dir = tmpdir.mkdir("eml")
+    with open(sample_mbox, "rb") as f:
+        messages = f.read().split(b"\nFrom ")
+    for i, message in enumerate(messages):
+        message = message.split(b"\n", 1)[1]
+        (eml_dir / f"{i}.eml").write_binary(message)
+    with stats_of(str(eml_dir)) as stats:
+        assert stats.per_month() == [("2024-01", 2), ("2024-03", 1)]
+        assert stats.top_senders(1) == [("alice@example.com", 2)]
+
+
+def test_file_sources_only_read_headers(tmpdir):
+    body = b"x" * 100_000 + b"\n"
+    for i, sender in enumerate(["a@example.com", "b@example.com", "a@example.com"]):
+        headers = f"From: {sender}\nDate: {DATES[i]}\nSubject: {i}\n\n".encode()
+        (tmpdir / f"{i}.eml").write_binary(headers + body)
+    converter = MboxConverter(ConfigParameterManager(mbox_file=str(tmpdir)))
+    with converter.open_source() as source:
+        with patch.object(type(source), "read", side_effect=AssertionError("read in full")):
+            stats = collect_stats(source)
+        assert stats.total_bytes > 3 * len(body)
+        assert stats.top_senders(1) == [("a@example.com", 2)]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"max_days": 0},
+        {"max_days": 30},
+        {"max_messages": 2},
+        {"period": "month"},
+        {"period": "week", "max_messages": 2},
+        {"max_days": 1, "period": "year"},
+        {},
+    ],
+)
+def test_rollover_simulation_matches_conversion(tmpdir, options):
+    messages = [("a@a.com", "b@b.com", date, f"Message {i}", "x") for i, date in enumerate(DATES)]
+    mbox_file = write_mbox(tmpdir / "roll.mbox", messages)
+    MboxConverter(ConfigParameterManager(mbox_file=mbox_file, **options)).convert()
+    expected = sorted(
+        open(path, encoding="utf-8").read().count("Subject: ") for path in glob.glob("roll_*.txt")
+    )
+    with stats_of(mbox_file) as stats:
+        assert sorted(stats.simulate_rollover(**options).tolist()) == expected
+
+
+def test_max_bytes_simulation():
+    stats = ArchiveStats([1, 2, 3, 4, 5], [40, 40, 40, 40, 40], [1] * 5)
+    assert stats.simulate_rollover(max_bytes=100).tolist() == [3, 2]
+    assert stats.simulate_rollover(max_bytes=80).tolist() == [2, 2, 1]
+
+
+def test_stats_command(sample_mbox, capsys):
+    assert (
+        cli.main(["stats", "--config", "", "--max_messages", "3", "--top", "1", sample_mbox]) == 0
+    )
+    output = capsys.readouterr().out
+    assert "Messages: 4 (1 undated)" in output
+    assert "2  alice@example.com" in output
+    assert "bob@example.com" not in output
+    assert "Rollover (max_days=-1" not in output
+    assert "(max_messages=3): 2 file(s)" in output
+    assert not glob.glob("sample_*.txt")
+
+    with patch("sys.argv", ["cli.py", "stats", "--config", "", "missing.mbox"]):
+        assert cli.main() == 1
+    assert "Error: mbox file not found" in capsys.readouterr().out
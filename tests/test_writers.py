@@ -0,0 +1,127 @@
+from importlib.metadata import EntryPoint
+
+import pytest
+
+from mbox_converter.base import EmailRecord
+from mbox_converter.parameters import PARAMETERS
+from mbox_converter import writers
+from mbox_converter.writers import (
+    CsvWriter,
+    OutputWriter,
+    TxtWriter,
+    available_formats,
+    compile_renderer,
+    get_writer,
+    register_writer,
+)
+
+ALL_FIELDS = {"from": True, "to": True, "date": True, "subject": True}
+
+RECORDS = [
+    EmailRecord("a@a.com", "b@b.com", "2024-01-01", 'Say "hi"', "Line 1\nLine 2", 0, 0, 10),
+    EmailRecord("b@b.com", "a@a.com", None, "Re", "Reply", 0, 10, 20),
+]
+
+
+class JsonlWriter(OutputWriter):
+    def render_batch(self, records):
+        return "".join('{"subject": "%s"}\n' % record.subject for record in records)
+
+
+def test_builtin_writers_registered():
+    assert get_writer("txt") is TxtWriter
+    assert get_writer("csv") is CsvWriter
+    assert available_formats()[:2] == ["txt", "csv"]
+
+
+def test_format_choices_follow_registry():
+    (format_param,) = [param for param in PARAMETERS if param.name == "format"]
+    assert format_param.choices == available_formats()
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError, match="Unknown output format: pdf"):
+        get_writer("pdf")
+
+
+def test_register_writer(monkeypatch):
+    monkeypatch.setattr(writers, "_WRITERS", dict(writers._WRITERS))
+    register_writer("jsonl")(JsonlWriter)
+    assert get_writer("jsonl") is JsonlWriter
+    assert JsonlWriter.extension == "jsonl"
+
+
+def test_entry_point_discovery(monkeypatch):
+    monkeypatch.setattr(writers, "_WRITERS", dict(writers._WRITERS))
+    entry_point = EntryPoint("jsonl", f"{__name__}:JsonlWriter", writers.ENTRY_POINT_GROUP)
+    monkeypatch.setattr(writers, "_entry_points", lambda: [entry_point])
+
+    assert "jsonl" in available_formats()
+    assert get_writer("jsonl") is JsonlWriter
+
+
+def test_csv_writer_batch(tmpdir):
+    writer = CsvWriter(ALL_FIELDS)
+    writer.open("out.csv")
+    writer.write_batch(RECORDS)
+    writer.close()
+
+    data = open("out.csv", "rb").read()
+    assert data == (
+        b"From,To,Date,Subject,Content\n"
+        b'"a@a.com","b@b.com","2024-01-01","Say ""hi""","Line 1 Line 2"\n'
+        b'"b@b.com","a@a.com","","Re","Reply"\n'
+    )
+    assert writer.bytes_written == len(data)
+    assert writer.records_written == 2
+
+
+def test_txt_writer_rollover(tmpdir):
+    writer = TxtWriter({"from": True, "to": False, "date": True, "subject": False})
+    writer.open("one.txt")
+    writer.write_batch(RECORDS[:1])
+    writer.rollover("two.txt")
+    writer.write_batch(RECORDS[1:])
+    writer.close()
+
+    assert open("one.txt").read() == "From: a@a.com\nDate: 2024-01-01\n\nLine 1\nLine 2\n-----\n\n"
+    assert open("two.txt").read() == "From: b@b.com\nDate: Unknown\n\nReply\n-----\n\n"
+    assert writer.records_written == 1
+
+
+def test_compile_renderer():
+    render = compile_renderer("{}: {}\n", [lambda r: r.subject, lambda r: r.date or "-"])
+    assert [render(record) for record in RECORDS] == ['Say "hi": 2024-01-01\n', "Re: -\n"]
+    # Braces in the values are not formatted again
+    render = compile_renderer("<{}>", [lambda r: "{r.to}"])
+    assert render(RECORDS[0]) == "<{r.to}>"
+
+
+def test_renderers_follow_include_options():
+    options = {"from": False, "to": True, "date": False, "subject": True}
+    assert TxtWriter(options).render(RECORDS[1]) == "To: a@a.com\nSubject: Re\n\nReply\n-----\n\n"
+    csv_writer = CsvWriter(options)
+    assert csv_writer.render_header() == "To,Subject,Content\n"
+    assert csv_writer.fields(RECORDS[0]) == ['"b@b.com"', '"Say ""hi"""', '"Line 1 Line 2"']
+    no_fields = dict.fromkeys(options, False)
+    assert TxtWriter(no_fields).render(RECORDS[1]) == "\nReply\n-----\n\n"
+    assert CsvWriter(no_fields).render_batch(RECORDS) == '"Line 1 Line 2"\n"Reply"\n'
+    with pytest.raises(ValueError, match="at least one field"):
+        CsvWriter(dict(no_fields, content=False))
+    metadata = dict(ALL_FIELDS, content=False)
+    assert TxtWriter(metadata).render(RECORDS[1]) == (
+        "From: b@b.com\nTo: a@a.com\nDate: Unknown\nSubject: Re\n-----\n\n"
+    )
+
+
+def test_writes_are_buffered(tmpdir, mocker):
+    spy = mocker.patch("mbox_converter.writers.open", side_effect=open)
+    writer = TxtWriter(ALL_FIELDS)
+    writer.open("out.txt")
+    for record in RECORDS * 100:
+        writer.write_batch([record])
+    assert open("out.txt", "rb").read() == b""
+    writer.close()
+
+    assert spy.call_args.kwargs["buffering"] == writers.WRITE_BUFFER_SIZE
+    assert len(open("out.txt", "rb").read()) == writer.bytes_written